@@ -0,0 +1,236 @@
+import os
+import sys
+import json
+import logging
+
+import solr
+from records import PERSON_FL, people_from_response, Page
+from result_cache import ResultCache, batch_key
+from local_index import name_key
+from metrics import bind
+
+# Batch name resolution.
+#
+# Resolves many first/last name pairs (event rosters, org charts) against the directory. Instead of one Solr query per
+# name, names are grouped BATCH_SIZE at a time into a single OR query:
+#   (firstName:"Michael" AND lastName:"Crow") OR (firstName:"Jane" AND lastName:"Smith") OR ...
+# and the returned documents are mapped back to the names they match. Groups run concurrently on BATCH_WORKERS
+# threads, and results are yielded as each group resolves, not in input order (each carries its input index).
+#
+# Names already in the local directory index or the result cache skip Solr entirely. Names a group query left
+# unresolved because its rows ran out (a very common name can use them all up) are retried on their own. With a
+# fallback (the skill's fuzzy people search), names without an exact match are tried there too.
+#
+# Served by the skill at POST /batch (see isearch.py), or run from the command line:
+#   $ python batch.py names.csv > matches.jsonl
+# where each input line is "first,last" (or "first last").
+
+BATCH_SIZE = int(os.environ.get('ISEARCH_BATCH_SIZE', 25))
+BATCH_WORKERS = int(os.environ.get('ISEARCH_BATCH_WORKERS', 4))
+BATCH_MATCHES = int(os.environ.get('ISEARCH_BATCH_MATCHES', 5))
+
+# The /batch endpoint is only enabled when a token is set. Callers send it as "Authorization: Bearer <token>".
+BATCH_TOKEN = os.environ.get('ISEARCH_BATCH_TOKEN', '')
+
+log = logging.getLogger(__name__)
+
+
+def quote(value):
+    # A Lucene phrase: escape backslashes and quotes, and quote the rest.
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def name_clause(firstName, lastName):
+    clauses = []
+    if firstName:
+        clauses.append('firstName:' + quote(firstName))
+    if lastName:
+        clauses.append('lastName:' + quote(lastName))
+    return '(' + ' AND '.join(clauses) + ')'
+
+
+def name_match_key(firstName, lastName):
+    return name_key(firstName), name_key(lastName)
+
+
+def parse_names(lines):
+    """
+    Yields (firstName, lastName) from lines of "first,last", "first<TAB>last" or "first last". Blank lines and lines
+    starting with # are skipped.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        for sep in (',', '\t'):
+            if sep in line:
+                first, _, last = line.partition(sep)
+                break
+        else:
+            first, _, last = line.rpartition(' ')
+        yield first.strip(), last.strip()
+
+
+def parse_json_names(body):
+    """
+    Returns (firstName, lastName) pairs from a JSON body {"names": [...]}, where each name is a [first, last] pair or a
+    {"firstName": ..., "lastName": ...} object. Missing or null names are empty. Raises ValueError, naming the first
+    bad entry, if the body isn't in that form.
+    """
+    if not isinstance(body, dict) or not isinstance(body.get('names', []), list):
+        raise ValueError('Expected a JSON object with a "names" list')
+    names = []
+    for i, name in enumerate(body.get('names', [])):
+        if isinstance(name, dict):
+            first, last = name.get('firstName'), name.get('lastName')
+        elif isinstance(name, list) and len(name) == 2:
+            first, last = name
+        else:
+            raise ValueError('names[{}]: expected [first, last] or {{"firstName": ..., "lastName": ...}}'.format(i))
+        if not all(part is None or isinstance(part, str) for part in (first, last)):
+            raise ValueError('names[{}]: first and last names must be strings'.format(i))
+        names.append((first or '', last or ''))
+    return names
+
+
+class BatchResolver(object):
+
+    def __init__(self, url, cache=None, local_index=None, fallback=None, batch_size=BATCH_SIZE,
+                 workers=BATCH_WORKERS, matches=BATCH_MATCHES):
+        """
+        url is the directory core's select URL. fallback, if given, is called as fallback(firstName, lastName) for
+        names without an exact match and returns a Page (or an error string).
+        """
+        self.url = url
+        self.cache = cache if cache is not None else ResultCache()
+        self.local_index = local_index
+        self.fallback = fallback
+        self.batch_size = batch_size
+        self.workers = workers
+        self.matches = matches
+
+    def resolve(self, names):
+        """
+        Yields one result dict per input name, as they resolve:
+            {'index': i, 'firstName': ..., 'lastName': ..., 'source': ..., 'matches': [Person, ...]}
+        source is one of local, cache, solr, fallback or none; error is set if the name couldn't be looked up.
+        """
+        pending = []
+        for i, (firstName, lastName) in enumerate(names):
+            if not (firstName or lastName):
+                yield self._result(i, firstName, lastName, 'none', [])
+                continue
+            if self.local_index is not None:
+                page = self.local_index.search(firstName, lastName, 0, self.matches)
+                if page is not None:
+                    yield self._result(i, firstName, lastName, 'local', page.records)
+                    continue
+            cached = self.cache.get(batch_key(firstName, lastName, self.matches))
+            if cached is not None:
+                yield self._result(i, firstName, lastName, 'cache', cached.records)
+                continue
+            pending.append((i, firstName, lastName))
+
+        groups = [pending[n:n + self.batch_size] for n in range(0, len(pending), self.batch_size)]
+        if not groups:
+            return
+        # Imported here to keep it off the cold start path.
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(bind(self._resolve_group), group) for group in groups]
+            for future in as_completed(futures):
+                for result in future.result():
+                    yield result
+
+    def _resolve_group(self, group):
+        try:
+            response = solr.get(self.url, params={
+                'q': ' OR '.join(name_clause(first, last) for _, first, last in group),
+                'fl': PERSON_FL,
+                'rows': len(group) * self.matches,
+                'wt': 'json',
+            })
+        except solr.SolrError as e:
+            log.warning("Batch query failed, retrying names one at a time: {}".format(e))
+            return [self._resolve_one(i, first, last) for i, first, last in group]
+
+        # Map each document back to the names it matches. A name without a first or last name matches on the other
+        # alone.
+        by_name = {}
+        for i, first, last in group:
+            by_name.setdefault(name_match_key(first, last), []).append(i)
+        hits = dict((i, []) for i, _, _ in group)
+        for record in people_from_response(response):
+            for key in set((name_match_key(record.firstName, record.lastName), name_match_key('', record.lastName),
+                            name_match_key(record.firstName, ''))):
+                for i in by_name.get(key, ()):
+                    if len(hits[i]) < self.matches:
+                        hits[i].append(record)
+
+        truncated = response['response'].get('numFound', 0) > len(response['response']['docs'])
+        results = []
+        for i, first, last in group:
+            if hits[i]:
+                self.cache.set(batch_key(first, last, self.matches), Page(0, hits[i], len(hits[i])))
+                results.append(self._result(i, first, last, 'solr', hits[i]))
+            elif truncated or self.fallback is not None:
+                results.append(self._resolve_one(i, first, last))
+            else:
+                results.append(self._result(i, first, last, 'none', []))
+        return results
+
+    def _resolve_one(self, i, firstName, lastName):
+        source = 'solr'
+        try:
+            response = solr.get(self.url, params={'q': name_clause(firstName, lastName), 'fl': PERSON_FL,
+                                                  'rows': self.matches, 'wt': 'json'})
+            records = people_from_response(response)
+        except solr.SolrError as e:
+            return self._result(i, firstName, lastName, 'none', [], str(e))
+        if records:
+            self.cache.set(batch_key(firstName, lastName, self.matches), Page(0, records, len(records)))
+        elif self.fallback is not None:
+            page = self.fallback(firstName, lastName)
+            if isinstance(page, Page):
+                records = page.records[:self.matches]
+                source = 'fallback'
+        return self._result(i, firstName, lastName, source if records else 'none', records)
+
+    @staticmethod
+    def _result(i, firstName, lastName, source, records, error=None):
+        result = {'index': i, 'firstName': firstName, 'lastName': lastName, 'source': source, 'matches': records}
+        if error is not None:
+            result['error'] = error
+        return result
+
+
+def to_json(result):
+    """
+    One result as a JSON line, with matches as field dicts.
+    """
+    return json.dumps(dict(result, matches=[r._asdict() for r in result['matches']])) + '\n'
+
+
+def main(argv):
+    import argparse
+    from local_index import load_local_index
+
+    parser = argparse.ArgumentParser(description='Resolve a list of names against the directory.')
+    parser.add_argument('names', nargs='?', help='file of "first,last" lines (default: stdin)')
+    parser.add_argument('--url', default=solr.SOLR_URL + 'directory/select', help='directory select URL')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS)
+    parser.add_argument('--matches', type=int, default=BATCH_MATCHES, help='max matches per name')
+    args = parser.parse_args(argv)
+
+    with (open(args.names) if args.names else sys.stdin) as f:
+        names = list(parse_names(f))
+    resolver = BatchResolver(args.url, local_index=load_local_index(), batch_size=args.batch_size,
+                             workers=args.workers, matches=args.matches)
+    for result in resolver.resolve(names):
+        sys.stdout.write(to_json(result))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,106 @@
+"""
+Batch name resolution against a fake Solr.
+
+Resolves a list of names (full names, last names alone, first names alone and names that aren't in the directory)
+through batch.BatchResolver against an in-process fake Solr (see fake_solr.py), grouped --batch-size at a time and one
+at a time, and reports wall time and Solr requests for each.
+
+Before timing, checks that every name taken from the directory comes back with matches from Solr, and that every
+match agrees with the parts of the name given, and exits non-zero if not. That includes a group of first names alone
+few enough to fit the group's rows, so they're matched from the group query rather than retried one at a time.
+
+    $ python benchmarks/bench_batch.py [--people 5000] [--names 200] [--batch-size 25] [--latency fixed:20]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from batch import BatchResolver, name_match_key  # noqa: E402
+from result_cache import ResultCache  # noqa: E402
+from benchmarks.fake_solr import FakeSolr, Faults, start_in_thread  # noqa: E402
+from benchmarks.fixtures import fake_directory, fake_departments, fake_doc  # noqa: E402
+
+MISSING = [('Zorvath', 'Quillanby'), ('', 'Vexmoraine'), ('Ulquistra', '')]
+
+# People added to the directory with first names no one else has.
+RARE_FIRST_NAMES = [('Thessaly', 'Crow'), ('Oriel', 'Smith'), ('Caspian', 'Nguyen'), ('Wrenna', 'Patel')]
+
+
+def sample_names(docs, n, seed):
+    """
+    Returns n names from docs, in turn a full name, a last name alone and a first name alone.
+    """
+    rnd = random.Random(seed)
+    names = []
+    for i, doc in enumerate(rnd.sample(docs, n)):
+        first, last = doc['firstName'], doc['lastName']
+        names.append([(first, last), ('', last), (first, '')][i % 3])
+    return names
+
+
+def check(resolver, names):
+    """
+    Returns a description of each name the resolver got wrong.
+    """
+    problems = []
+    for result in resolver.resolve(names):
+        first, last = names[result['index']]
+        if not result['matches']:
+            problems.append('{!r}: no matches (source {})'.format((first, last), result['source']))
+            continue
+        want = name_match_key(first, last)
+        for record in result['matches']:
+            got = name_match_key(record.firstName if first else '', record.lastName if last else '')
+            if got != want:
+                problems.append('{!r}: matched {} {}'.format((first, last), record.firstName, record.lastName))
+    return problems
+
+
+def run(url, names, batch_size, fake):
+    resolver = BatchResolver(url, cache=ResultCache(), batch_size=batch_size)
+    before = fake.stats['directory']
+    started = time.perf_counter()
+    results = list(resolver.resolve(names))
+    elapsed = time.perf_counter() - started
+    return elapsed, fake.stats['directory'] - before, sum(1 for r in results if r['matches'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--people', type=int, default=5000, help='fake Solr directory size')
+    parser.add_argument('--names', type=int, default=200, help='names to resolve')
+    parser.add_argument('--batch-size', type=int, default=25)
+    parser.add_argument('--latency', default='fixed:20', help='fake Solr latency (see fake_solr.py)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    docs = list(fake_directory(args.people, args.seed))
+    rnd = random.Random(args.seed)
+    docs.extend(fake_doc(len(docs) + i, rnd, first, last) for i, (first, last) in enumerate(RARE_FIRST_NAMES))
+    fake = FakeSolr(docs, fake_departments(50, args.seed), Faults(args.latency, seed=args.seed))
+    fake.warm()
+    server, base_url = start_in_thread(fake)
+    url = base_url + 'directory/select'
+    try:
+        names = sample_names(docs, min(args.names, len(docs)), args.seed)
+        problems = check(BatchResolver(url, cache=ResultCache(), batch_size=args.batch_size), names)
+        problems += check(BatchResolver(url, cache=ResultCache(), batch_size=args.batch_size),
+                          [(first, '') for first, _ in RARE_FIRST_NAMES])
+        if problems:
+            sys.exit('Batch resolution got {} names wrong:\n  {}'.format(len(problems), '\n  '.join(problems)))
+
+        names += MISSING
+        for label, batch_size in (('batched', args.batch_size), ('one at a time', 1)):
+            elapsed, requests, found = run(url, names, batch_size, fake)
+            print('{:<14} {:>8.1f}ms  {:>4} Solr requests  {}/{} names found'.format(
+                label, elapsed * 1000, requests, found, len(names)))
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Reproducible cold-start benchmark.
+
+Each run starts a fresh interpreter, imports an entry point module and sends it its first request through Flask's
+test client, so nothing is shared between runs. Reported per entry point (median and max of --runs):
+
+    process    interpreter start to exit, measured by the parent
+    import     importing the entry point module (building the app)
+    first      time to the first response (LaunchRequest by default)
+    second     the same request again, i.e. a warm request for comparison
+
+The entry point defaults to `isearch`; give --entry more than once to compare modules exposing an `app`.
+--importtime prints the slowest imports of one run (python -X importtime).
+
+    $ python benchmarks/bench_coldstart.py [--runs 10] [--entry isearch] [--intent launch]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+CHILD = r'''
+import sys, time, json
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+module = __import__({entry!r})
+t1 = time.perf_counter()
+from benchmarks import envelopes
+app = envelopes.prepare_app(module.app)
+client = app.test_client()
+body = json.dumps({envelope})
+t2 = time.perf_counter()
+first = client.post('/directory', data=body, content_type='application/json')
+t3 = time.perf_counter()
+second = client.post('/directory', data=body, content_type='application/json')
+t4 = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (t1 - t0) * 1000,
+    'first_ms': (t3 - t2) * 1000,
+    'second_ms': (t4 - t3) * 1000,
+    'status': first.status_code,
+}}))
+'''
+
+INTENTS = {
+    'launch': 'envelopes.launch_request()',
+    'help': "envelopes.intent_request('AMAZON.HelpIntent')",
+    'people': "envelopes.intent_request('iSearchIntentPeople', {'firstName': 'Michael', 'lastName': 'Crow'}, new=True)",
+}
+
+
+def run_once(entry, intent, env):
+    code = CHILD.format(root=ROOT, entry=entry, envelope=INTENTS[intent])
+    started = time.perf_counter()
+    out = subprocess.check_output([sys.executable, '-c', code], env=env, cwd=ROOT)
+    result = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+    result['process_ms'] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def import_profile(entry, env, top):
+    err = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(entry)],
+                         env=env, cwd=ROOT, stderr=subprocess.PIPE).stderr.decode('utf-8')
+    rows = []
+    for line in err.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = [p.strip() for p in line.split(':', 1)[1].split('|')]
+        rows.append((int(cumulative_us), int(self_us), name))
+    print('slowest imports for {} (cumulative us, self us):'.format(entry))
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:top]:
+        print('  {:>10} {:>10}  {}'.format(cumulative_us, self_us, name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--entry', action='append', help='entry point module (repeatable)')
+    parser.add_argument('--intent', choices=sorted(INTENTS), default='launch')
+    parser.add_argument('--importtime', type=int, default=0, metavar='N', help='show the N slowest imports')
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+
+    results = {}
+    for entry in args.entry or ['isearch']:
+        # One untimed run so .pyc files exist, as they do in a deployed package.
+        run_once(entry, args.intent, env)
+        runs = [run_once(entry, args.intent, env) for _ in range(args.runs)]
+        results[entry] = runs
+        if args.importtime:
+            import_profile(entry, env, args.importtime)
+
+    print('{} runs per entry point, first request: {}'.format(args.runs, args.intent))
+    print('{:<12} {:>20} {:>20} {:>20} {:>20}'.format('entry', 'process ms', 'import ms', 'first ms', 'second ms'))
+    for entry, runs in results.items():
+        cols = []
+        for key in ('process_ms', 'import_ms', 'first_ms', 'second_ms'):
+            values = sorted(r[key] for r in runs)
+            cols.append('{:>8.1f} (max {:>7.1f})'.format(values[len(values) // 2], values[-1]))
+        print('{:<12} {}'.format(entry, ' '.join(cols)))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'intent': args.intent, 'runs': args.runs, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
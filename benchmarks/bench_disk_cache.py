@@ -0,0 +1,123 @@
+"""
+Read latency of the shared disk cache tier under multi-process contention.
+
+Fills a DiskCache (disk_cache.py) with result pages built from synthetic directory records, then runs 1, 2, 4, ...
+worker processes against it at once. Each worker looks up keys (skewed towards popular ones, the way real queries are)
+and, for --write-ratio of operations, writes one, as workers loading from Solr would. Reports throughput and p50/p95/p99
+read latency per process count, with the in-process result cache read as a baseline.
+
+    $ python benchmarks/bench_disk_cache.py [--entries 5000] [--processes 1,2,4,8] [--duration 3] [--write-ratio 0.05]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from records import Page, person_from_doc  # noqa: E402
+from result_cache import ResultCache, people_key  # noqa: E402
+from disk_cache import DiskCache  # noqa: E402
+from benchmarks.fixtures import fake_directory  # noqa: E402
+
+ROWS = 5
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100.0))]
+
+
+def build_pages(entries, seed):
+    records = [person_from_doc(doc) for doc in fake_directory(entries * ROWS // 2 + ROWS, seed)]
+    return [Page(0, records[i:i + ROWS], 100) for i in range(0, entries * ROWS // 2, ROWS // 2)][:entries]
+
+
+def pick(rnd, entries):
+    # Roughly Zipfian: a few popular queries, a long tail.
+    return min(entries - 1, int(rnd.paretovariate(1.2)) - 1)
+
+
+def worker(path, entries, duration, write_ratio, seed, out):
+    cache = DiskCache(path, 300, 3600)
+    rnd = random.Random(seed)
+    pages = {}
+    samples = []
+    ops = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        i = pick(rnd, entries)
+        key = people_key('first{}'.format(i), 'last', 0, ROWS)
+        if rnd.random() < write_ratio:
+            page = pages.get(i) or cache.lookup(key)[0]
+            if page is not None:
+                pages[i] = page
+                cache.set(key, page)
+        else:
+            started = time.perf_counter()
+            cache.lookup(key)
+            samples.append((time.perf_counter() - started) * 1e6)
+        ops += 1
+    out.put((ops, samples, cache.errors))
+
+
+def run(path, processes, entries, duration, write_ratio):
+    out = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=worker, args=(path, entries, duration, write_ratio, n, out))
+               for n in range(processes)]
+    for w in workers:
+        w.start()
+    results = [out.get() for _ in workers]
+    for w in workers:
+        w.join()
+    ops = sum(r[0] for r in results)
+    samples = [s for r in results for s in r[1]]
+    errors = sum(r[2] for r in results)
+    return ops / duration, samples, errors
+
+
+def report(label, ops_per_sec, samples, errors=0):
+    print('{:<22} {:>10.0f} ops/s  p50={:>7.1f}us p95={:>7.1f}us p99={:>7.1f}us errors={}'.format(
+        label, ops_per_sec, percentile(samples, 50), percentile(samples, 95), percentile(samples, 99), errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=5000)
+    parser.add_argument('--processes', default='1,2,4,8')
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--write-ratio', type=float, default=0.05)
+    parser.add_argument('--path', help='database file (default: a temporary file)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    path = args.path or os.path.join(tempfile.mkdtemp(), 'bench_disk_cache.sqlite')
+    pages = build_pages(args.entries, args.seed)
+    cache = DiskCache(path, 300, 3600, maxsize=args.entries * 2)
+    started = time.perf_counter()
+    for i, page in enumerate(pages):
+        cache.set(people_key('first{}'.format(i), 'last', 0, ROWS), page)
+    print('filled {} entries in {:.2f}s at {}'.format(len(cache), time.perf_counter() - started, path))
+
+    memory = ResultCache(maxsize=args.entries)
+    for i, page in enumerate(pages):
+        memory.set(people_key('first{}'.format(i), 'last', 0, ROWS), page)
+    rnd = random.Random(args.seed)
+    samples = []
+    for _ in range(20000):
+        key = people_key('first{}'.format(pick(rnd, args.entries)), 'last', 0, ROWS)
+        t = time.perf_counter()
+        memory.get(key)
+        samples.append((time.perf_counter() - t) * 1e6)
+    report('in-process', len(samples) / (sum(samples) / 1e6), samples)
+
+    for processes in [int(n) for n in args.processes.split(',')]:
+        report('disk, {} process{}'.format(processes, '' if processes == 1 else 'es'),
+               *run(path, processes, args.entries, args.duration, args.write_ratio))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+"""
+End-to-end benchmark: replays Alexa request envelopes through the skill.
+
+Each simulated user runs a session script picked from --mix, with sessionAttributes carried from response to request
+the way Alexa does:
+
+    launch      LaunchRequest
+    people      iSearchIntentPeople, then Next, Next, Repeat
+    title       iSearchIntentTitle, ItemDetail by voice, BackToResults, Display.ElementSelected (touch, Show only)
+    department  iSearchIntentDepartment
+    search      iSearchIntentSearch (unified search)
+    help        AMAZON.HelpIntent, AMAZON.StopIntent
+
+A --display-ratio share of sessions come from a Display device (Echo Show), the rest from voice-only devices.
+--concurrency users run at once, either in-process through Flask's test client (default) or against a running
+server with --url. With --fake-solr, a fake Solr (see fake_solr.py) is started in-process and the skill pointed at
+it, so nothing touches the production directory.
+
+Reports per-intent count, throughput, errors and p50/p95/p99/max latency. --json saves the results; --compare checks
+them against a saved run and exits non-zero if any intent's p50/p95/p99 regressed by more than --threshold percent.
+
+    $ python benchmarks/bench_e2e.py --fake-solr [--latency lognormal:40,0.6] [--concurrency 8] [--duration 30]
+          [--mix people=5,title=2,department=1,search=1,launch=1,help=1] [--json out.json] [--compare base.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from benchmarks import envelopes  # noqa: E402
+from benchmarks.fixtures import FIRST_NAMES, LAST_NAMES, WORDS  # noqa: E402
+
+DEFAULT_MIX = 'people=5,title=2,department=1,search=1,launch=1,help=1'
+
+DEPARTMENTS = ('uto', 'University Technology Office', 'office of the president', 'registrar',
+               'school of sustainability', 'hayden library')
+
+
+def people_script(rnd, display):
+    slots = {'firstName': rnd.choice(FIRST_NAMES), 'lastName': rnd.choice(LAST_NAMES)}
+    return [
+        ('iSearchIntentPeople', lambda **kw: envelopes.intent_request('iSearchIntentPeople', slots, **kw)),
+        ('iSearchIntentPeopleNext', lambda **kw: envelopes.intent_request('iSearchIntentPeopleNext', **kw)),
+        ('iSearchIntentPeopleNext', lambda **kw: envelopes.intent_request('iSearchIntentPeopleNext', **kw)),
+        ('iSearchIntentPeopleRepeat', lambda **kw: envelopes.intent_request('iSearchIntentPeopleRepeat', **kw)),
+    ]
+
+
+def title_script(rnd, display):
+    phrase = ' '.join(rnd.sample(WORDS, 2))
+    steps = [
+        ('iSearchIntentTitle', lambda **kw: envelopes.intent_request('iSearchIntentTitle',
+                                                                      {'titleSearchPhrase': phrase}, **kw)),
+        ('iSearchIntentItemDetail', lambda **kw: envelopes.intent_request('iSearchIntentItemDetail',
+                                                                           {'itemNumber': '2'}, **kw)),
+        ('iSearchIntentBackToResults', lambda **kw: envelopes.intent_request('iSearchIntentBackToResults', **kw)),
+    ]
+    if display:
+        steps.append(('Display.ElementSelected', lambda **kw: envelopes.element_selected('result_0', **kw)))
+    return steps
+
+
+def department_script(rnd, display):
+    slots = {'deptName': rnd.choice(DEPARTMENTS)}
+    return [('iSearchIntentDepartment',
+             lambda **kw: envelopes.intent_request('iSearchIntentDepartment', slots, **kw))]
+
+
+def search_script(rnd, display):
+    slots = {'searchPhrase': rnd.choice((rnd.choice(LAST_NAMES), rnd.choice(WORDS), rnd.choice(DEPARTMENTS)))}
+    return [('iSearchIntentSearch', lambda **kw: envelopes.intent_request('iSearchIntentSearch', slots, **kw))]
+
+
+def launch_script(rnd, display):
+    return [('LaunchRequest', lambda **kw: envelopes.launch_request(**kw))]
+
+
+def help_script(rnd, display):
+    return [
+        ('AMAZON.HelpIntent', lambda **kw: envelopes.intent_request('AMAZON.HelpIntent', **kw)),
+        ('AMAZON.StopIntent', lambda **kw: envelopes.intent_request('AMAZON.StopIntent', **kw)),
+    ]
+
+
+SCRIPTS = {
+    'people': people_script,
+    'title': title_script,
+    'department': department_script,
+    'search': search_script,
+    'launch': launch_script,
+    'help': help_script,
+}
+
+
+def parse_mix(spec):
+    mix = []
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCRIPTS:
+            raise SystemExit('unknown script in --mix: {}'.format(name))
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100.0))]
+
+
+class InProcessTarget(object):
+
+    def __init__(self, app):
+        self.app = app
+
+    def client(self):
+        client = self.app.test_client()
+
+        def post(body):
+            resp = client.post('/directory', data=body, content_type='application/json')
+            return resp.status_code, resp.get_data()
+        return post
+
+
+class HttpTarget(object):
+
+    def __init__(self, url):
+        from urllib.parse import urlsplit
+        self.url = urlsplit(url)
+
+    def client(self):
+        import http.client
+        conn_class = http.client.HTTPSConnection if self.url.scheme == 'https' else http.client.HTTPConnection
+        conn = conn_class(self.url.netloc, timeout=30)
+        path = self.url.path or '/directory'
+
+        def post(body):
+            try:
+                conn.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+                resp = conn.getresponse()
+                return resp.status, resp.read()
+            except Exception:
+                # Reconnect on the next request.
+                conn.close()
+                raise
+        return post
+
+
+def run_session(post, script, display, samples):
+    session_id = envelopes.new_session_id()
+    attributes = {}
+    for i, (label, build) in enumerate(script):
+        body = json.dumps(build(session_id=session_id, attributes=attributes, new=(i == 0), display=display))
+        started = time.perf_counter()
+        try:
+            status, data = post(body)
+        except Exception:
+            status, data = None, b''
+        elapsed = time.perf_counter() - started
+        ok = status == 200
+        if ok:
+            try:
+                attributes = json.loads(data.decode('utf-8')).get('sessionAttributes') or attributes
+            except ValueError:
+                ok = False
+        samples.append((label, display, elapsed, ok))
+        if not ok:
+            break
+
+
+def worker(target, mix, display_ratio, seed, stop_at, max_sessions, counter, lock, samples):
+    rnd = random.Random(seed)
+    post = target.client()
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    while time.monotonic() < stop_at:
+        with lock:
+            if max_sessions and counter[0] >= max_sessions:
+                return
+            counter[0] += 1
+        display = rnd.random() < display_ratio
+        script = SCRIPTS[rnd.choices(names, weights)[0]](rnd, display)
+        run_session(post, script, display, samples)
+
+
+def summarize(samples, wall, by_device=False):
+    groups = defaultdict(list)
+    for label, display, elapsed, ok in samples:
+        key = '{} ({})'.format(label, 'display' if display else 'voice') if by_device else label
+        groups[key].append((elapsed, ok))
+        groups['ALL'].append((elapsed, ok))
+    out = {}
+    for key, rows in sorted(groups.items()):
+        latencies = [elapsed * 1000 for elapsed, _ in rows]
+        out[key] = {
+            'count': len(rows),
+            'errors': sum(1 for _, ok in rows if not ok),
+            'throughput': len(rows) / wall if wall else 0.0,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'max_ms': max(latencies),
+        }
+    return out
+
+
+def print_report(intents):
+    print('{:<42} {:>7} {:>6} {:>8} {:>9} {:>9} {:>9} {:>9}'.format(
+        'intent', 'count', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms'))
+    for key, s in intents.items():
+        print('{:<42} {:>7} {:>6} {:>8.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}'.format(
+            key, s['count'], s['errors'], s['throughput'], s['p50_ms'], s['p95_ms'], s['p99_ms'], s['max_ms']))
+
+
+def compare(intents, baseline, threshold):
+    """
+    Prints latency changes against a saved run. Returns the number of regressions beyond threshold percent.
+    """
+    regressions = 0
+    print('\nvs. {} ({}):'.format(baseline['meta'].get('commit', '?'), baseline['meta'].get('timestamp', '?')))
+    for key, s in intents.items():
+        base = baseline['intents'].get(key)
+        if base is None:
+            continue
+        changes = []
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            change = (s[metric] - base[metric]) / base[metric] * 100 if base[metric] else 0.0
+            flag = ''
+            if change > threshold:
+                flag = ' REGRESSION'
+                regressions += 1
+            changes.append('{} {:+.1f}%{}'.format(metric[:3], change, flag))
+        print('  {:<42} {}'.format(key, '  '.join(changes)))
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_target(args):
+    if args.url:
+        return HttpTarget(args.url), None
+
+    server = None
+    if args.fake_solr:
+        from benchmarks.fake_solr import FakeSolr, Faults, start_in_thread
+        from benchmarks.fixtures import fake_directory, fake_departments
+        fake = FakeSolr(fake_directory(args.people, args.seed), fake_departments(800, args.seed),
+                        Faults(args.latency, args.tail, args.error_rate, seed=args.seed))
+        fake.warm()
+        server, base = start_in_thread(fake)
+        # Read by isearch at import, so set before importing it. The department copy on disk would skip the fake.
+        os.environ['ISEARCH_SOLR_URL'] = base
+        os.environ.setdefault('ISEARCH_DEPT_CACHE_PATH',
+                              os.path.join(tempfile.gettempdir(), 'isearch_bench_departments.json'))
+        if os.path.exists(os.environ['ISEARCH_DEPT_CACHE_PATH']):
+            os.remove(os.environ['ISEARCH_DEPT_CACHE_PATH'])
+
+    module = __import__(args.entry)
+    return InProcessTarget(envelopes.prepare_app(module.app)), server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds to run')
+    parser.add_argument('--sessions', type=int, default=0, help='stop after this many sessions (0: no limit)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='session scripts and weights')
+    parser.add_argument('--display-ratio', type=float, default=0.5)
+    parser.add_argument('--by-device', action='store_true', help='report display and voice devices separately')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--url', help='POST to a running skill endpoint instead, e.g. http://127.0.0.1:5000/directory')
+    parser.add_argument('--entry', default='isearch', help='module with the app, for in-process runs')
+    parser.add_argument('--fake-solr', action='store_true', help='run against an in-process fake Solr')
+    parser.add_argument('--people', type=int, default=30000, help='fake Solr directory size')
+    parser.add_argument('--latency', default='lognormal:40,0.6', help='fake Solr latency (see fake_solr.py)')
+    parser.add_argument('--tail', default='', help='fake Solr slow tail, P:MS')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fake Solr error rate')
+    parser.add_argument('--warmup', type=int, default=20, help='sessions to run (and discard) first')
+    parser.add_argument('--json', help='save results to this file')
+    parser.add_argument('--compare', help='compare with results saved by an earlier run')
+    parser.add_argument('--threshold', type=float, default=10.0, help='regression threshold, percent')
+    args = parser.parse_args()
+
+    target, server = build_target(args)
+    mix = parse_mix(args.mix)
+    lock = threading.Lock()
+
+    if args.warmup:
+        worker(target, mix, args.display_ratio, args.seed - 1, time.monotonic() + args.duration, args.warmup, [0],
+               lock, [])
+
+    samples = []
+    counter = [0]
+    stop_at = time.monotonic() + args.duration
+    threads = [threading.Thread(target=worker, args=(target, mix, args.display_ratio, args.seed + i, stop_at,
+                                                     args.sessions, counter, lock, samples))
+               for i in range(args.concurrency)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.monotonic() - started
+    if server is not None:
+        server.shutdown()
+
+    if not samples:
+        raise SystemExit('no requests completed')
+    intents = summarize(samples, wall, args.by_device)
+    print('{} sessions, {} requests in {:.1f}s at concurrency {}'.format(counter[0], len(samples), wall,
+                                                                        args.concurrency))
+    print_report(intents)
+
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'args': vars(args),
+            'wall_s': wall,
+        },
+        'intents': intents,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(intents, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
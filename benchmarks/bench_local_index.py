@@ -0,0 +1,96 @@
+"""
+Lookup latency of the local directory index vs. the remote Solr path.
+
+Builds a DirectoryIndex from a synthetic directory (or a real snapshot with --snapshot), reports load time and memory,
+then times name lookups: exact hits, phonetic-only hits (when Metaphone is installed) and misses. With --remote, the
+same names are also run through isearch.query_people_results (uncached), which needs Flask-Ask installed and a
+reachable Solr.
+
+    $ python benchmarks/bench_local_index.py [--people 50000] [--lookups 2000] [--snapshot snapshot.csv] [--remote]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from local_index import DirectoryIndex, doublemetaphone  # noqa: E402
+from benchmarks.fixtures import fake_directory  # noqa: E402
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100.0))]
+
+
+def misspell(name, rnd):
+    # Swap a vowel, the kind of error phonetic matching is meant to absorb.
+    vowels = [i for i, ch in enumerate(name) if ch in 'aeiou']
+    if not vowels:
+        return name
+    i = rnd.choice(vowels)
+    return name[:i] + rnd.choice([v for v in 'aeiou' if v != name[i]]) + name[i + 1:]
+
+
+def time_lookups(fn, names):
+    samples = []
+    hits = 0
+    for first, last in names:
+        started = time.perf_counter()
+        result = fn(first, last)
+        samples.append((time.perf_counter() - started) * 1e6)
+        hits += 1 if result else 0
+    return samples, hits
+
+
+def report(label, samples, hits):
+    print('{:<26} n={:<6} hits={:<6} p50={:>10.1f}us p95={:>10.1f}us p99={:>10.1f}us'.format(
+        label, len(samples), hits, percentile(samples, 50), percentile(samples, 95), percentile(samples, 99)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--people', type=int, default=50000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--snapshot', help='CSV or JSON directory snapshot to load instead of synthetic data')
+    parser.add_argument('--remote', action='store_true', help='also time the Solr path through isearch.py')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+
+    if args.snapshot:
+        started = time.perf_counter()
+        index = DirectoryIndex.load(args.snapshot)
+    else:
+        docs = list(fake_directory(args.people, args.seed))
+        started = time.perf_counter()
+        index = DirectoryIndex.from_docs(docs)
+        del docs
+    print('loaded {} records in {:.2f}s'.format(len(index), time.perf_counter() - started))
+    print(json.dumps(index.memory_usage(), indent=2))
+
+    people = [rnd.choice(index.records) for _ in range(args.lookups)]
+    exact = [(p.firstName, p.lastName) for p in people]
+    fuzzy = [(p.firstName, misspell(p.lastName, rnd)) for p in people]
+    missing = [('Zzyzx', 'Qwxyzzy{}'.format(i)) for i in range(args.lookups)]
+
+    search = lambda first, last: index.search(first, last, 0, 5)
+    report('local exact', *time_lookups(search, exact))
+    if doublemetaphone is not None:
+        report('local misspelled', *time_lookups(search, fuzzy))
+    else:
+        print('local misspelled          skipped, Metaphone not installed')
+    report('local miss', *time_lookups(search, missing))
+
+    if args.remote:
+        import isearch
+        remote = lambda first, last: isearch.query_people_results(first, last, 0, 5).records
+        report('remote exact', *time_lookups(remote, exact[:100]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Compares the old full-document/dict result path with the field-projected Person path.
+
+Builds synthetic Solr responses shaped like asudir-solr directory documents, then measures for each path: JSON payload
+size, decode + mapping time, memory held by the mapped results, and the size of the results once serialized into
+session attributes.
+
+    $ python benchmarks/bench_records.py [--rows 20] [--repeat 2000]
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from records import PERSON_FIELDS, people_from_response  # noqa: E402
+from benchmarks.fixtures import fake_doc  # noqa: E402
+
+
+def response_body(docs):
+    return json.dumps({
+        'responseHeader': {'status': 0, 'QTime': 3},
+        'response': {'numFound': len(docs), 'start': 0, 'docs': docs}
+    })
+
+
+def legacy_map(body):
+    # The per-helper dict builder isearch.py used before records.Person.
+    records = json.loads(body)
+    results = []
+    for item in records['response']['docs']:
+        record = {
+            'firstName': item.get('firstName', ''),
+            'lastName': item.get('lastName', ''),
+            'displayName': item.get('displayName', ''),
+            'primaryTitle': item.get('primaryTitle', ''),
+            'primaryiSearchDepartmentAffiliation': item.get('primaryiSearchDepartmentAffiliation', ''),
+            'emailAddress': item.get('emailAddress', ''),
+            'phone': item.get('phone', ''),
+            'primaryMailcode': item.get('primaryMailcode', ''),
+            'photoUrl': item.get('photoUrl', '')
+        }
+        results.append(record)
+    return results
+
+
+def projected_map(body):
+    return people_from_response(json.loads(body))
+
+
+def held_bytes(fn, body):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    results = fn(body)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(s.size_diff for s in after.compare_to(before, 'filename'))
+    del results
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    full_docs = [fake_doc(i, rnd) for i in range(args.rows)]
+    projected_docs = [{f: d[f] for f in PERSON_FIELDS} for d in full_docs]
+
+    full_body = response_body(full_docs)
+    projected_body = response_body(projected_docs)
+
+    rows = []
+    for name, fn, body in (('full docs + dict', legacy_map, full_body),
+                           ('fl projection + Person', projected_map, projected_body)):
+        seconds = timeit.timeit(lambda: fn(body), number=args.repeat)
+        rows.append((
+            name,
+            len(body),
+            seconds / args.repeat * 1e6,
+            held_bytes(fn, body),
+            len(json.dumps(fn(body)))
+        ))
+
+    print('{} rows per response, {} iterations'.format(args.rows, args.repeat))
+    print('{:<24} {:>12} {:>16} {:>14} {:>14}'.format('path', 'payload B', 'decode+map us', 'held B', 'session B'))
+    for r in rows:
+        print('{:<24} {:>12} {:>16.1f} {:>14} {:>14}'.format(*r))
+
+
+if __name__ == '__main__':
+    main()
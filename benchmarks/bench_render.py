@@ -0,0 +1,118 @@
+"""
+Micro-benchmark of result rendering: the per-form helpers isearch.py used to call vs. render.render_person.
+
+For each record the legacy path calls four helpers (speech, card, rich text, photo) that each repeat the field lookups
+and escaping and build strings with +=. render_person builds all forms in one pass and memoizes per record. Timed
+cold (first render of each record) and warm (Repeat/ItemDetail re-rendering the same record). Outputs are checked
+for equality first.
+
+    $ python benchmarks/bench_render.py [--records 20] [--repeat 2000]
+"""
+import os
+import sys
+import random
+import argparse
+import timeit
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from records import person_from_doc  # noqa: E402
+from render import render_person  # noqa: E402
+from benchmarks.fixtures import fake_doc  # noqa: E402
+
+
+# Legacy helpers, as they were in isearch.py.
+
+def get_people_results_output(record):
+    out = escape(record.displayName)
+    out += ' is ' + escape(record.primaryTitle) if record.primaryTitle else ''
+    out += ' in  ' + escape(record.primaryiSearchDepartmentAffiliation) if record.primaryiSearchDepartmentAffiliation else ''
+    out += '<break/> You can reach ' + escape(record.displayName) + ' at ' if record.emailAddress or record.phone or record.primaryMailcode else ''
+    out += '<break/> the email <break/><prosody rate="slow"><say-as interpret-as="spell-out">' + escape(record.emailAddress) + '</say-as></prosody>' if record.emailAddress else ''
+    out += '<break/> the phone number <break/> <say-as interpret-as="telephone">' + escape(record.phone) + "</say-as>" if record.phone else ''
+    out += '<break/> the mail code <break/> ' + escape(record.primaryMailcode) if record.primaryMailcode else ''
+    return out
+
+
+def get_people_results_card(record):
+    out = '\n{}'.format(escape(record.displayName)) if record.displayName else ''
+    out += '\n{}'.format(escape(record.primaryTitle)) if record.primaryTitle else ''
+    out += '\n{}'.format(escape(record.primaryiSearchDepartmentAffiliation)) if record.primaryiSearchDepartmentAffiliation else ''
+    out += '\n{}'.format(escape(record.emailAddress)) if record.emailAddress else ''
+    out += '\n{}'.format(escape(record.phone)) if record.phone else ''
+    out += '\n{}'.format(escape(record.primaryMailcode)) if record.primaryMailcode else ''
+    return out
+
+
+def get_people_results_rich_output(record):
+    out = '<br/><b>{}</b>'.format(escape(record.displayName)) if record.displayName else ''
+    out += '<br/>{}'.format(escape(record.primaryTitle)) if record.primaryTitle else ''
+    out += '<br/>{}'.format(escape(record.primaryiSearchDepartmentAffiliation)) if record.primaryiSearchDepartmentAffiliation else ''
+    out += '<br/>{}'.format(escape(record.emailAddress)) if record.emailAddress else ''
+    out += '<br/>{}'.format(escape(record.phone)) if record.phone else ''
+    out += '<br/>{}'.format(escape(record.primaryMailcode)) if record.primaryMailcode else ''
+    return out
+
+
+def get_people_results_card_photo_url(record):
+    return '{}'.format(record.photoUrl)
+
+
+def legacy(records):
+    for r in records:
+        get_people_results_output(r)
+        get_people_results_card(r)
+        get_people_results_rich_output(r)
+        get_people_results_card_photo_url(r)
+
+
+def single_pass(records):
+    for r in records:
+        render_person(r)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    records = []
+    for i in range(args.records):
+        doc = fake_doc(i, rnd)
+        if i % 3 == 0:
+            doc['primaryiSearchDepartmentAffiliation'] = 'Research & Innovation <Office>'
+        if i % 4 == 0:
+            del doc['phone']
+        records.append(person_from_doc(doc))
+
+    for r in records:
+        rendered = render_person(r)
+        assert rendered.speech == get_people_results_output(r)
+        assert rendered.card == get_people_results_card(r)
+        assert rendered.rich == get_people_results_rich_output(r)
+        assert rendered.photo == get_people_results_card_photo_url(r)
+
+    per = lambda seconds: seconds / args.repeat / len(records) * 1e6
+
+    legacy_us = per(timeit.timeit(lambda: legacy(records), number=args.repeat))
+
+    def cold():
+        render_person.cache_clear()
+        single_pass(records)
+    cold_us = per(timeit.timeit(cold, number=args.repeat))
+
+    single_pass(records)
+    warm_us = per(timeit.timeit(lambda: single_pass(records), number=args.repeat))
+
+    print('{} records, {} iterations, microseconds per record'.format(len(records), args.repeat))
+    print('{:<32} {:>8.2f}'.format('legacy four helpers', legacy_us))
+    print('{:<32} {:>8.2f}'.format('render_person, cold', cold_us))
+    print('{:<32} {:>8.2f}'.format('render_person, memoized', warm_us))
+
+
+if __name__ == '__main__':
+    main()
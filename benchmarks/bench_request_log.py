@@ -0,0 +1,117 @@
+"""
+Per-turn overhead of the structured request log.
+
+Times what the request thread pays to log one turn record (request_log.py): building the record and putting it on the
+queue, with the background listener writing to a file. For comparison, the same record formatted and written
+synchronously through the root logger, the way logging.debug() calls in isearch.py would. Both are also run against a
+sink that takes --slow-ms per write, standing in for a slow disk or log shipper, which the queued log should not feel
+(records it can't keep up with are dropped and counted instead).
+
+    $ python benchmarks/bench_request_log.py [--turns 20000] [--slow-ms 2] [--interval-us 0]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from request_log import TurnLog, TurnFormatter, open_target  # noqa: E402
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100.0))]
+
+
+class SlowHandler(logging.FileHandler):
+
+    def __init__(self, path, delay):
+        logging.FileHandler.__init__(self, path, delay=True)
+        self.setFormatter(TurnFormatter())
+        self.slow = delay
+
+    def emit(self, record):
+        time.sleep(self.slow)
+        logging.FileHandler.emit(self, record)
+
+
+def make_record(n):
+    return {
+        'intent': 'iSearchIntentPeople',
+        'device': 'display' if n % 2 else 'voice',
+        'ms': 212.4,
+        'solr_ms': 187.9,
+        'session': 'amzn1.echo-api.session.{:08d}'.format(n // 5),
+        'index': n % 7,
+        'results': 12,
+        'status': 200,
+    }
+
+
+def run(log_turn, turns, interval):
+    samples = []
+    for n in range(turns):
+        started = time.perf_counter()
+        log_turn(make_record(n))
+        samples.append((time.perf_counter() - started) * 1e6)
+        if interval:
+            time.sleep(interval)
+    return samples
+
+
+def queued(handler):
+    turn_log = TurnLog(handler, name='bench.queued.{}'.format(id(handler)))
+    turn_log.start()
+    return turn_log
+
+
+def synchronous(handler):
+    logger = logging.getLogger('bench.sync.{}'.format(id(handler)))
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    return lambda fields: logger.info(json.dumps(fields, separators=(',', ':')))
+
+
+def report(label, samples, dropped=None):
+    print('{:<24} p50={:>7.1f}us p95={:>7.1f}us p99={:>8.1f}us max={:>8.1f}us{}'.format(
+        label, percentile(samples, 50), percentile(samples, 95), percentile(samples, 99), max(samples),
+        '' if dropped is None else '  dropped={}'.format(dropped)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--turns', type=int, default=20000)
+    parser.add_argument('--slow-ms', type=float, default=2.0, help='time per write of the slow sink')
+    parser.add_argument('--interval-us', type=float, default=0, help='pause between turns')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    interval = args.interval_us / 1e6
+    slow = args.slow_ms / 1000.0
+
+    report('record only', run(lambda fields: None, args.turns, interval))
+
+    turn_log = queued(open_target(os.path.join(directory, 'queued.log')))
+    report('queued, file', run(turn_log.log, args.turns, interval), turn_log.dropped)
+    turn_log.stop()
+
+    report('synchronous, file', run(synchronous(logging.FileHandler(os.path.join(directory, 'sync.log'))),
+                                    args.turns, interval))
+
+    slow_turns = min(args.turns, 2000)
+    turn_log = queued(SlowHandler(os.path.join(directory, 'queued_slow.log'), slow))
+    report('queued, slow sink', run(turn_log.log, slow_turns, interval), turn_log.dropped)
+    turn_log.stop()
+
+    report('synchronous, slow sink', run(synchronous(SlowHandler(os.path.join(directory, 'sync_slow.log'), slow)),
+                                         slow_turns, interval))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Building and decoding people and title queries.
+
+Times building a query URL the old way (the whole edismax parameter string formatted per call, user terms not
+encoded) against a prepared solr_query.SolrQuery (static parameters encoded once, terms escaped and encoded per call),
+and decoding a Solr response body with each available JSON parser (see solr.json_decoder()). The old way is a little
+faster to build, as it doesn't encode anything; the prepared query pays for escaping and encoding the user's terms.
+
+Before timing anything, checks that the plain-text fast path in solr_query.encode_terms() gives the same q as full
+escaping and encoding would, for every query syntax character and for a trailing newline, and exits non-zero if not.
+
+    $ python benchmarks/bench_solr_query.py [--rows 20] [--iterations 20000]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import solr  # noqa: E402
+from records import PERSON_FL  # noqa: E402
+from solr_query import SolrQuery, QUERY_SYNTAX, encode_terms, escape_term  # noqa: E402
+from benchmarks.fixtures import fake_directory  # noqa: E402
+
+BASE = 'https://asudir-solr.asu.edu/asudir/'
+
+TITLE_QUERY = SolrQuery('directory/select', {
+    'defType': 'edismax',
+    'q.op': 'AND',
+    'qf': 'primaryTitle^200.0 titles primaryDepartment^100.0 departments bio',
+    'pf': 'primaryTitle^20.0',
+    'bq': 'primaryDepartment:"office of the president"^100.0',
+    'df': 'primaryTitle',
+    'fl': PERSON_FL,
+    'wt': 'json',
+})
+
+
+def formatted_url(phrase, start, rows):
+    return BASE + 'directory/select' + '?defType=edismax&q={}&q.op=AND&qf=primaryTitle%5E200.0%20titles%20primaryDepartment%5E100.0%20departments%20bio&pf=primaryTitle%5E20.0&bq=primaryDepartment:"office%20of%20the%20president"^100.0&df=primaryTitle&fl={}&start={}&rows={}&wt=json'.format(phrase, PERSON_FL, start, rows)
+
+
+def prepared_url(phrase, start, rows):
+    return TITLE_QUERY.url(BASE, phrase, start=start, rows=rows)
+
+
+def check_terms():
+    """
+    Returns the terms whose encoded q differs from escaping and encoding them in full.
+    """
+    terms = ['michael crow', 'chief information officer', 'st. john', 'smith\n', 'smith\r\n', '']
+    for ch in QUERY_SYNTAX:
+        terms.extend([ch, 'smith' + ch, ch + 'smith', 'smith ' + ch + ' jones'])
+    return [term for term in terms if encode_terms(term) != quote(escape_term(term), safe='')]
+
+
+def time_per_call(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    mismatched = check_terms()
+    if mismatched:
+        sys.exit('encode_terms() skips escaping for: {}'.format(', '.join(repr(term) for term in mismatched)))
+
+    phrase = 'chief information officer'
+    print('url, formatted    {:>8.2f}us'.format(time_per_call(lambda: formatted_url(phrase, 0, args.rows),
+                                                              args.iterations)))
+    print('url, prepared     {:>8.2f}us'.format(time_per_call(lambda: prepared_url(phrase, 0, args.rows),
+                                                              args.iterations)))
+    # Terms with query syntax or URL-reserved characters take the slower escape and encode path.
+    print('url, prepared, &+ {:>8.2f}us'.format(time_per_call(lambda: prepared_url('R&D + C++', 0, args.rows),
+                                                              args.iterations)))
+
+    fields = PERSON_FL.split(',')
+    docs = [dict((f, doc[f]) for f in fields if f in doc) for doc in fake_directory(args.rows, 1)]
+    body = json.dumps({
+        'responseHeader': {'status': 0, 'QTime': 3, 'params': {'q': phrase, 'wt': 'json'}},
+        'response': {'numFound': 1200, 'start': 0, 'docs': docs},
+    }).encode('utf-8')
+    iterations = max(1, args.iterations // 10)
+    for name in ('json', 'orjson', 'ujson'):
+        decode = solr.json_decoder(name)
+        if name != 'json' and decode is json.loads:
+            print('decode, {:<10} not installed'.format(name))
+            continue
+        print('decode, {:<10} {:>8.2f}us ({} bytes)'.format(name, time_per_call(lambda: decode(body), iterations),
+                                                           len(body)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Build time and lookup latency of the name spelling corrector.
+
+Builds a NameSpeller from the LAST_NAME slot values plus a synthetic directory (or a real snapshot with --snapshot),
+then times last name corrections: known names, names with one and two typos (substitutions, deletions, insertions and
+transpositions), truncated names completed from the trie, and names with no close match. Accuracy is the share of
+typo'd names corrected back to the original.
+
+    $ python benchmarks/bench_speller.py [--people 50000] [--lookups 2000] [--snapshot snapshot.csv]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from local_index import DirectoryIndex, name_key  # noqa: E402
+from speller import build_speller  # noqa: E402
+from benchmarks.fixtures import fake_directory  # noqa: E402
+
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100.0))]
+
+
+def typo(name, rnd):
+    # One random edit of the kind speech recognition and spelling make.
+    i = rnd.randrange(len(name))
+    kind = rnd.choice(('substitute', 'delete', 'insert', 'transpose'))
+    if kind == 'substitute':
+        return name[:i] + rnd.choice(LETTERS) + name[i + 1:]
+    if kind == 'delete' and len(name) > 2:
+        return name[:i] + name[i + 1:]
+    if kind == 'transpose' and i < len(name) - 1:
+        return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+    return name[:i] + rnd.choice(LETTERS) + name[i:]
+
+
+def time_corrections(fn, cases):
+    samples = []
+    correct = 0
+    for word, expected in cases:
+        started = time.perf_counter()
+        result = fn(word)
+        samples.append((time.perf_counter() - started) * 1e6)
+        if expected is None:
+            correct += 1 if result is None else 0
+        else:
+            correct += 1 if result is not None and name_key(result) == name_key(expected) else 0
+    return samples, correct
+
+
+def report(label, samples, correct):
+    print('{:<16} n={:<6} correct={:>6.1%} p50={:>8.1f}us p95={:>8.1f}us p99={:>8.1f}us'.format(
+        label, len(samples), correct / float(len(samples)), percentile(samples, 50), percentile(samples, 95),
+        percentile(samples, 99)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--people', type=int, default=50000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--snapshot', help='CSV or JSON directory snapshot to load instead of synthetic data')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+
+    if args.snapshot:
+        index = DirectoryIndex.load(args.snapshot)
+    else:
+        index = DirectoryIndex.from_docs(fake_directory(args.people, args.seed))
+    started = time.perf_counter()
+    speller = build_speller(local_index=index)
+    print('built from {} records in {:.2f}s: {} first names, {} last names'.format(
+        len(index.records), time.perf_counter() - started, len(speller.first), len(speller.last)))
+
+    names = [rnd.choice(index.records).lastName for _ in range(args.lookups)]
+    names = [n for n in names if len(name_key(n)) > 4] or names
+    one = [(typo(n, rnd), n) for n in names]
+    two = [(typo(typo(n, rnd), rnd), n) for n in names]
+    prefixes = [(n[:max(4, len(n) - 3)], n) for n in names]
+    missing = [('Qwxyzzy{}'.format(i), None) for i in range(args.lookups)]
+
+    correct = speller.last.correct
+    report('known', *time_corrections(correct, [(n, n) for n in names]))
+    report('one typo', *time_corrections(correct, one))
+    report('two typos', *time_corrections(correct, two))
+    report('prefix', *time_corrections(correct, prefixes))
+    report('no match', *time_corrections(correct, missing))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Alexa request envelopes for driving the skill in benchmarks.
+
+Builds the JSON bodies Alexa POSTs to /directory. Envelopes are unsigned, so the app must run with
+ASK_VERIFY_REQUESTS = False (see prepare_app()).
+"""
+import uuid
+import datetime
+
+APPLICATION_ID = 'amzn1.ask.skill.benchmark'
+USER_ID = 'amzn1.ask.account.benchmark'
+
+
+def new_session_id():
+    return 'amzn1.echo-api.session.{}'.format(uuid.uuid4())
+
+
+def _timestamp():
+    return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def envelope(request, session_id=None, attributes=None, new=False, display=False):
+    interfaces = {'AudioPlayer': {}}
+    if display:
+        interfaces['Display'] = {'templateVersion': '1.0', 'markupVersion': '1.0'}
+    return {
+        'version': '1.0',
+        'session': {
+            'new': new,
+            'sessionId': session_id or new_session_id(),
+            'application': {'applicationId': APPLICATION_ID},
+            'attributes': attributes or {},
+            'user': {'userId': USER_ID},
+        },
+        'context': {
+            'System': {
+                'application': {'applicationId': APPLICATION_ID},
+                'user': {'userId': USER_ID},
+                'device': {'deviceId': 'amzn1.ask.device.benchmark', 'supportedInterfaces': interfaces},
+                'apiEndpoint': 'https://api.amazonalexa.com',
+            }
+        },
+        'request': dict(request, requestId='amzn1.echo-api.request.{}'.format(uuid.uuid4()),
+                        timestamp=_timestamp(), locale='en-US'),
+    }
+
+
+def launch_request(**kwargs):
+    kwargs.setdefault('new', True)
+    return envelope({'type': 'LaunchRequest'}, **kwargs)
+
+
+def intent_request(name, slots=None, dialog_state=None, **kwargs):
+    request = {
+        'type': 'IntentRequest',
+        'intent': {
+            'name': name,
+            'confirmationStatus': 'NONE',
+            'slots': dict((k, {'name': k, 'value': v, 'confirmationStatus': 'NONE'})
+                          for k, v in (slots or {}).items()),
+        },
+    }
+    if dialog_state:
+        request['dialogState'] = dialog_state
+    return envelope(request, **kwargs)
+
+
+def element_selected(token, **kwargs):
+    return envelope({'type': 'Display.ElementSelected', 'token': token}, **kwargs)
+
+
+def session_ended_request(**kwargs):
+    return envelope({'type': 'SessionEndedRequest', 'reason': 'USER_INITIATED'}, **kwargs)
+
+
+def prepare_app(app):
+    """
+    Lets the app accept unsigned envelopes.
+    """
+    app.config['ASK_VERIFY_REQUESTS'] = False
+    return app
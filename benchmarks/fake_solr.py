@@ -0,0 +1,473 @@
+"""
+Local stand-in for asudir-solr, for load testing without touching the production directory.
+
+Serves <base>/directory/select and <base>/asu_departments/select over HTTP from synthetic fixtures (see fixtures.py),
+or from a JSON export of real documents. Understands the query parameters isearch.py sends: defType=edismax with
+q, q.op, qf, pf, bq and df, plus field:value terms and *:*, fl, start, rows and wt=json. Lucene boolean queries
+(AND, OR, parentheses, field:"phrase") as sent by batch.py are supported too. Scoring is a rough
+approximation of edismax (boosted field matches weighted by idf, phrase and boost query bonuses), good enough to
+give realistic result sets and payload sizes, not Solr's exact ranking.
+
+Latency and failures are injectable:
+  --latency SPEC       none, fixed:MS, uniform:LO,HI, normal:MEAN,SD or lognormal:MEDIAN,SIGMA (milliseconds)
+  --tail P:MS          additionally, with probability P, add MS milliseconds (a slow tail)
+  --error-rate R       answer a fraction R of requests with --error-status (default 503)
+  --hang-rate R        hold a fraction R of requests for --hang-seconds, then drop the connection unanswered
+
+Settings can be changed while it runs: GET /_fake/config?latency=fixed:200&error_rate=0.5 (returns the current
+settings), and request counts are at GET /_fake/stats.
+
+Point the skill at it with ISEARCH_SOLR_URL:
+
+    $ python benchmarks/fake_solr.py [--port 8983] [--people 30000] [--departments 800] [--latency lognormal:40,0.6]
+    $ ISEARCH_SOLR_URL=http://127.0.0.1:8983/asudir/ python isearch.py
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from socketserver import ThreadingMixIn
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.fixtures import fake_directory, fake_departments  # noqa: E402
+
+TOKEN = re.compile(r'[a-z0-9]+')
+FIELD_BOOST = re.compile(r'([\w.]+)(?:\^([\d.]+))?')
+BOOST_QUERY = re.compile(r'(\w+):(?:"([^"]*)"|(\S+?))(?:\^([\d.]+))?(?=\s|$)')
+LUCENE_TOKEN = re.compile(r'\(|\)|(?:[\w.]+:)?"(?:[^"\\]|\\.)*"|[^\s()]+')
+BOOLEAN_QUERY = re.compile(r'(?<!\\)[()]|\s(?:AND|OR)\s')
+# field:value, as opposed to a term with an escaped colon (see solr_query.py).
+FIELD_TERM = re.compile(r'(\w+):(.*)$')
+
+
+def tokens(text):
+    # Lowercase words, with a crude plural stemmer standing in for Solr's.
+    out = []
+    for word in TOKEN.findall(text.lower()):
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        out.append(word)
+    return out
+
+
+def field_text(value):
+    if isinstance(value, (list, tuple)):
+        return ' '.join(str(v) for v in value)
+    return str(value)
+
+
+def field_boosts(spec):
+    """
+    Parses 'displayName^20.0 firstName lastName' into [('displayName', 20.0), ('firstName', 1.0), ...].
+    """
+    return [(m.group(1), float(m.group(2) or 1.0)) for m in FIELD_BOOST.finditer(spec or '')]
+
+
+class Core(object):
+    """
+    One Solr core: documents plus per-field inverted indexes, built the first time a field is searched.
+    """
+
+    def __init__(self, name, docs):
+        self.name = name
+        self.docs = list(docs)
+        self._postings = {}  # field -> token -> set of doc positions
+        self._texts = {}  # field -> list of ' '-joined token strings, for phrase matching
+        self._lock = threading.Lock()
+
+    def postings(self, field):
+        index = self._postings.get(field)
+        if index is None:
+            with self._lock:
+                index = self._postings.get(field)
+                if index is None:
+                    index = {}
+                    texts = []
+                    for i, doc in enumerate(self.docs):
+                        words = tokens(field_text(doc.get(field, '')))
+                        texts.append(' ' + ' '.join(words) + ' ')
+                        for word in set(words):
+                            index.setdefault(word, set()).add(i)
+                    self._texts[field] = texts
+                    self._postings[field] = index
+        return index
+
+    def text(self, field, i):
+        self.postings(field)
+        return self._texts[field][i]
+
+    def text_fields(self):
+        return sorted(set(k for doc in self.docs[:100] for k, v in doc.items()
+                          if isinstance(v, (str, list)) and not k.startswith('_')))
+
+    def warm(self, fields):
+        for field in fields:
+            self.postings(field)
+
+    def select(self, params):
+        """
+        Runs a query and returns the Solr JSON response body.
+        """
+        started = time.monotonic()
+        q = params.get('q', '*:*').strip()
+        start = int(params.get('start', 0))
+        rows = int(params.get('rows', 10))
+
+        if q in ('*:*', ''):
+            ranked = list(range(len(self.docs)))
+            scores = {}
+        else:
+            scores = self.score(q, params)
+            ranked = sorted(scores, key=lambda i: (-scores[i], i))
+
+        fl = [f for f in params.get('fl', '*').replace(' ', ',').split(',') if f]
+        docs = []
+        for i in ranked[start:start + rows]:
+            doc = self.docs[i]
+            if '*' not in fl:
+                doc = dict((f, doc[f]) for f in fl if f in doc)
+            if 'score' in fl:
+                doc = dict(doc, score=scores.get(i, 1.0))
+            docs.append(doc)
+
+        return {
+            'responseHeader': {
+                'status': 0,
+                'QTime': int((time.monotonic() - started) * 1000),
+                'params': params
+            },
+            'response': {'numFound': len(ranked), 'start': start, 'docs': docs}
+        }
+
+    def score(self, q, params):
+        if BOOLEAN_QUERY.search(q):
+            return self.score_boolean(q, params)
+        if params.get('qf'):
+            qf = field_boosts(params['qf'])
+        elif params.get('df'):
+            qf = [(params['df'], 1.0)]
+        else:
+            qf = [(f, 1.0) for f in self.text_fields()]
+        require_all = params.get('q.op', 'OR').upper() == 'AND'
+        n = float(len(self.docs)) or 1.0
+
+        scores = {}
+        matched = None
+        for term in q.split():
+            field_term = FIELD_TERM.match(term)
+            if field_term:
+                field, value = field_term.groups()
+                fields = [(field, 1.0)]
+            else:
+                fields, value = qf, term
+            for word in tokens(value):
+                hits = set()
+                for field, boost in fields:
+                    docs = self.postings(field).get(word, ())
+                    if not docs:
+                        continue
+                    idf = 1.0 + math.log(n / len(docs))
+                    for i in docs:
+                        scores[i] = scores.get(i, 0.0) + boost * idf
+                    hits.update(docs)
+                if require_all:
+                    matched = hits if matched is None else matched & hits
+        if matched is not None:
+            scores = dict((i, s) for i, s in scores.items() if i in matched)
+
+        # Phrase fields: a bonus when the whole query appears in the field.
+        phrase = ' ' + ' '.join(tokens(q)) + ' '
+        for field, boost in field_boosts(params.get('pf')):
+            for i in scores:
+                if phrase in self.text(field, i):
+                    scores[i] += boost * 10
+
+        # Boost query: e.g. primaryDepartment:"office of the president"^100.0
+        for m in BOOST_QUERY.finditer(params.get('bq', '')):
+            field, boost = m.group(1), float(m.group(4) or 1.0)
+            value = ' ' + ' '.join(tokens(m.group(2) or m.group(3))) + ' '
+            for i in scores:
+                if value in self.text(field, i):
+                    scores[i] += boost
+        return scores
+
+
+    def score_boolean(self, q, params):
+        """
+        Lucene syntax with AND, OR, parentheses and field:"phrase" clauses, as batch.py sends. Adjacent clauses
+        combine with q.op.
+        """
+        default_field = params.get('df') or 'text'
+        adjacent_and = params.get('q.op', 'OR').upper() == 'AND'
+        parts = LUCENE_TOKEN.findall(q)
+        pos = [0]
+
+        def peek():
+            return parts[pos[0]] if pos[0] < len(parts) else None
+
+        def clause(token):
+            field, value = default_field, token
+            if ':' in token and not token.startswith('"'):
+                field, value = token.split(':', 1)
+            phrase = value.startswith('"')
+            words = tokens(value.strip('"').replace('\\"', '"'))
+            if not words:
+                return {}
+            postings = self.postings(field)
+            docs = set.intersection(*[postings.get(word, set()) for word in words])
+            if phrase and len(words) > 1:
+                text = ' ' + ' '.join(words) + ' '
+                docs = set(i for i in docs if text in self.text(field, i))
+            idf = 1.0 + math.log((float(len(self.docs)) or 1.0) / (len(docs) or 1))
+            return dict((i, idf) for i in docs)
+
+        def unary():
+            token = peek()
+            pos[0] += 1
+            if token == '(':
+                result = expr()
+                if peek() == ')':
+                    pos[0] += 1
+                return result
+            return clause(token)
+
+        def combine(left, right, both):
+            if both:
+                return dict((i, s + right[i]) for i, s in left.items() if i in right)
+            out = dict(left)
+            for i, s in right.items():
+                out[i] = out.get(i, 0.0) + s
+            return out
+
+        def expr():
+            result = unary()
+            while peek() not in (None, ')'):
+                op = peek()
+                if op in ('AND', 'OR'):
+                    pos[0] += 1
+                    result = combine(result, unary(), op == 'AND')
+                else:
+                    result = combine(result, unary(), adjacent_and)
+            return result
+
+        return expr()
+
+
+class Faults(object):
+    """
+    Injected latency and failures. Settings can be replaced while the server runs.
+    """
+
+    def __init__(self, latency='none', tail='', error_rate=0.0, error_status=503, hang_rate=0.0, hang_seconds=30.0,
+                 seed=None):
+        self.rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self.update(latency=latency, tail=tail, error_rate=error_rate, error_status=error_status, hang_rate=hang_rate,
+                    hang_seconds=hang_seconds)
+
+    def update(self, **settings):
+        for name in ('error_rate', 'hang_rate', 'hang_seconds'):
+            if name in settings:
+                settings[name] = float(settings[name])
+        if 'error_status' in settings:
+            settings['error_status'] = int(settings['error_status'])
+        if 'latency' in settings:
+            self._latency = self.parse_latency(settings['latency'])
+        if 'tail' in settings:
+            self._tail = tuple(float(v) for v in settings['tail'].split(':')) if settings['tail'] else None
+        self.__dict__.update(settings)
+
+    @staticmethod
+    def parse_latency(spec):
+        # Arguments are milliseconds, except lognormal's SIGMA.
+        kind, _, args = spec.partition(':')
+        values = [float(v) for v in args.split(',') if v]
+        if kind == 'none':
+            return lambda rnd: 0.0
+        if kind == 'fixed':
+            return lambda rnd: values[0] / 1000.0
+        if kind == 'uniform':
+            return lambda rnd: rnd.uniform(values[0], values[1]) / 1000.0
+        if kind == 'normal':
+            return lambda rnd: max(0.0, rnd.gauss(values[0], values[1])) / 1000.0
+        if kind == 'lognormal':
+            return lambda rnd: rnd.lognormvariate(math.log(values[0]), values[1]) / 1000.0
+        raise ValueError("Unknown latency spec: {}".format(spec))
+
+    def settings(self):
+        return dict((name, getattr(self, name)) for name in
+                    ('latency', 'tail', 'error_rate', 'error_status', 'hang_rate', 'hang_seconds'))
+
+    def draw(self):
+        """
+        Returns (delay_seconds, action) for one request. action is None, 'error' or 'hang'.
+        """
+        with self._lock:
+            delay = self._latency(self.rnd)
+            if self._tail and self.rnd.random() < self._tail[0]:
+                delay += self._tail[1] / 1000.0
+            roll = self.rnd.random()
+        if roll < self.hang_rate:
+            return delay, 'hang'
+        if roll < self.hang_rate + self.error_rate:
+            return delay, 'error'
+        return delay, None
+
+
+class FakeSolr(object):
+
+    def __init__(self, people, departments, faults=None):
+        self.cores = {
+            'directory': Core('directory', people),
+            'asu_departments': Core('asu_departments', departments),
+        }
+        self.faults = faults or Faults()
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    def count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def warm(self):
+        # The fields isearch.py queries, so the first requests aren't slowed by indexing.
+        self.cores['directory'].warm(('displayName', 'firstName', 'lastName', 'lastNameExact', 'primaryTitle',
+                                      'primaryDepartment', 'researchInterests', 'titles', 'departments', 'bio'))
+        self.cores['asu_departments'].warm(self.cores['asu_departments'].text_fields())
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    fake = None
+
+
+class Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1, so the skill's pooled client keeps its connections alive as it would against Solr.
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        fake = self.server.fake
+        url = urlsplit(self.path)
+        params = dict((k, v[-1]) for k, v in parse_qs(url.query, keep_blank_values=True).items())
+
+        if url.path == '/_fake/config':
+            if params:
+                fake.faults.update(**params)
+            return self.send_json(200, fake.faults.settings())
+        if url.path == '/_fake/stats':
+            return self.send_json(200, dict(fake.stats))
+
+        parts = url.path.strip('/').split('/')
+        core = fake.cores.get(parts[-2]) if len(parts) >= 2 and parts[-1] == 'select' else None
+        if core is None:
+            fake.count('not_found')
+            return self.send_json(404, {'error': {'msg': 'Not Found', 'code': 404}})
+
+        delay, action = fake.faults.draw()
+        if action == 'hang':
+            fake.count('hang')
+            time.sleep(fake.faults.hang_seconds)
+            self.close_connection = True
+            return
+        if delay:
+            time.sleep(delay)
+        if action == 'error':
+            fake.count('error')
+            status = fake.faults.error_status
+            return self.send_json(status, {'error': {'msg': 'Injected error', 'code': status}})
+
+        fake.count(core.name)
+        try:
+            body = core.select(params)
+        except (ValueError, KeyError) as e:
+            fake.count('bad_request')
+            return self.send_json(400, {'error': {'msg': str(e), 'code': 400}})
+        self.send_json(200, body)
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def load_docs(path):
+    # A JSON list of documents, a Solr JSON response, or one document per line.
+    with open(path) as f:
+        if path.endswith('.jsonl'):
+            return [json.loads(line) for line in f if line.strip()]
+        data = json.load(f)
+    return data['response']['docs'] if isinstance(data, dict) else data
+
+
+def make_server(fake, host='127.0.0.1', port=8983):
+    server = Server((host, port), Handler)
+    server.fake = fake
+    return server
+
+
+def start_in_thread(fake, host='127.0.0.1', port=0):
+    """
+    Starts a server on a background thread and returns (server, base_url). Port 0 picks a free port. Stop it with
+    server.shutdown().
+    """
+    server = make_server(fake, host, port)
+    thread = threading.Thread(target=server.serve_forever, name='fake-solr')
+    thread.daemon = True
+    thread.start()
+    return server, 'http://{}:{}/asudir/'.format(*server.server_address[:2])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8983)
+    parser.add_argument('--people', type=int, default=30000, help='synthetic people documents')
+    parser.add_argument('--departments', type=int, default=800, help='synthetic department documents')
+    parser.add_argument('--people-file', help='serve these directory documents instead (JSON or JSON lines)')
+    parser.add_argument('--departments-file', help='serve these department documents instead')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--latency', default='none')
+    parser.add_argument('--tail', default='', metavar='P:MS')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--hang-rate', type=float, default=0.0)
+    parser.add_argument('--hang-seconds', type=float, default=30.0)
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    people = load_docs(args.people_file) if args.people_file else fake_directory(args.people, args.seed)
+    departments = load_docs(args.departments_file) if args.departments_file else fake_departments(args.departments,
+                                                                                                  args.seed)
+    faults = Faults(args.latency, args.tail, args.error_rate, args.error_status, args.hang_rate, args.hang_seconds,
+                    args.seed)
+    fake = FakeSolr(people, departments, faults)
+    fake.warm()
+    server = make_server(fake, args.host, args.port)
+    print('Fake Solr: {} people, {} departments, indexed in {:.1f}s'.format(
+        len(fake.cores['directory'].docs), len(fake.cores['asu_departments'].docs), time.monotonic() - started))
+    print('ISEARCH_SOLR_URL=http://{}:{}/asudir/'.format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Synthetic directory documents for benchmarks.
+
+Documents are shaped like asudir-solr directory documents, heavy fields included. Name frequencies are skewed the way
+a real directory's are: a few common surnames account for many people, with a long tail of rare ones.
+"""
+import random
+
+WORDS = ('research', 'learning', 'systems', 'policy', 'community', 'design', 'health', 'energy', 'data', 'innovation',
+         'sustainability', 'engineering', 'education', 'analysis', 'university', 'public', 'science', 'arts')
+
+FIRST_NAMES = ('Michael', 'Jane', 'John', 'Sarah', 'Maria', 'David', 'Wei', 'Priya', 'James', 'Robert', 'Linda',
+               'Jennifer', 'William', 'Elizabeth', 'Joseph', 'Susan', 'Thomas', 'Jessica', 'Charles', 'Karen',
+               'Daniel', 'Nancy', 'Matthew', 'Lisa', 'Anthony', 'Betty', 'Mark', 'Ashley', 'Steven', 'Emily',
+               'Andrew', 'Kimberly', 'Jose', 'Juan', 'Luis', 'Carlos', 'Ana', 'Sofia', 'Mei', 'Jun', 'Hiroshi',
+               'Yuki', 'Arjun', 'Ravi', 'Fatima', 'Omar', 'Aisha', 'Ahmed', 'Olga', 'Ivan', 'Kendal', 'Lev')
+
+LAST_NAMES = ('Crow', 'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez',
+              'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore',
+              'Jackson', 'Martin', 'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', 'Ramirez',
+              'Lewis', 'Robinson', 'Walker', 'Young', 'Allen', 'King', 'Wright', 'Scott', 'Torres', 'Nguyen', 'Hill',
+              'Flores', 'Green', 'Adams', 'Nelson', 'Baker', 'Hall', 'Rivera', 'Campbell', 'Mitchell', 'Carter',
+              'Patel', 'Chen', 'Wang', 'Kim', 'Singh', 'Gonick', "O'Brien", 'Garcia-Lopez')
+
+SYLLABLES = ('an', 'ber', 'cal', 'dor', 'el', 'fin', 'gar', 'hal', 'is', 'jor', 'ka', 'lin', 'mor', 'nes', 'ol',
+             'par', 'quin', 'ros', 'sten', 'tor', 'ul', 'van', 'wes', 'xi', 'yar', 'zel')
+
+
+def rare_last_name(rnd):
+    return ''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4))).capitalize()
+
+
+def fake_doc(i, rnd, first=None, last=None):
+    words = lambda n: ' '.join(rnd.choice(WORDS) for _ in range(n))
+    first = first or rnd.choice(FIRST_NAMES)
+    last = last or rnd.choice(LAST_NAMES)
+    asurite = '{}{}{}'.format(first[0], ''.join(ch for ch in last if ch.isalpha()), i).lower()
+    return {
+        'id': str(100000 + i),
+        'eid': str(200000 + i),
+        'asuriteId': asurite,
+        'firstName': first,
+        'lastName': last,
+        'lastNameExact': last,
+        'displayName': '{} {}'.format(first, last),
+        'primaryTitle': words(3).title(),
+        'titles': [words(3).title() for _ in range(3)],
+        'primaryDepartment': words(2).title(),
+        'primaryiSearchDepartmentAffiliation': words(2).title(),
+        'departments': [words(2).title() for _ in range(3)],
+        'deptids': [str(rnd.randint(1000, 9999)) for _ in range(3)],
+        'emailAddress': '{}@asu.edu'.format(asurite),
+        'phone': '480/965-{:04d}'.format(rnd.randint(0, 9999)),
+        'primaryMailcode': str(rnd.randint(1000, 9999)),
+        'photoUrl': 'https://webapp4.asu.edu/photo-ws/directory_photo/{}'.format(asurite),
+        'bio': words(250),
+        'researchInterests': [words(4) for _ in range(6)],
+        'teachingInterests': [words(4) for _ in range(4)],
+        'affiliations': ['Employee'],
+        'employeeTypes': ['Faculty'],
+        '_version_': 1600000000000000000 + i,
+    }
+
+
+def fake_directory(n, seed=1, rare_ratio=0.4):
+    """
+    Yields n directory documents. About rare_ratio of them get a generated, uncommon last name.
+    """
+    rnd = random.Random(seed)
+    for i in range(n):
+        last = rare_last_name(rnd) if rnd.random() < rare_ratio else None
+        yield fake_doc(i, rnd, last=last)
+
+
+DEPT_WORDS = ('Office', 'School', 'Center', 'Institute', 'Department', 'College', 'Services', 'Program')
+
+DEPT_FIELDS = ('Technology', 'Engineering', 'Biological Sciences', 'Public Affairs', 'Sustainability', 'Music',
+               'Financial Aid', 'Student Services', 'Human Resources', 'Research', 'Libraries', 'Global Futures',
+               'Arts and Sciences', 'Nursing', 'Law', 'Business', 'Journalism', 'Education', 'Design', 'Health')
+
+
+def fake_departments(n, seed=1):
+    """
+    Yields n asu_departments documents. The first few are real ASU departments, so lookups like "uto" work.
+    """
+    rnd = random.Random(seed)
+    known = ('University Technology Office', 'Office of the President', 'Registrar Services',
+             'Ira A. Fulton Schools of Engineering', 'School of Sustainability', 'Hayden Library')
+    for i in range(n):
+        if i < len(known):
+            title = known[i]
+        else:
+            title = '{} of {}'.format(rnd.choice(DEPT_WORDS), rnd.choice(DEPT_FIELDS))
+            if rnd.random() < 0.5:
+                title += ' {}'.format(rnd.choice(WORDS).title())
+        yield {
+            'id': str(300000 + i),
+            'deptid': str(1000 + i),
+            'title': title,
+            'phone': '480/965-{:04d}'.format(rnd.randint(0, 9999)),
+            'fax': '480/965-{:04d}'.format(rnd.randint(0, 9999)) if rnd.random() < 0.5 else '',
+            'email': 'dept{}@asu.edu'.format(1000 + i),
+            'url': 'https://www.asu.edu/dept/{}'.format(1000 + i),
+            'mailcode': str(rnd.randint(1000, 9999)),
+        }
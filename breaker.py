@@ -0,0 +1,122 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+# Circuit breaker for the Solr backend.
+#
+# Tracks the outcome and latency of the last BREAKER_WINDOW queries. Once at least BREAKER_MIN_CALLS are recorded and
+# either the failure rate reaches BREAKER_ERROR_RATE or the share of queries slower than BREAKER_SLOW_CALL seconds
+# reaches BREAKER_SLOW_RATE, the breaker opens: queries are refused straight away instead of each one waiting out a
+# failing or overloaded Solr. After BREAKER_OPEN_SECONDS it goes half-open and lets a single probe query through. A
+# fast, successful probe closes it again; anything else re-opens it.
+#
+# While it's open, the query helpers in isearch.py answer from the result cache's stale entries. See result_cache.py.
+
+BREAKER_WINDOW = int(os.environ.get('ISEARCH_BREAKER_WINDOW', 20))
+BREAKER_MIN_CALLS = int(os.environ.get('ISEARCH_BREAKER_MIN_CALLS', 10))
+BREAKER_ERROR_RATE = float(os.environ.get('ISEARCH_BREAKER_ERROR_RATE', 0.5))
+BREAKER_SLOW_CALL = float(os.environ.get('ISEARCH_BREAKER_SLOW_CALL', 2.0))
+BREAKER_SLOW_RATE = float(os.environ.get('ISEARCH_BREAKER_SLOW_RATE', 0.5))
+BREAKER_OPEN_SECONDS = float(os.environ.get('ISEARCH_BREAKER_OPEN_SECONDS', 15))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+log = logging.getLogger(__name__)
+
+
+class CircuitBreaker(object):
+
+    def __init__(self, name='solr', window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS, error_rate=BREAKER_ERROR_RATE,
+                 slow_call=BREAKER_SLOW_CALL, slow_rate=BREAKER_SLOW_RATE, open_seconds=BREAKER_OPEN_SECONDS,
+                 clock=time.monotonic):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self._outcomes = deque(maxlen=window)  # (failed, slow) per call, oldest first
+        self._lock = threading.Lock()
+        self._opened_at = 0.0
+        self._probing = False
+        self.state = CLOSED
+        self.trips = 0
+        self.rejected = 0
+
+    def allow(self):
+        """
+        Returns True if a call may go ahead. When half-open, only one caller at a time gets True: the probe. Every
+        allowed call must be followed by record().
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if self._clock() - self._opened_at < self.open_seconds:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+                self._probing = False
+                log.info("Circuit {} half-open, probing".format(self.name))
+            if self._probing:
+                self.rejected += 1
+                return False
+            self._probing = True
+            return True
+
+    def record(self, ok, seconds):
+        """
+        Records the outcome of a call.
+        """
+        slow = seconds >= self.slow_call
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if not self._probing:
+                    return
+                self._probing = False
+                if ok and not slow:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                    log.info("Circuit {} closed".format(self.name))
+                else:
+                    self._trip()
+                return
+            if self.state == OPEN:
+                # A call that started before the breaker opened.
+                return
+
+            self._outcomes.append((not ok, slow))
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            failures = sum(1 for failed, _ in self._outcomes if failed)
+            slow_calls = sum(1 for _, was_slow in self._outcomes if was_slow)
+            if failures >= self.error_rate * calls or slow_calls >= self.slow_rate * calls:
+                self._trip()
+
+    def _trip(self):
+        self.state = OPEN
+        self._opened_at = self._clock()
+        self._outcomes.clear()
+        self.trips += 1
+        log.warning("Circuit {} open for {}s".format(self.name, self.open_seconds))
+
+    def reset(self):
+        with self._lock:
+            self.state = CLOSED
+            self._probing = False
+            self._outcomes.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'window': len(self._outcomes),
+                'trips': self.trips,
+                'rejected': self.rejected
+            }
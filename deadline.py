@@ -0,0 +1,34 @@
+import os
+import time
+
+# Per-request deadlines.
+#
+# Alexa waits about 8 seconds for a response before giving up on the skill. Each request to /directory starts a
+# Deadline with REQUEST_BUDGET seconds, and the query helpers pass it down to solr.get(), which caps its timeouts (and
+# its hedged duplicate request) to what's left. When the budget is spent, handlers answer with what they have (stale
+# cached results, the results loaded so far) instead of letting Alexa time out.
+
+REQUEST_BUDGET = float(os.environ.get('ISEARCH_REQUEST_BUDGET', 5.0))
+
+
+class Deadline(object):
+    __slots__ = ('expires', '_clock')
+
+    def __init__(self, budget=REQUEST_BUDGET, clock=time.monotonic):
+        self._clock = clock
+        self.expires = clock() + budget
+
+    def remaining(self):
+        """
+        Seconds left, never less than 0.
+        """
+        return max(0.0, self.expires - self._clock())
+
+    def expired(self):
+        return self.expires <= self._clock()
+
+    def cap(self, seconds):
+        """
+        Returns seconds, or what's left of the deadline if that's less.
+        """
+        return min(seconds, self.remaining())
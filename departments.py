@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import namedtuple
+
+import solr
+from solr_query import SolrQuery
+
+# Department lookup.
+#
+# The department list on asudir-solr's asu_departments core is small and rarely changes, so rather than querying Solr
+# on every utterance we keep a local copy indexed in a prefix trie. Lookups resolve in memory. Solr is only hit to
+# refresh the copy: synchronously the very first time (when there's no copy on disk either), within the request's
+# deadline, and otherwise in the background once the copy is older than DEPT_REFRESH_INTERVAL, serving the current
+# copy meanwhile.
+#
+# The copy is also written to DEPT_CACHE_PATH so new containers/workers start with it instead of a Solr round-trip.
+
+DEPT_REFRESH_INTERVAL = float(os.environ.get('ISEARCH_DEPT_REFRESH_INTERVAL', 24 * 60 * 60))
+DEPT_CACHE_PATH = os.environ.get('ISEARCH_DEPT_CACHE_PATH', '/tmp/isearch_departments.json')
+DEPT_ROWS = 10000
+
+DEPARTMENT_FIELDS = ('deptId', 'name', 'phone', 'fax', 'email', 'url', 'mailcode')
+
+# Our field name -> asu_departments field name. Adjust here if the core's schema changes.
+DEPARTMENT_SOLR_FIELDS = {
+    'deptId': 'deptid',
+    'name': 'title',
+    'phone': 'phone',
+    'fax': 'fax',
+    'email': 'email',
+    'url': 'url',
+    'mailcode': 'mailcode',
+}
+
+DEPARTMENT_FL = ','.join(DEPARTMENT_SOLR_FIELDS[f] for f in DEPARTMENT_FIELDS)
+
+# Words left out of acronyms and ignored in queries, so "office of the president" matches "president office" and
+# "University Technology Office" answers to "uto".
+STOP_WORDS = frozenset(('of', 'the', 'and', 'for', 'in', 'at', 'to', '&'))
+
+log = logging.getLogger(__name__)
+
+
+class Department(namedtuple('Department', DEPARTMENT_FIELDS)):
+    __slots__ = ()
+
+
+Department.__new__.__defaults__ = ('',) * len(DEPARTMENT_FIELDS)
+
+
+def department_from_doc(doc):
+    values = []
+    for f in DEPARTMENT_FIELDS:
+        value = doc.get(DEPARTMENT_SOLR_FIELDS[f], '')
+        # Multi-valued fields come back as lists. We only render the first value.
+        if isinstance(value, list):
+            value = value[0] if value else ''
+        values.append(value if isinstance(value, str) else str(value))
+    return Department(*values)
+
+
+def department_from_session(value):
+    return Department(*value)
+
+
+def tokenize(text):
+    return [w for w in ''.join(ch if ch.isalnum() else ' ' for ch in (text or '').casefold()).split()
+            if w not in STOP_WORDS]
+
+
+def acronym(text):
+    return ''.join(w[0] for w in tokenize(text))
+
+
+class _Node(object):
+    __slots__ = ('children', 'ids')
+
+    def __init__(self):
+        self.children = {}
+        self.ids = []  # every department with a word passing through this node
+
+
+class DepartmentIndex(object):
+    """
+    Prefix trie over department name words (and acronyms). Every node keeps the departments beneath it, so a prefix
+    lookup is a walk of len(prefix) steps.
+    """
+
+    def __init__(self, departments):
+        self.departments = list(departments)
+        self._root = _Node()
+        self._names = {}  # normalized full name -> id
+        self._acronyms = {}  # acronym -> ids
+        for i, dept in enumerate(self.departments):
+            words = tokenize(dept.name)
+            self._names.setdefault(' '.join(words), i)
+            if len(words) > 1:
+                self._acronyms.setdefault(acronym(dept.name), []).append(i)
+            for word in set(words):
+                self._insert(word, i)
+
+    def _insert(self, word, i):
+        node = self._root
+        for ch in word:
+            node = node.children.setdefault(ch, _Node())
+            if not node.ids or node.ids[-1] != i:
+                node.ids.append(i)
+
+    def _prefix(self, prefix):
+        node = self._root
+        for ch in prefix:
+            node = node.children.get(ch)
+            if node is None:
+                return ()
+        return node.ids
+
+    def __len__(self):
+        return len(self.departments)
+
+    def search(self, query, limit=5):
+        """
+        Returns up to limit departments for query, best first: exact name, then acronym, then departments with a word
+        starting with each query word (shorter names first).
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+
+        ranked = []
+        exact = self._names.get(' '.join(words))
+        if exact is not None:
+            ranked.append(exact)
+        if len(words) == 1:
+            ranked.extend(self._acronyms.get(words[0], ()))
+
+        candidates = None
+        for word in sorted(words, key=lambda w: len(self._prefix(w))):
+            ids = self._prefix(word)
+            candidates = set(ids) if candidates is None else candidates.intersection(ids)
+            if not candidates:
+                break
+        if candidates:
+            ranked.extend(sorted(candidates, key=lambda i: (len(self.departments[i].name), i)))
+
+        seen = set()
+        out = []
+        for i in ranked:
+            if i not in seen:
+                seen.add(i)
+                out.append(self.departments[i])
+                if len(out) >= limit:
+                    break
+        return out
+
+
+class DepartmentDirectory(object):
+    """
+    The local department copy: loads it from disk or Solr, and refreshes it from Solr when it goes stale.
+    """
+
+    def __init__(self, client, path, cache_path=DEPT_CACHE_PATH, refresh_interval=DEPT_REFRESH_INTERVAL):
+        """
+        client is a solr_query.SolrClient, and path the asu_departments core's select handler.
+        """
+        self.client = client
+        self.query = SolrQuery(path, {'q': '*:*', 'fl': DEPARTMENT_FL, 'rows': DEPT_ROWS, 'wt': 'json'})
+        self.cache_path = cache_path
+        self.refresh_interval = refresh_interval
+        self.index = None
+        self.loaded_at = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def search(self, query, limit=5, deadline=None):
+        """
+        Returns matching departments. Raises solr.SolrError only if there's no copy at all and Solr can't be reached,
+        or solr.DeadlineExceeded if it can't be fetched before deadline.
+        """
+        if self.index is None:
+            self._load(deadline)
+        elif time.time() - self.loaded_at > self.refresh_interval:
+            self._refresh_in_background()
+        return self.index.search(query, limit)
+
+    def _load(self, deadline=None):
+        # Another request may be loading already. Wait for it only as long as the deadline allows.
+        if not self._lock.acquire(timeout=deadline.remaining() if deadline is not None else -1):
+            raise solr.DeadlineExceeded("Department list still loading")
+        try:
+            if self.index is not None:
+                return
+            docs, loaded_at = self._read_cache()
+            if docs is None or time.time() - loaded_at > self.refresh_interval:
+                try:
+                    docs, loaded_at = self._fetch(deadline), time.time()
+                except solr.SolrError:
+                    # Better an old copy than none.
+                    if docs is None:
+                        raise
+                else:
+                    self._write_cache(docs, loaded_at)
+            self._set(docs, loaded_at)
+        finally:
+            self._lock.release()
+
+    def refresh(self):
+        """
+        Re-fetches the department list from Solr and swaps it in.
+        """
+        docs = self._fetch()
+        loaded_at = time.time()
+        self._write_cache(docs, loaded_at)
+        self._set(docs, loaded_at)
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except solr.SolrError as e:
+                log.warning("Department refresh failed: {}".format(e))
+                # Try again after another interval rather than on every request.
+                self.loaded_at = time.time()
+            finally:
+                self._refreshing = False
+
+        t = threading.Thread(target=run, name='department-refresh')
+        t.daemon = True
+        t.start()
+
+    def _set(self, docs, loaded_at):
+        self.index = DepartmentIndex(department_from_doc(doc) for doc in docs)
+        self.loaded_at = loaded_at
+
+    def _fetch(self, deadline=None):
+        response = self.client.select(self.query, deadline=deadline)
+        return response['response']['docs']
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path) as f:
+                data = json.load(f)
+            return data['docs'], data['loaded_at']
+        except (IOError, OSError, ValueError, KeyError):
+            return None, 0
+
+    def _write_cache(self, docs, loaded_at):
+        tmp = self.cache_path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump({'loaded_at': loaded_at, 'docs': docs}, f)
+            os.replace(tmp, self.cache_path)
+        except (IOError, OSError) as e:
+            log.warning("Couldn't write department cache {}: {}".format(self.cache_path, e))
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import logging
+import threading
+
+from records import Page, people_from_session
+
+# Shared on-disk tier for the result cache.
+#
+# The in-process result cache (result_cache.py) is lost whenever a worker process or Lambda container is recycled, and
+# each worker warms its own copy, so a popular query goes to Solr once per worker. With ISEARCH_DISK_CACHE set to a
+# file path, results are also kept in a SQLite database there, shared by every process on the host (or container).
+# An in-process miss checks it before going to Solr, and whatever is loaded from Solr is written to it.
+#
+# The database runs in WAL mode, so any number of processes can read while one writes, and reads go through a memory
+# map of the file (DISK_CACHE_MMAP bytes). Each thread keeps its own connection.
+#
+# Entries expire after the result cache's TTL, and are kept a further stale TTL for serving when Solr can't be
+# reached, using wall clock time, as processes don't share a monotonic clock. Every DISK_CACHE_COMPACT_EVERY writes,
+# entries past their stale window are deleted, and if more than DISK_CACHE_MAXSIZE remain, the ones closest to
+# expiring go too.
+
+DISK_CACHE_PATH = os.environ.get('ISEARCH_DISK_CACHE', '')
+DISK_CACHE_MAXSIZE = int(os.environ.get('ISEARCH_DISK_CACHE_MAXSIZE', 20000))
+DISK_CACHE_COMPACT_EVERY = int(os.environ.get('ISEARCH_DISK_CACHE_COMPACT_EVERY', 200))
+DISK_CACHE_MMAP = int(os.environ.get('ISEARCH_DISK_CACHE_MMAP', 64 * 1024 * 1024))
+DISK_CACHE_TIMEOUT = float(os.environ.get('ISEARCH_DISK_CACHE_TIMEOUT', 1.0))
+
+log = logging.getLogger(__name__)
+
+
+def encode_key(key):
+    # Result cache keys are tuples of strings and ints.
+    return json.dumps(key, separators=(',', ':'))
+
+
+def encode_page(page):
+    return json.dumps({'start': page.start, 'total': page.total, 'records': page.records}, separators=(',', ':'))
+
+
+def decode_page(payload):
+    data = json.loads(payload)
+    return Page(data['start'], people_from_session(data['records']), data['total'])
+
+
+class DiskCache(object):
+
+    def __init__(self, path, ttl, stale_ttl, maxsize=DISK_CACHE_MAXSIZE, compact_every=DISK_CACHE_COMPACT_EVERY,
+                 encode=encode_page, decode=decode_page, clock=time.time):
+        """
+        ttl and stale_ttl are the result cache's. encode and decode convert values to and from text.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self.compact_every = compact_every
+        self.encode = encode
+        self.decode = decode
+        self._clock = clock
+        self._local = threading.local()
+        self._writes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.errors = 0
+        with self._conn() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                ' key TEXT PRIMARY KEY,'
+                ' expires REAL NOT NULL,'
+                ' payload TEXT NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires)')
+
+    def _conn(self):
+        # One connection per thread. A connection can't be used across a fork, so each also belongs to the process
+        # that opened it.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            import sqlite3
+            conn = sqlite3.connect(self.path, timeout=DISK_CACHE_TIMEOUT)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA mmap_size={:d}'.format(DISK_CACHE_MMAP))
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def lookup(self, key):
+        """
+        Returns (value, fresh) for key. value is None if it's missing or past its stale window.
+        """
+        import sqlite3
+        try:
+            row = self._conn().execute('SELECT expires, payload FROM entries WHERE key = ?',
+                                       (encode_key(key),)).fetchone()
+        except sqlite3.Error as e:
+            # A shared cache that can't be read is just a miss.
+            self.errors += 1
+            log.warning("Disk cache read failed: {}".format(e))
+            return None, False
+        now = self._clock()
+        if row is None or row[0] + self.stale_ttl <= now:
+            self.misses += 1
+            return None, False
+        fresh = row[0] > now
+        if fresh:
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+        return self.decode(row[1]), fresh
+
+    def set(self, key, value):
+        import sqlite3
+        try:
+            with self._conn() as conn:
+                conn.execute('INSERT OR REPLACE INTO entries (key, expires, payload) VALUES (?, ?, ?)',
+                             (encode_key(key), self._clock() + self.ttl, self.encode(value)))
+        except sqlite3.Error as e:
+            self.errors += 1
+            log.warning("Disk cache write failed: {}".format(e))
+            return
+        self._writes += 1
+        if self._writes % self.compact_every == 0:
+            self.compact()
+
+    def compact(self):
+        """
+        Deletes entries past their stale window, then the ones closest to expiring if there are more than maxsize.
+        """
+        import sqlite3
+        try:
+            with self._conn() as conn:
+                conn.execute('DELETE FROM entries WHERE expires <= ?', (self._clock() - self.stale_ttl,))
+                conn.execute(
+                    'DELETE FROM entries WHERE rowid IN '
+                    '(SELECT rowid FROM entries ORDER BY expires DESC LIMIT -1 OFFSET ?)',
+                    (self.maxsize,)
+                )
+            # Fold the WAL back into the database without waiting on readers.
+            self._conn().execute('PRAGMA wal_checkpoint(PASSIVE)')
+        except sqlite3.Error as e:
+            self.errors += 1
+            log.warning("Disk cache compaction failed: {}".format(e))
+
+    def clear(self):
+        with self._conn() as conn:
+            conn.execute('DELETE FROM entries')
+
+    def __len__(self):
+        return self._conn().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'errors': self.errors,
+        }
+
+
+def disk_cache_from_env(ttl, stale_ttl, path=DISK_CACHE_PATH):
+    """
+    Returns a DiskCache at ISEARCH_DISK_CACHE, or None if it isn't set or can't be opened.
+    """
+    if not path:
+        return None
+    import sqlite3
+    try:
+        return DiskCache(path, ttl, stale_ttl)
+    except sqlite3.Error as e:
+        log.warning("Couldn't open disk cache at {}: {}".format(path, e))
+        return None
@@ -1,16 +1,38 @@
-from flask import Flask, json, render_template
+from flask import Flask, json, g, Response, abort, stream_with_context
+from flask import request as flask_request
 from flask_ask import Ask, statement, question, session, context, delegate, request
 
-import requests
 import logging
 from datetime import datetime
-from xml.sax.saxutils import escape, unescape
+
+import solr
+from solr_query import SolrClient, SolrQuery
+from deadline import Deadline
+from result_cache import ResultCache, people_key, title_key, CACHE_TTL, CACHE_STALE_TTL
+from disk_cache import disk_cache_from_env
+from records import PERSON_FL, Page, page_from_response
+from result_store import store_from_url
+from pagination import ResultCursor, FIRST_WINDOW_SIZE, WINDOW_SIZE, prefetch
+from local_index import load_local_index
+from departments import DepartmentDirectory
+from speller import LazySpeller
+from render import render_person as _render_person, render_department as _render_department, escape
+from templating import PrecompiledTemplates, configure_jinja
+from unified_search import fan_out, merge_records, UNIFIED_BUDGET
+from result_view import list_view, token_index, LIST_WINDOW_SIZE
+from batch import BatchResolver, parse_names, parse_json_names, to_json, BATCH_TOKEN
+from photos import PhotoCache, photo_url, is_valid_id, PHOTO_BASE_URL, PHOTO_ROUTE, PHOTO_SIZES, PHOTO_MAX_AGE
+import metrics
+import profiler
+import request_log
+from metrics import span, timed
 
 # DEBUGGING
 # import pdb
 
 # Params
-SOLR = 'https://asudir-solr.asu.edu/asudir/'
+# Solr base URL. Override with ISEARCH_SOLR_URL; see solr.py.
+SOLR = solr.SOLR_URL
 # Example people query:
 # https://asudir-solr.asu.edu/asudir/directory/select?q=firstName:michael+lastName:crow&rows=3&wt=json
 # Example title query (with debugs left in for reference):
@@ -19,21 +41,59 @@ PEOPLE_PATH = 'directory/select'
 # Example department query:
 # https://asudir-solr.asu.edu/asudir/asu_departments/select?q=uto&rows=3&wt=json
 DEPT_PATH = 'asu_departments/select'
+# All of the above are queried through the pooled client in solr.py. See that module for pool size, timeout and retry
+# settings.
+
+# Prepared people and title queries: their static parameters are encoded once, and each search only adds the escaped
+# user terms, start and rows. See solr_query.py.
+solr_client = SolrClient(SOLR)
+# Query allows for stemming and possibly phonemic matches on names. Also, while not optimized for title and bio
+# searches, this will hit those fields, so a query for "Chief Information Officer" is likely to return decent hits.
+# Boost hits on displayName by 20 and lastNameExact by 50, specify all fields to query (qf), and mark displayName as a
+# phrase field (pf). Only the fields we render are returned (fl).
+PEOPLE_QUERY = SolrQuery(PEOPLE_PATH, {
+    'defType': 'edismax',
+    'qf': 'displayName^20.0 firstName lastName lastNameExact^50.0 primaryTitle primaryDepartment researchInterests',
+    'pf': 'displayName^20.0',
+    'fl': PERSON_FL,
+    'wt': 'json',
+})
+# Title query with special boost for president in a bq (boost query). bq prevents all the "President's Professors"
+# and similar from pushing the university president too far down into the results.
+TITLE_QUERY = SolrQuery(PEOPLE_PATH, {
+    'defType': 'edismax',
+    'q.op': 'AND',
+    'qf': 'primaryTitle^200.0 titles primaryDepartment^100.0 departments bio',
+    'pf': 'primaryTitle^20.0',
+    'bq': 'primaryDepartment:"office of the president"^100.0',
+    'df': 'primaryTitle',
+    'fl': PERSON_FL,
+    'wt': 'json',
+})
 
 # Constant defining session attribute key for the event index
 SESSION_INDEX = 'index'
 
-# Constant defining session attribute key for the event text key
-SESSION_RESULTS = 'results'
+# Constant defining session attribute key for the results handle. Results themselves live in result_store, keyed by
+# session ID and this handle, so they aren't echoed back and forth in session attributes on every turn.
+SESSION_RESULTS = 'results_handle'
 SESSION_SLOT_FIRSTNAME = 'slot_firstname'
 SESSION_SLOT_LASTNAME = 'slot_lastname'
 SESSION_SLOT_DEPTNAME = 'slot_deptname'
 SESSION_SLOT_TITLE_SEARCH_PHRASE = 'slot_title_search_phrase'
+SESSION_SLOT_SEARCH_PHRASE = 'slot_search_phrase'
 
 # When a search happens we'll set a context for use in results handling
 # Use the initial intent's name as the context value.
 SESSION_SEARCH_CONTEXT = 'search_context'
 
+# Searches whose results are shown as a ListTemplate1 list, and the session attribute key for the first result of the
+# list window on screen. See result_view.py.
+LIST_CONTEXTS = ('iSearchIntentTitle', 'iSearchIntentSearch')
+SESSION_LIST_START = 'list_start'
+
+# Title searches fetch RESPONSE_SIZE results for the first list window; later windows load as the user asks for
+# them. People searches page lazily through the results; see pagination.py for window sizes.
 RESPONSE_SIZE = 20
 PAGINATION_SIZE = 1
 
@@ -43,112 +103,417 @@ ask = Ask(app, "/directory")
 # log = logging.getLogger('flask_ask').setLevel(logging.DEBUG)
 log = logging.getLogger()
 
+# templates.yaml entries, compiled once. Static ones are pre-rendered. See templating.py.
+configure_jinja(app)
+templates = PrecompiledTemplates(app).compile()
+
+# Prebuilt responses for static intents, keyed by (name, display device).
+static_responses = {}
+
+# Rendering is timed into the metrics' render phase. See metrics.py.
+render_person = timed('render', _render_person)
+render_department = timed('render', _render_department)
+
+# Shared cache for people and title query results. Stale-while-revalidate: an expired entry is answered at once and
+# reloaded on the background pool. See result_cache.py for size and TTL settings. With ISEARCH_DISK_CACHE set, backed
+# by an on-disk tier shared between processes; see disk_cache.py.
+result_cache = ResultCache(background=prefetch, shared=disk_cache_from_env(CACHE_TTL, CACHE_STALE_TTL))
+
+# Server-side store for the current search's results. See result_store.py for backends and TTL settings.
+result_store = store_from_url()
+
+# Optional local directory snapshot answering name lookups without Solr. None unless ISEARCH_LOCAL_INDEX is set. See
+# local_index.py.
+local_index = load_local_index()
+
+# Name spelling corrector, built on first use from the LAST_NAME slot values and the local index, if loaded. See
+# speller.py.
+speller = LazySpeller(local_index=local_index)
+
+# Locally cached, trie-indexed copy of the department list. Solr's department core is only hit to refresh it. See
+# departments.py.
+department_directory = DepartmentDirectory(solr_client, DEPT_PATH)
+
+# Disk cache behind the photo proxy route. None unless ISEARCH_PHOTO_BASE_URL is set. See photos.py.
+photo_cache = PhotoCache() if PHOTO_BASE_URL else None
+
+
+# Every request gets a deadline, passed down to the Solr client so a slow Solr can't hold the response past Alexa's
+# timeout. See deadline.py.
+@app.before_request
+def start_deadline():
+
+    g.deadline = Deadline()
+
+def request_deadline():
+
+    return g.get('deadline')
+
+
+# Per-turn phase timings, tagged by intent and device, served in Prometheus format at /metrics if ISEARCH_METRICS_EXPOSE
+# is set. See metrics.py.
+def describe_turn():
+
+    if request.type == 'IntentRequest':
+        intent = request.intent.name
+    else:
+        intent = request.type
+    return intent, 'display' if is_display() else 'voice'
+
+metrics.install(app, describe_turn)
+
+# Sampled profiling of /directory requests, written as folded stacks per intent. Off unless ISEARCH_PROFILE_RATE or
+# ISEARCH_PROFILE_TOKEN is set. See profiler.py.
+profiler.install(app, describe_turn)
+
+# One structured JSON line per turn (intent, device, Solr time, session hash, result count, pagination index), written
+# by a background thread. See request_log.py.
+def describe_turn_details():
+
+    attributes = session.attributes or {}
+    if attributes.get(SESSION_SEARCH_CONTEXT) in LIST_CONTEXTS:
+        index = attributes.get(SESSION_LIST_START)
+    else:
+        index = attributes.get(SESSION_INDEX)
+    return {'session': session.sessionId, 'index': index}
+
+request_log.install(app, describe_turn, describe_turn_details)
+metrics.registry.add_collector(lambda: dict(('isearch_result_cache_' + k, v) for k, v in result_cache.stats().items()))
+metrics.registry.add_collector(lambda: {
+    'isearch_solr_breaker_open': int(solr.breaker.state != 'closed'),
+    'isearch_solr_breaker_trips': solr.breaker.trips,
+    'isearch_solr_hedged': solr.latency.hedged,
+    'isearch_solr_hedge_wins': solr.latency.hedge_wins,
+})
+if result_cache.shared is not None:
+    metrics.registry.add_collector(lambda: dict(('isearch_disk_cache_' + k, v)
+                                                for k, v in result_cache.shared.stats().items()))
+if photo_cache is not None:
+    metrics.registry.add_collector(lambda: dict(('isearch_photo_' + k, v) for k, v in photo_cache.stats().items()))
+if request_log.turn_log is not None:
+    metrics.registry.add_collector(lambda: {'isearch_request_log_dropped': request_log.turn_log.dropped})
+
 
 # HELPERS
 
-def get_people_results(firstName='', lastName=''):
-
-    # Solr query.
-    # Query allows for stemming and possibly phonemic matches on names. Also, while not optimized for title and bio
-    # searches, this will hit those fields, so a query for "Chief Information Officer" is likely to return decent hits.
-    # Boost hits on displayName by 20 and lastNameExact by 50, specify all fields to query (qf), and mark displayName
-    # as a phrase field (pf).
-    url_query = SOLR + PEOPLE_PATH + '?defType=edismax&q={}%20{}&qf=displayName%5E20.0%20firstName%20lastName%20lastNameExact%5E50.0%20primaryTitle%20primaryDepartment%20researchInterests&pf=displayName%5E20.0&rows={}&wt=json'.format(firstName, lastName.capitalize(), RESPONSE_SIZE)
-
-    resp = requests.get(url_query)
-
-    if resp.status_code == 200:
-        records = resp.json()  # dict datatype
-        results = []
-        for item in records['response']['docs']:
-            record = {
-                'firstName': item.get('firstName', ''),
-                'lastName': item.get('lastName', ''),
-                'displayName': item.get('displayName', ''),
-                'primaryTitle': item.get('primaryTitle', ''),
-                'primaryiSearchDepartmentAffiliation': item.get('primaryiSearchDepartmentAffiliation', ''),
-                'emailAddress': item.get('emailAddress', ''),
-                'phone': item.get('phone', ''),
-                'primaryMailcode': item.get('primaryMailcode', ''),
-                'photoUrl': item.get('photoUrl', '')
-            }
-            results.append(record)
-        return results
+def search_error(e, directory='people'):
 
+    # Response text for a failed query.
+    if isinstance(e, solr.DeadlineExceeded):
+        return "The {} directory is slow to answer right now. Please ask again in a moment.".format(directory)
+    return "There was a problem querying the {} directory.".format(directory)
+
+def get_people_results(firstName='', lastName='', start=0, rows=FIRST_WINDOW_SIZE, deadline=None):
+
+    # Returns a Page of results. Names found in the local index are answered from memory. Otherwise cached in front
+    # of Solr, and identical concurrent lookups share a single Solr round-trip. If Solr fails, the circuit breaker is
+    # open or the deadline runs out, falls back to expired cached results for the same query.
+    if local_index is not None:
+        page = local_index.search(firstName, lastName, start, rows)
+        if page is not None:
+            return page
+
+    key = people_key(firstName, lastName, start, rows)
+    try:
+        # Background revalidation isn't bound to this request's deadline.
+        return result_cache.get_or_load(key, lambda: query_people_results(firstName, lastName, start, rows, deadline),
+                                        lambda: query_people_results(firstName, lastName, start, rows))
+    except solr.SolrError as e:
+        stale = result_cache.get_stale(key)
+        if stale is not None:
+            log.warning("Serving stale people results: {}".format(e))
+            return stale
+        return search_error(e)
+
+def query_people_results(firstName='', lastName='', start=0, rows=FIRST_WINDOW_SIZE, deadline=None):
+
+    # Solr query. See PEOPLE_QUERY.
+    records = solr_client.select(PEOPLE_QUERY, [firstName, lastName.capitalize()], start=start, rows=rows,
+                                 deadline=deadline)  # dict datatype
+
+    with span('mapping'):
+        return page_from_response(records)
+
+
+def get_title_results(titleSearchPhrase='', start=0, rows=RESPONSE_SIZE, deadline=None):
+
+    # Returns a Page of results. Cached in front of Solr, so iSearchIntentBackToResults re-running a title search
+    # won't hit Solr again. Falls back to expired cached results like get_people_results().
+    key = title_key(titleSearchPhrase, start, rows)
+    try:
+        return result_cache.get_or_load(key, lambda: query_title_results(titleSearchPhrase, start, rows, deadline),
+                                        lambda: query_title_results(titleSearchPhrase, start, rows))
+    except solr.SolrError as e:
+        stale = result_cache.get_stale(key)
+        if stale is not None:
+            log.warning("Serving stale title results: {}".format(e))
+            return stale
+        return search_error(e)
+
+def query_title_results(titleSearchPhrase='', start=0, rows=RESPONSE_SIZE, deadline=None):
+
+    # Solr title query. See TITLE_QUERY.
+    records = solr_client.select(TITLE_QUERY, titleSearchPhrase, start=start, rows=rows,
+                                 deadline=deadline)  # dict datatype
+
+    with span('mapping'):
+        return page_from_response(records)
+
+
+def correct_names(firstName='', lastName='', found_nothing=False):
+
+    # Returns corrected (firstName, lastName), or None. Unless the speller knows every name in the directory (the local
+    # index is loaded), a name it doesn't know may well be right, so corrections are only made once it found nothing.
+    names = speller.get()
+    if not (names.complete or found_nothing):
+        return None
+    return names.correct(firstName, lastName)
+
+
+def get_department_results(deptName='', deadline=None):
+
+    # Resolved against the local department copy, no Solr round-trip once it's loaded. The first load is made within
+    # the deadline.
+    try:
+        return department_directory.search(deptName, deadline=deadline)
+    except solr.SolrError as e:
+        return search_error(e, 'department')
+
+
+def get_unified_results(searchPhrase='', deadline=None):
+
+    # Runs the people, title and department searches concurrently, within the unified search time budget (see
+    # unified_search.py) or what's left of the deadline. Returns (people, departments, timed_out): people merges the
+    # name and title hits with duplicates dropped, name hits first. Returns an error string if every search failed.
+    results, timed_out = fan_out({
+        'people': lambda: get_people_results(searchPhrase, '', 0, RESPONSE_SIZE, deadline),
+        'title': lambda: get_title_results(searchPhrase, deadline=deadline),
+        'department': lambda: get_department_results(searchPhrase, deadline),
+    }, deadline.cap(UNIFIED_BUDGET) if deadline is not None else UNIFIED_BUDGET)
+
+    pages = [results[name] for name in ('people', 'title') if isinstance(results.get(name), Page)]
+    departments = results.get('department')
+    if not isinstance(departments, list):
+        departments = None
+    if not pages and departments is None and not timed_out:
+        return "There was a problem querying the directory."
+
+    people = merge_records(*[page.records for page in pages], limit=RESPONSE_SIZE)
+    return people, departments or [], timed_out
+
+
+def fetch_window(kind, params, start, rows, deadline=None):
+
+    if kind == 'title':
+        return get_title_results(*params, start=start, rows=rows, deadline=deadline)
+    return get_people_results(*params, start=start, rows=rows, deadline=deadline)
+
+def stash_cursor(cursor, search_id=None):
+
+    # Keep results server-side and only put the handle in the session.
+    session.attributes[SESSION_RESULTS] = result_store.put(session.sessionId, cursor.to_state(), search_id)
+    request_log.annotate(results=cursor.total)
+
+def load_cursor():
+
+    state = result_store.get(session.sessionId, session.attributes.get(SESSION_RESULTS))
+    if state is not None:
+        cursor = ResultCursor.from_state(state)
+        request_log.annotate(results=cursor.total)
+        return cursor
+
+    # Stored results expired, or were stashed by another instance using the in-memory backend. Re-run the search
+    # from the slots kept in the session; the result cache usually answers this without going to Solr.
+    if session.attributes.get(SESSION_SEARCH_CONTEXT) == 'iSearchIntentTitle':
+        params = [session.attributes.get(SESSION_SLOT_TITLE_SEARCH_PHRASE, '')]
+        page = get_title_results(*params, deadline=request_deadline())
+        cursor = ResultCursor('title', params)
+    elif session.attributes.get(SESSION_SEARCH_CONTEXT) == 'iSearchIntentSearch':
+        params = [session.attributes.get(SESSION_SLOT_SEARCH_PHRASE, '')]
+        unified = get_unified_results(*params, deadline=request_deadline())
+        people = unified[0] if isinstance(unified, tuple) else []
+        page = Page(0, people, len(people))
+        cursor = ResultCursor('search', params)
     else:
-        return "There as a problem querying the people directory."
+        params = [session.attributes.get(SESSION_SLOT_FIRSTNAME, ''), session.attributes.get(SESSION_SLOT_LASTNAME, '')]
+        page = get_people_results(*params, deadline=request_deadline())
+        cursor = ResultCursor('people', params)
 
-def get_people_results_output(record):
+    if isinstance(page, Page):
+        cursor.extend(page)
+        stash_cursor(cursor)
+    return cursor
 
-    # Note, need to ensure escaping on values as & and other special characters will force this to be interpreted as
-    # text instead of ssml.
+def ensure_loaded(cursor, count):
 
-    out = escape(record.get('displayName', ''))
-    out += ' is ' + escape(record.get('primaryTitle')) if record.get('primaryTitle') else ''
-    out += ' in  ' + escape(record.get('primaryiSearchDepartmentAffiliation')) if record.get('primaryiSearchDepartmentAffiliation') else ''
-    out += '<break/> You can reach ' + escape(record.get('displayName', '')) + ' at ' if record.get('emailAddress') or record.get('phone') or record.get('primaryMailcode') else ''
-    out += '<break/> the email <break/><prosody rate="slow"><say-as interpret-as="spell-out">' + escape(record.get('emailAddress')) + '</say-as></prosody>' if record.get('emailAddress') else '' # .replace('@asu.edu', ',at A S U dot E D U') if record.get('emailAddress') else ''
-    out += '<break/> the phone number <break/> <say-as interpret-as="telephone">' + escape(record.get('phone')) + "</say-as>" if record.get('phone') else ''
-    out += '<break/> the mail code <break/> ' + escape(record.get('primaryMailcode')) if record.get('primaryMailcode') else ''
-    return out
+    # Fetch windows until at least count results are loaded or Solr has no more. Windows that were prefetched are
+    # served from (or joined in flight through) the result cache. If a fetch fails or the deadline runs out, the
+    # cursor keeps what it has.
+    loaded = len(cursor)
+    while len(cursor) < count and cursor.has_more():
+        page = fetch_window(cursor.kind, cursor.params, *cursor.next_window(), deadline=request_deadline())
+        if not isinstance(page, Page) or not page.records:
+            break
+        cursor.extend(page)
+    if len(cursor) > loaded:
+        stash_cursor(cursor, session.attributes.get(SESSION_RESULTS))
 
-# For Alexa app cards.
-def get_people_results_card(record):
+def load_record(cursor, index):
 
-    out = '\n{}'.format(escape(record.get('displayName', ''))) if record.get('displayName') else ''
-    out += '\n{}'.format(escape(record.get('primaryTitle', ''))) if record.get('primaryTitle') else ''
-    out += '\n{}'.format(escape(record.get('primaryiSearchDepartmentAffiliation', ''))) if record.get('primaryiSearchDepartmentAffiliation') else ''
-    out += '\n{}'.format(escape(record.get('emailAddress', ''))) if record.get('emailAddress') else ''
-    out += '\n{}'.format(escape(record.get('phone', ''))) if record.get('phone') else ''
-    out += '\n{}'.format(escape(record.get('primaryMailcode', ''))) if record.get('primaryMailcode') else ''
-    return out
+    # A result past what the cursor has loaded (its stored results expired and the search was re-run). Fetches just
+    # the window holding it, rather than every window before it. Returns None if it can't be loaded.
+    start = index - index % WINDOW_SIZE
+    page = fetch_window(cursor.kind, cursor.params, start, WINDOW_SIZE, deadline=request_deadline())
+    if isinstance(page, Page) and index - start < len(page.records):
+        return page.records[index - start]
+    return None
 
-# For Show and related display.
-def get_people_results_rich_output(record):
+def prefetch_next_window(cursor, index):
 
-    out = '<br/><b>{}</b>'.format(escape(record.get('displayName', ''))) if record.get('displayName') else ''
-    out += '<br/>{}'.format(escape(record.get('primaryTitle', ''))) if record.get('primaryTitle') else ''
-    out += '<br/>{}'.format(escape(record.get('primaryiSearchDepartmentAffiliation', ''))) if record.get('primaryiSearchDepartmentAffiliation') else ''
-    out += '<br/>{}'.format(escape(record.get('emailAddress', ''))) if record.get('emailAddress') else ''
-    out += '<br/>{}'.format(escape(record.get('phone', ''))) if record.get('phone') else ''
-    out += '<br/>{}'.format(escape(record.get('primaryMailcode', ''))) if record.get('primaryMailcode') else ''
-    return out
+    if cursor.needs_prefetch(index):
+        prefetch(fetch_window, cursor.kind, list(cursor.params), *cursor.next_window())
+
+
+def is_display():
+
+    return bool(context.System.device.supportedInterfaces.Display)
 
-def get_people_results_card_photo_url(record):
+def static_response(name, build):
 
-    out = '{}'.format(record.get('photoUrl', ''))
+    # Responses for static intents never change, other than by whether the device has a display. Build each variant
+    # once and serve the same response object from then on.
+    key = (name, is_display())
+    out = static_responses.get(key)
+    if out is None:
+        out = static_responses[key] = build(key[1])
     return out
 
+def card_images(photo):
+
+    # Standard card image arguments. Only sent through the photo proxy, which allows cross-origin use; the photo
+    # service's own URLs don't display in the Alexa app.
+    if photo_cache is None or not photo:
+        return {}
+    return {'small_image_url': photo_url(photo, 'card_small'), 'large_image_url': photo_url(photo, 'card_large')}
+
+def prefetch_photos(records, size):
+
+    # Warm the photo cache for photos the device is about to ask for.
+    if photo_cache is not None and is_display():
+        photo_cache.prefetch([record.photoUrl for record in records], size)
+
+def list_response(cursor, start, lead_speech='', lead_card='', lead_screen='', tail_speech=''):
+
+    # Response listing the window of a title or unified search's results that starts at start. Built from the stored
+    # results, so redrawing the list doesn't cost a Solr query. The lead_* arguments go ahead of the list (the unified
+    # search's department answer); lead_screen is shown instead of the list if the window is empty.
+    ensure_loaded(cursor, start + LIST_WINDOW_SIZE)
+    session.attributes[SESSION_LIST_START] = start
+    prefetch_photos(cursor.records[start:start + LIST_WINDOW_SIZE], 'list')
+
+    ssml = session.attributes.get(SESSION_SEARCH_CONTEXT) == 'iSearchIntentSearch'
+    if ssml:
+        searchPhrase = session.attributes.get(SESSION_SLOT_SEARCH_PHRASE, '')
+        view = list_view(cursor.records, start, ssml=ssml)
+        speech_output = "For {} ... \n".format(escape(searchPhrase)) + lead_speech + view.speech
+        card_title = "Results for {}".format(searchPhrase)
+        token = 'searchPhraseResults'
+        reprompt_text = templates.static('search_re')
+    else:
+        titleSearchPhrase = session.attributes.get(SESSION_SLOT_TITLE_SEARCH_PHRASE, '')
+        view = list_view(cursor.records, start)
+        speech_output = "Results from your title search for {}... \n".format(titleSearchPhrase) + view.speech
+        card_title = "Results from your title search for {}... \n".format(titleSearchPhrase)
+        token = 'titlePhraseResults'
+        reprompt_text = templates.static('title_re')
+
+    if view.items:
+        speech_output += " If you'd like more details on one of these, ask me to open the item by number."
+    if view.end < len(cursor) or cursor.has_more():
+        speech_output += " For more results, say next."
+    speech_output += tail_speech
+
+    # Load template wrapper for results. Title search speech is plain text.
+    if ssml:
+        speech_output = templates.render('people_results', results=speech_output)
+
+    out = question(speech_output) \
+        .reprompt(reprompt_text) \
+        .simple_card(title=card_title, content=lead_card + view.card)
+    # If Show.
+    if is_display():
+        if view.items:
+            out.list_display_render(
+                template='ListTemplate1',
+                title=card_title,
+                background_image_url="https://s3.amazonaws.com/asu.amazonecho/asu_directory_images/background-4.png",
+                token=token,
+                backButton='VISIBLE',
+                listItems=view.items,
+            )
+        else:
+            out.display_render(
+                template='BodyTemplate1',
+                title=card_title,
+                token=None,
+                text={
+                    'primaryText': {
+                        'text': lead_screen,
+                        'type': "RichText"
+                    }
+                },
+                backButton='VISIBLE',
+                background_image_url="https://s3.amazonaws.com/asu.amazonecho/asu_directory_images/background-4.png"
+            )
+
+    return out
 
-def get_title_results(titleSearchPhrase=''):
-
-    # Solr title query with special boost for president in a bq (boost query).
-    # bq prevents all the "President's Professors" and similar from pushing
-    # the university president too far down into the results.
-    url_query = SOLR + PEOPLE_PATH + '?defType=edismax&q={}&q.op=AND&qf=primaryTitle%5E200.0%20titles%20primaryDepartment%5E100.0%20departments%20bio&pf=primaryTitle%5E20.0&bq=primaryDepartment:"office%20of%20the%20president"^100.0&df=primaryTitle&rows={}&wt=json'.format(titleSearchPhrase, RESPONSE_SIZE)
-
-    resp = requests.get(url_query)
-
-    if resp.status_code == 200:
-        records = resp.json()  # dict datatype
-        results = []
-        for item in records['response']['docs']:
-            record = {
-                'firstName': item.get('firstName', ''),
-                'lastName': item.get('lastName', ''),
-                'displayName': item.get('displayName', ''),
-                'primaryTitle': item.get('primaryTitle', ''),
-                'primaryiSearchDepartmentAffiliation': item.get('primaryiSearchDepartmentAffiliation', ''),
-                'emailAddress': item.get('emailAddress', ''),
-                'phone': item.get('phone', ''),
-                'primaryMailcode': item.get('primaryMailcode', ''),
-                'photoUrl': item.get('photoUrl', '')
-            }
-            results.append(record)
-        return results
 
+# BATCH NAME RESOLUTION
+#
+# Resolves many names in a few combined Solr queries, sharing the skill's local index, result cache and (for names
+# without an exact match) fuzzy people search. See batch.py. POST "first,last" lines (or a JSON {"names": [[first,
+# last], ...]} body); results stream back as JSON lines as they resolve. A malformed JSON body gets a 400 naming the
+# bad entry. Disabled unless ISEARCH_BATCH_TOKEN is set.
+batch_resolver = BatchResolver(SOLR + PEOPLE_PATH, result_cache, local_index,
+                               fallback=lambda firstName, lastName: get_people_results(firstName, lastName))
+
+@app.route('/batch', methods=['POST'])
+def batch_names():
+
+    if not BATCH_TOKEN or flask_request.headers.get('Authorization') != 'Bearer ' + BATCH_TOKEN:
+        abort(404)
+
+    if flask_request.is_json:
+        try:
+            names = parse_json_names(flask_request.get_json(silent=True))
+        except ValueError as e:
+            return Response(str(e) + '\n', status=400, mimetype='text/plain')
     else:
-        return "There as a problem querying the people directory."
+        names = list(parse_names(flask_request.get_data(as_text=True).splitlines()))
+
+    return Response(stream_with_context(to_json(result) for result in batch_resolver.resolve(names)),
+                    mimetype='application/x-ndjson')
+
+
+# PHOTO PROXY
+#
+# Serves directory photos resized for each display template, from a local disk cache, with a placeholder for missing
+# ones. Enabled by setting ISEARCH_PHOTO_BASE_URL. See photos.py.
+if photo_cache is not None:
+
+    @app.route(PHOTO_ROUTE + '/<size>/<photo_id>')
+    def photo(size, photo_id):
+
+        if size not in PHOTO_SIZES or not is_valid_id(photo_id):
+            abort(404)
+
+        found = photo_cache.get(photo_id, size)
+        response = Response(found.body, mimetype=found.content_type)
+        response.set_etag(found.etag)
+        response.headers['Cache-Control'] = 'public, max-age={}'.format(PHOTO_MAX_AGE)
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        return response.make_conditional(flask_request)
 
 
 # Dialog state, used in dialog.delegate scenarios.
@@ -190,9 +555,13 @@ def launch():
     * Card title: 'ASU iSearch Directory'
     * Card body: 'welcome_card'
     """
-    welcome_text = render_template('welcome')
-    welcome_re_text = render_template('welcome_re')
-    welcome_card_text = render_template('welcome_card')
+    return static_response('launch', build_launch_response)
+
+def build_launch_response(display):
+
+    welcome_text = templates.static('welcome')
+    welcome_re_text = templates.static('welcome_re')
+    welcome_card_text = templates.static('welcome_card')
 
     welcome_title = 'ASU iSearch Directory'
 
@@ -200,7 +569,7 @@ def launch():
         .reprompt(welcome_re_text)\
         .standard_card(title=welcome_title, text=welcome_card_text)
     # If Show.
-    if context.System.device.supportedInterfaces.Display:
+    if display:
         out.display_render(
             template='BodyTemplate1',
             title=welcome_title,
@@ -231,34 +600,54 @@ def get_isearch_people_results(firstName, lastName):
     # This is a key piece in search results handling.
     session.attributes[SESSION_SEARCH_CONTEXT] = 'iSearchIntentPeople'
 
-    reprompt_text = render_template('welcome_re')
+    reprompt_text = templates.static('welcome_re')
 
     if firstName or lastName:
-        results = get_people_results(firstName, lastName)
+        # Fix misrecognized or misspelled names before searching, rather than answering no_results and waiting for
+        # the user to try again. See speller.py.
+        corrected = correct_names(firstName, lastName)
+        if corrected:
+            firstName, lastName = corrected
+        page = get_people_results(firstName, lastName, deadline=request_deadline())
+        if isinstance(page, Page) and len(page.records) < 1 and corrected is None:
+            corrected = correct_names(firstName, lastName, found_nothing=True)
+            if corrected:
+                firstName, lastName = corrected
+                page = get_people_results(firstName, lastName, deadline=request_deadline())
     else:
         return statement("{}".format(reprompt_text))
 
-    if results == None:
-        return question("{}".format(render_template('no_results', search_phrase=firstName + ' ' + lastName.capitalize())))
-    if len(results) < 1:
-        return question("{}".format(render_template('no_results', search_phrase=firstName + ' ' + lastName.capitalize())))
+    if not isinstance(page, Page):
+        return question("{}".format(page))
+    if len(page.records) < 1:
+        request_log.annotate(results=0)
+        return question("{}".format(templates.render('no_results', search_phrase=firstName + ' ' + lastName.capitalize())))
 
-    speech_output = "For search {} {} ... \n".format(firstName, lastName.capitalize())
+    results = page.records
+
+    if corrected:
+        speech_output = "Showing results for {} {} ... \n".format(firstName, lastName.capitalize())
+    else:
+        speech_output = "For search {} {} ... \n".format(firstName, lastName.capitalize())
     card_title = "Results for {} {}".format(firstName, lastName.capitalize())
     card_output = ""
     card_photo = ""
     screen_output = ""
     range_value = PAGINATION_SIZE if len(results) >= PAGINATION_SIZE else len(results)
     for i in range(range_value):
-        speech_output += get_people_results_output(results[i])
-        card_output += get_people_results_card(results[i])
-        card_photo += get_people_results_card_photo_url(results[i])
-        screen_output += get_people_results_rich_output(results[i])
+        rendered = render_person(results[i])
+        speech_output += rendered.speech
+        card_output += rendered.card
+        card_photo += rendered.photo
+        screen_output += rendered.rich
     speech_output += " Would you like more results?"
     session.attributes[SESSION_INDEX] = PAGINATION_SIZE + 1
-    session.attributes[SESSION_RESULTS] = results
     session.attributes[SESSION_SLOT_FIRSTNAME] = firstName
     session.attributes[SESSION_SLOT_LASTNAME] = lastName
+    cursor = ResultCursor.from_page('people', [firstName, lastName], page)
+    stash_cursor(cursor)
+    prefetch_next_window(cursor, PAGINATION_SIZE + 1)
+    prefetch_photos(results[PAGINATION_SIZE:PAGINATION_SIZE * 2], 'detail')
 
     # CORS enabled photo for testing
     #card_photo='https://i.imgur.com/hYQzVO3.jpg'
@@ -267,13 +656,13 @@ def get_isearch_people_results(firstName, lastName):
     #card_photo = 'data:image/jpeg;base64,' + photo_data.read()
 
     # Load template wrapper for results.
-    speech_output = render_template('people_results', results=speech_output)
+    speech_output = templates.render('people_results', results=speech_output)
 
     if len(card_photo) > 0:
 
         out = question(speech_output) \
             .reprompt(reprompt_text) \
-            .standard_card(title=card_title, text=card_output)
+            .standard_card(title=card_title, text=card_output, **card_images(card_photo))
         # If Show.
         if context.System.device.supportedInterfaces.Display:
             out.display_render(
@@ -287,7 +676,7 @@ def get_isearch_people_results(firstName, lastName):
                     }
                 },
                 backButton='VISIBLE',
-                image=card_photo + '?size=large',
+                image=photo_url(card_photo, 'detail'),
                 #background_image_url="https://s3.amazonaws.com/asu.amazonecho/asu_directory_images/background-4.png")
                 background_image_url="https://s3.amazonaws.com/asu.amazonecho/asu_directory_images/background_image_girl_dark.png"
             )
@@ -337,13 +726,21 @@ def get_next_isearch_people_results(repeat=None):
     * Card body: dynamic response 
     """
 
-    reprompt_text = render_template('welcome_re')
+    # Title and unified search results are listed, and next moves on to the following list window.
+    if session.attributes.get(SESSION_SEARCH_CONTEXT) in LIST_CONTEXTS:
+        return get_next_list_window(repeat)
 
-    results = session.attributes[SESSION_RESULTS]
+    reprompt_text = templates.static('welcome_re')
+
+    cursor = load_cursor()
     if (repeat):
         index = session.attributes[SESSION_INDEX] - 1
     else:
         index = session.attributes[SESSION_INDEX]
+
+    # Load as far as this page needs. Usually already loaded or prefetched.
+    ensure_loaded(cursor, index + PAGINATION_SIZE)
+    results = cursor.records
     firstName = session.attributes[SESSION_SLOT_FIRSTNAME]
     lastName = session.attributes[SESSION_SLOT_LASTNAME]
 
@@ -353,19 +750,26 @@ def get_next_isearch_people_results(repeat=None):
     card_photo = ""
     screen_output = ""
     i = 0
-    if index >= len(results):
+    if index >= len(results) and cursor.has_more():
+        # More results exist but couldn't be loaded in time.
+        speech_output += " I couldn't load more results just now. Say next to try again."
+        return question("{}".format(speech_output))
+    elif index >= len(results):
         speech_output += " End of results. ...You can do another search, ask to spell a name, or say quit."
         return question("{}".format(speech_output))
 
     else:
         while i < PAGINATION_SIZE and index < len(results):
-            speech_output += get_people_results_output(results[index])
-            card_output += get_people_results_card(results[index])
-            card_photo += get_people_results_card_photo_url(results[index])
-            screen_output += get_people_results_rich_output(results[index])
+            rendered = render_person(results[index])
+            speech_output += rendered.speech
+            card_output += rendered.card
+            card_photo += rendered.photo
+            screen_output += rendered.rich
             i += 1
             index += 1
         speech_output += " For more results say next. To hear again, say repeat."
+        prefetch_next_window(cursor, index)
+        prefetch_photos(results[index:index + PAGINATION_SIZE], 'detail')
 
 
     session.attributes[SESSION_INDEX] = index
@@ -373,13 +777,13 @@ def get_next_isearch_people_results(repeat=None):
     session.attributes[SESSION_SLOT_LASTNAME] = lastName
 
     # Load template wrapper for results.
-    speech_output = render_template('people_results', results=speech_output)
+    speech_output = templates.render('people_results', results=speech_output)
 
     if len(card_photo) > 0:
 
         out = question(speech_output) \
             .reprompt(reprompt_text) \
-            .standard_card(title=card_title, text=card_output)
+            .standard_card(title=card_title, text=card_output, **card_images(card_photo))
         # If Show.
         if context.System.device.supportedInterfaces.Display:
            out.display_render(
@@ -393,7 +797,7 @@ def get_next_isearch_people_results(repeat=None):
                    }
                },
                backButton='VISIBLE',
-               image=card_photo + '?size=large',
+               image=photo_url(card_photo, 'detail'),
                #background_image_url="https://s3.amazonaws.com/asu.amazonecho/asu_directory_images/background-4.png")
                background_image_url="https://s3.amazonaws.com/asu.amazonecho/asu_directory_images/background_image_girl_dark.png"
            )
@@ -423,6 +827,25 @@ def get_next_isearch_people_results(repeat=None):
 
         return out
 
+def get_next_list_window(repeat=None):
+    """
+    (QUESTION) Responds to next/repeat on a listed search, from the stored results.
+    """
+
+    cursor = load_cursor()
+    start = session.attributes.get(SESSION_LIST_START, 0)
+    if not repeat:
+        start += LIST_WINDOW_SIZE
+
+    ensure_loaded(cursor, start + LIST_WINDOW_SIZE)
+    if start >= len(cursor) and cursor.has_more():
+        # More results exist but couldn't be loaded in time.
+        return question("I couldn't load more results just now. Say next to try again.")
+    elif start >= len(cursor):
+        return question("End of results. ...You can do another search, ask to spell a name, or say quit.")
+
+    return list_response(cursor, start)
+
 @ask.intent('iSearchIntentSpellName')
 def get_spell_isearch_names(firstNameSpelled, lastNameSpelled):
     # logging.debug("INTENT: iSearchIntentSpellName")
@@ -478,93 +901,159 @@ def get_isearch_title_results(titleSearchPhrase):
     session.attributes[SESSION_SEARCH_CONTEXT] = 'iSearchIntentTitle'
     session.attributes[SESSION_SLOT_TITLE_SEARCH_PHRASE] = titleSearchPhrase
 
-    reprompt_text = render_template('title_re')
+    reprompt_text = templates.static('title_re')
 
     # Do the search query if we have a search.
     if titleSearchPhrase:
-        results = get_title_results(titleSearchPhrase)
+        page = get_title_results(titleSearchPhrase, deadline=request_deadline())
     else:
         return question("{}".format(reprompt_text))
 
-    if results == None:
-        return question("{}".format(render_template('no_results', search_phrase=titleSearchPhrase)))
-    if len(results) < 1:
-        return question("{}".format(render_template('no_results', search_phrase=titleSearchPhrase)))
+    if not isinstance(page, Page):
+        return question("{}".format(page))
+    if len(page.records) < 1:
+        request_log.annotate(results=0)
+        return question("{}".format(templates.render('no_results', search_phrase=titleSearchPhrase)))
 
-    # Stash results in session
-    session.attributes[SESSION_RESULTS] = results
+    # Stash results server-side, with a handle in session
+    cursor = ResultCursor.from_page('title', [titleSearchPhrase], page)
+    stash_cursor(cursor)
 
     # DEBUG
-    # logging.debug("*********** RESULTS {}".format(results))
+    # logging.debug("*********** RESULTS {}".format(cursor.records))
 
-    speech_output = "Results from your title search for {}... \n".format(titleSearchPhrase)
-    card_title = "Results from your title search for {}... \n".format(titleSearchPhrase)
-    card_output = ""
-    card_photo = ""
-    screen_output = ""
+    # Speech, card and ListTemplate1 list for the first window of results. See result_view.py.
+    return list_response(cursor, 0)
 
-    # Build ListTemplate1 list of results
-    display_items = []
-    for i in range(len(results)):  # So we have an accessible key index.
-        display_items = display_items + [
-            {
-                'token': 'result_{}'.format(i),  # Tokenize by results index.
-                'image': {
-                    'sources': [
-                        {
-                            'url': results[i]['photoUrl']
-                        }
-                    ],
-                    'contentDescription': 'photo of {}'.format(results[i]['displayName'])
-                },
-                'textContent': {
-                    'primaryText': {
-                        'text': '<font size = "4">{}</font>'.format(results[i]['displayName']),
-                        'type': 'RichText'
-                    },
-                    'secondaryText': {
-                        'text': '{strtitle}{seperator}{strdept}'.format(
-                            strtitle=results[i]['primaryTitle'],
-                            seperator=', ' if results[i]['primaryTitle'] and results[i]['primaryiSearchDepartmentAffiliation'] else '',
-                            strdept=results[i]['primaryiSearchDepartmentAffiliation']),
-                        'type': 'PlainText'
-                    },
-                }
-            }
-        ]
-        # Build speech output. Only first 5 results for voice and card situations.
-        if (i < 5):
-            speech_output += "{}. {}".format(i + 1, results[i]['displayName'])  # Item number and displayName
-            card_output += "{}. {}".format(i + 1, results[i]['displayName'])
-            if (results[i]['primaryTitle']):  # primaryTitle if we have it
-                speech_output += " is {}".format(results[i]['primaryTitle'])
-                card_output += ", {}".format(results[i]['primaryTitle'])
-            if (results[i]['primaryiSearchDepartmentAffiliation']):  # Dept affiliation if we have it
-                speech_output += " of {},".format( results[i]['primaryiSearchDepartmentAffiliation'])
-                card_output += ", {}\r\n".format(results[i]['primaryiSearchDepartmentAffiliation'])
-            card_photo += get_people_results_card_photo_url(results[i])
-
-    speech_output += " If you'd like more details on one of these, ask me to open the item by number."
+@ask.intent('iSearchIntentDepartment')
+def get_isearch_department_results(deptName):
+    # logging.debug("INTENT: iSearchIntentDepartment")
+    """
+    (QUESTION) Responds to a department phone/info lookup.
+    Templates:
+    * Initial statement: dynamic response
+    * Reprompt statement: 'dept_re'
+    * No results: 'no_results'
+    * Results: 'people_results'
+    * Card title: 'Results for department [department name]'
+    * Card body: dynamic response
+    """
 
-    # DEBUG
-    # logging.debug("*********** ITEMS {}".format(display_items))
+    session.attributes[SESSION_SEARCH_CONTEXT] = 'iSearchIntentDepartment'
+    session.attributes[SESSION_SLOT_DEPTNAME] = deptName
+
+    reprompt_text = templates.static('dept_re')
+
+    if deptName:
+        results = get_department_results(deptName, deadline=request_deadline())
+    else:
+        return question("{}".format(reprompt_text))
+
+    if not isinstance(results, list):
+        return question("{}".format(results))
+    request_log.annotate(results=len(results))
+    if len(results) < 1:
+        return question("{}".format(templates.render('no_results', search_phrase=deptName)))
+
+    speech_output = "For department {} ... \n".format(escape(deptName))
+    card_title = "Results for department {}".format(deptName)
+    rendered = render_department(results[0])
+    speech_output += rendered.speech
+    card_output = rendered.card
+    screen_output = rendered.rich
+
+    # Mention close matches so the user can ask again more precisely.
+    if len(results) > 1:
+        speech_output += "<break/> I also found {}.".format(', '.join(escape(d.name) for d in results[1:]))
+        card_output += "\n\nAlso found:\n{}".format('\n'.join(escape(d.name) for d in results[1:]))
+
+    # Load template wrapper for results.
+    speech_output = templates.render('people_results', results=speech_output)
 
     out = question(speech_output) \
         .reprompt(reprompt_text) \
         .simple_card(title=card_title, content=card_output)
     # If Show.
     if context.System.device.supportedInterfaces.Display:
-        out.list_display_render(
-            template='ListTemplate1',
+        out.display_render(
+            template='BodyTemplate1',
             title=card_title,
-            background_image_url="https://s3.amazonaws.com/asu.amazonecho/asu_directory_images/background-4.png",
-            token='titlePhraseResults',
+            token=None,
+            text={
+                'primaryText': {
+                    'text': screen_output,
+                    'type': "RichText"
+                }
+            },
             backButton='VISIBLE',
-            listItems=display_items,
+            background_image_url="https://s3.amazonaws.com/asu.amazonecho/asu_directory_images/background-4.png"
         )
 
     return out
 
+@ask.intent('iSearchIntentSearch')
+def get_isearch_unified_results(searchPhrase):
+    # logging.debug("INTENT: iSearchIntentSearch")
+    """
+    (QUESTION) Responds to an open "search for [phrase]" utterance by searching people, titles and departments at
+    once, so the user doesn't need to know which kind of search to ask for.
+    Templates:
+    * Initial statement: dynamic response
+    * Display: ListTemplate1, or BodyTemplate1 for a department only answer
+    * Reprompt statement: 'search_re'
+    * No results: 'no_results'
+    * Results: 'people_results'
+    * Card title: 'Results for [search phrase]'
+    * Card body: dynamic response
+    """
+
+    # Utterance examples (noted for testing)
+    #   search for {michael crow}
+    #   search for {chief information officer}
+    #   search for {uto}
+
+    # Results are listed like title search results, and share its detail and back to results handling.
+    session.attributes[SESSION_SEARCH_CONTEXT] = 'iSearchIntentSearch'
+    session.attributes[SESSION_SLOT_SEARCH_PHRASE] = searchPhrase
+
+    reprompt_text = templates.static('search_re')
+
+    if searchPhrase:
+        unified = get_unified_results(searchPhrase, deadline=request_deadline())
+    else:
+        return question("{}".format(reprompt_text))
+
+    if not isinstance(unified, tuple):
+        return question("{}".format(unified))
+    results, departments, timed_out = unified
+    if len(results) < 1 and len(departments) < 1:
+        if timed_out:
+            return question("The directory is slow to answer right now. Please ask again in a moment.")
+        return question("{}".format(templates.render('no_results', search_phrase=searchPhrase)))
+
+    # Stash results server-side, with a handle in session
+    cursor = ResultCursor('search', [searchPhrase], results, len(results))
+    stash_cursor(cursor)
+
+    lead_speech = ""
+    lead_card = ""
+    lead_screen = ""
+
+    # Best department match first, as a department lookup answers in full without a follow-up.
+    if departments:
+        rendered = render_department(departments[0])
+        lead_speech += "The department " + rendered.speech + "<break/> "
+        lead_card += rendered.card.lstrip('\n') + "\n\n"
+        lead_screen += rendered.rich
+
+    tail_speech = ""
+    if timed_out:
+        # Searches that missed the budget finish in the background and land in the result cache.
+        tail_speech = " Some results are still coming in. Ask again for a complete list."
+
+    # People results follow as a ListTemplate1 list. See result_view.py.
+    return list_response(cursor, 0, lead_speech, lead_card, lead_screen, tail_speech)
+
 @ask.intent('iSearchIntentItemDetail')
 def get_isearch_item_detail_intent(itemNumber = None):
     # logging.debug("INTENT: iSearchIntentItemDetail")
@@ -588,22 +1077,30 @@ def get_isearch_item_detail_intent(itemNumber = None):
     # added another search type, we could use the same numeric selection
     # utterance mapping and just manage handling based on context.
 
-    reprompt_text = render_template('welcome_re')
+    reprompt_text = templates.static('welcome_re')
 
     # If we arrived by touch, we'll need to extract itemNumber from the token
     # as it won't be in itemNumber slot from an utterance.
     if (itemNumber == None):
-        # Cut the "result_" off the token, then cast as int.
-        itemNumber = int(request['token'][7:]) + 1  # +1 to match voice selection. logging.debug("*********** NOW itemNumber {}".format(itemNumber))
+        # Tokens carry the result index, see result_view.py.
+        itemNumber = token_index(request['token']) + 1  # +1 to match voice selection. logging.debug("*********** NOW itemNumber {}".format(itemNumber))
 
     # Route handling based on context
-    if (session.attributes[SESSION_SEARCH_CONTEXT] == 'iSearchIntentTitle'):
+    if (session.attributes[SESSION_SEARCH_CONTEXT] in LIST_CONTEXTS):
 
-        # Obtain the results previously stashed in session.
-        session_results = session.attributes[SESSION_RESULTS]
+        # Obtain the results previously stashed for this session.
+        cursor = load_cursor()
 
-        # Use itemNumber as index for pinpointing desired session_results.
+        # Use itemNumber as index for pinpointing the desired result. Only numbers up to the end of the list
+        # windows the user has been shown are accepted, so a stray "number 9999" doesn't page through Solr.
         index = int(itemNumber) - 1  # Realign to our index
+        shown = min(cursor.total, session.attributes.get(SESSION_LIST_START, 0) + LIST_WINDOW_SIZE)
+        record = None
+        if 0 <= index < shown:
+            record = cursor.records[index] if index < len(cursor) else load_record(cursor, index)
+        if record is None:
+            return question("I don't have an item number {} in these results. Which number would you like?".format(
+                itemNumber)).reprompt(reprompt_text)
 
         speech_output = ""
         card_title = ""
@@ -611,20 +1108,21 @@ def get_isearch_item_detail_intent(itemNumber = None):
         card_photo = ""
         screen_output = ""
 
-        speech_output += get_people_results_output(session_results[index])
-        card_output += get_people_results_card(session_results[index])
-        card_photo += get_people_results_card_photo_url(session_results[index])
-        screen_output += get_people_results_rich_output(session_results[index])
+        rendered = render_person(record)
+        speech_output += rendered.speech
+        card_output += rendered.card
+        card_photo += rendered.photo
+        screen_output += rendered.rich
         speech_output += " "
 
         # Load template wrapper for people detail/results.
-        speech_output = render_template('people_results', results=speech_output)
+        speech_output = templates.render('people_results', results=speech_output)
 
         if len(card_photo) > 0:  # If we have a card photo
 
             out = question(speech_output) \
                 .reprompt(reprompt_text) \
-                .standard_card(title=card_title, text=card_output)
+                .standard_card(title=card_title, text=card_output, **card_images(card_photo))
             # If Show.
             if context.System.device.supportedInterfaces.Display:
                 out.display_render(
@@ -638,7 +1136,7 @@ def get_isearch_item_detail_intent(itemNumber = None):
                         }
                     },
                     backButton='VISIBLE',
-                    image=card_photo + '?size=large',
+                    image=photo_url(card_photo, 'detail'),
                     background_image_url="https://s3.amazonaws.com/asu.amazonecho/asu_directory_images/background_image_girl_dark.png"
                 )
 
@@ -687,11 +1185,17 @@ def get_isearch_back_to_results_intent():
 
     # Route to results based on SESSION_SEARCH_CONTEXT
 
-    if session.attributes[SESSION_SEARCH_CONTEXT] == 'iSearchIntentTitle':
+    if session.attributes[SESSION_SEARCH_CONTEXT] in LIST_CONTEXTS:
 
-        titleSearchPhrase = session.attributes[SESSION_SLOT_TITLE_SEARCH_PHRASE]
+        # Redraw the list window the user was on from the stored results, without searching again.
+        cursor = load_cursor()
+        if len(cursor) < 1:
+            return launch()
+        start = session.attributes.get(SESSION_LIST_START, 0)
+        if start >= len(cursor):
+            start = 0
 
-        return get_isearch_title_results(titleSearchPhrase)
+        return list_response(cursor, start)
 
     if session.attributes[SESSION_SEARCH_CONTEXT] == 'iSearchIntentPeople':
 
@@ -713,35 +1217,32 @@ def element_selected():
     # Get the selected token.
     token = request['token']
 
-    # Setup token-to-details-intent mappings for all results.
     # We create tokens in the pattern of "result_N" where N is the numeric
-    # index mapping to our list items.
+    # index mapping to our list items, in any list window.
     # All tokens map to the same detail method for processing. The detail
     # method (get_isearch_item_detail_intent()) extrapolates indexes from
     # tokens and displays the appropriate result from the results stored
     # in the session by context (aka intent type).
-    token_to_intent_lookup = {}
-    for i in range(RESPONSE_SIZE):
-        # Same detail method for all.
-        token_to_intent_lookup['result_{}'.format(i)] = get_isearch_item_detail_intent
+    if token_index(token) is not None:
+        return get_isearch_item_detail_intent()
 
-    return token_to_intent_lookup[token]()
+    return launch()
 
 
 @ask.intent('AMAZON.StopIntent')
 def stop():
     # logging.debug("INTENT: StopIntent")
-    return statement("Goodbye")
+    return static_response('stop', lambda display: statement("Goodbye"))
 
 @ask.intent('AMAZON.CancelIntent')
 def cancel():
     # logging.debug("INTENT: CancelIntent")
-    return statement("Goodbye")
+    return static_response('cancel', lambda display: statement("Goodbye"))
 
 @ask.intent('AMAZON.HelpIntent')
 def help():
     # logging.debug("INTENT: HelpIntent")
-    return question(render_template('help_text'))
+    return static_response('help', lambda display: question(templates.static('help_text')))
 
 @ask.intent('AMAZON.NavigateSettingsIntent')
 def handle_navigate_settings():
@@ -819,12 +1320,13 @@ def start_over():
 def session_ended():
     logging.debug("INTENT: session_ended")
     """
-    Returns an empty for `session_ended`.
+    Returns an empty for `session_ended`. Also drops this session's stored results.
     .. warning::
     The status of this is somewhat controversial. The `official documentation`_ states that you cannot return a response
     to ``SessionEndedRequest``. However, if it only returns a ``200/OK``, the quit utterance (which is a default test
     utterance!) will return an error and the skill will not validate.
     """
+    result_store.drop_session(session.sessionId)
     # return "{}", 200
     return statement("")
 
@@ -0,0 +1,219 @@
+import os
+import sys
+import csv
+import json
+import time
+import logging
+from array import array
+
+from records import PERSON_FIELDS, PERSON_FL, Page, person_from_doc
+
+# Local in-memory directory index.
+#
+# An optional Solr-free fast path for name lookups. A snapshot of the directory is loaded into compact structures: one
+# Person tuple per entry, and inverted indexes (name key -> array of record positions) on first and last name. To
+# mirror the phonetic matching asudir-solr does, names are also indexed by their Double Metaphone keys. Lookups that
+# find nothing return None and the caller falls back to Solr.
+#
+# Phonetic matching needs the Metaphone package (pip install Metaphone). Without it only exact (case and punctuation
+# insensitive) name matches are made.
+#
+# Snapshots can be exported from Solr as CSV:
+# https://asudir-solr.asu.edu/asudir/directory/select?q=*:*&fl=<PERSON_FL>&wt=csv&rows=50000
+# or saved as JSON (a Solr select response, or a list of documents). Point ISEARCH_LOCAL_INDEX at the file to enable
+# the index in isearch.py.
+
+LOCAL_INDEX_PATH = os.environ.get('ISEARCH_LOCAL_INDEX', '')
+
+try:
+    from metaphone import doublemetaphone
+except ImportError:
+    doublemetaphone = None
+
+log = logging.getLogger(__name__)
+
+
+def name_key(name):
+    """
+    Case-folded name with spaces and punctuation removed, so "O'Brien" and "obrien" share a key.
+    """
+    return ''.join(ch for ch in (name or '').casefold() if ch.isalnum())
+
+
+def name_parts(name):
+    """
+    Keys for a name and, for multi-part names such as "Garcia-Lopez", each of its parts.
+    """
+    keys = [name_key(name)]
+    parts = (name or '').replace('-', ' ').split()
+    if len(parts) > 1:
+        keys.extend(name_key(p) for p in parts)
+    return [k for k in keys if k]
+
+
+def phonetic_keys(name):
+    if doublemetaphone is None or not name:
+        return ()
+    return tuple(k for k in doublemetaphone(name) if k)
+
+
+class DirectoryIndex(object):
+
+    def __init__(self, records):
+        self.records = list(records)
+        self.loaded_at = time.time()
+        self._first = self._build(lambda p: name_parts(p.firstName))
+        self._last = self._build(lambda p: name_parts(p.lastName))
+        self._first_phonetic = self._build(lambda p: phonetic_keys(p.firstName))
+        self._last_phonetic = self._build(lambda p: phonetic_keys(p.lastName))
+
+    def _build(self, keys_for):
+        postings = {}
+        for i, record in enumerate(self.records):
+            for key in set(keys_for(record)):
+                postings.setdefault(key, []).append(i)
+        return dict((k, array('I', v)) for k, v in postings.items())
+
+    @classmethod
+    def from_docs(cls, docs):
+        return cls(person_from_doc(doc) for doc in docs)
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, newline='', encoding='utf-8') as f:
+            return cls.from_docs(csv.DictReader(f))
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data['response']['docs']
+        return cls.from_docs(data)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a CSV or JSON snapshot, picked by file extension.
+        """
+        if path.endswith('.json'):
+            return cls.from_json(path)
+        return cls.from_csv(path)
+
+    def __len__(self):
+        return len(self.records)
+
+    def match(self, firstName='', lastName=''):
+        """
+        Returns record positions matching the name, best first: exact matches, then exact/phonetic mixes, then
+        phonetic matches.
+        """
+        first = self._postings(self._first, name_parts(firstName)[:1])
+        last = self._postings(self._last, name_parts(lastName)[:1])
+        first_phonetic = self._postings(self._first_phonetic, phonetic_keys(firstName))
+        last_phonetic = self._postings(self._last_phonetic, phonetic_keys(lastName))
+
+        if firstName and lastName:
+            tiers = [_intersect(a, b) for a, b in
+                     ((last, first), (last, first_phonetic), (last_phonetic, first), (last_phonetic, first_phonetic))]
+        elif lastName:
+            tiers = [last, last_phonetic]
+        elif firstName:
+            tiers = [first, first_phonetic]
+        else:
+            return []
+
+        seen = set()
+        matches = []
+        for tier in tiers:
+            # Snapshot order within a tier.
+            for i in sorted(tier):
+                if i not in seen:
+                    seen.add(i)
+                    matches.append(i)
+        return matches
+
+    def _postings(self, index, keys):
+        if len(keys) == 1:
+            return index.get(keys[0], ())
+        out = set()
+        for key in keys:
+            out.update(index.get(key, ()))
+        return out
+
+    def search(self, firstName='', lastName='', start=0, rows=20):
+        """
+        Returns a Page of matching records, or None if nothing matched.
+        """
+        matches = self.match(firstName, lastName)
+        if not matches:
+            return None
+        return Page(start, [self.records[i] for i in matches[start:start + rows]], len(matches))
+
+    def memory_usage(self):
+        """
+        Approximate bytes held by the records and by the indexes.
+        """
+        seen = set()
+
+        def size(obj):
+            if id(obj) in seen:
+                return 0
+            seen.add(id(obj))
+            return sys.getsizeof(obj)
+
+        records = size(self.records)
+        for record in self.records:
+            records += size(record) + sum(size(v) for v in record)
+
+        index = 0
+        for postings in (self._first, self._last, self._first_phonetic, self._last_phonetic):
+            index += size(postings) + sum(size(k) + size(v) for k, v in postings.items())
+
+        return {
+            'records': len(self.records),
+            'keys': sum(len(p) for p in (self._first, self._last, self._first_phonetic, self._last_phonetic)),
+            'record_bytes': records,
+            'index_bytes': index,
+            'total_bytes': records + index,
+            'phonetic': doublemetaphone is not None
+        }
+
+
+def _intersect(a, b):
+    # Walk the shorter posting list, probing the longer one.
+    if not a or not b:
+        return ()
+    if len(a) > len(b):
+        a, b = b, a
+    b = b if isinstance(b, set) else set(b)
+    return [i for i in a if i in b]
+
+
+def load_local_index(path=LOCAL_INDEX_PATH):
+    """
+    Loads the snapshot at path, or returns None if no path is configured or it can't be loaded.
+    """
+    if not path:
+        return None
+    try:
+        index = DirectoryIndex.load(path)
+    except (IOError, OSError, ValueError, KeyError) as e:
+        log.warning("Couldn't load local directory index from {}: {}".format(path, e))
+        return None
+    log.info("Loaded local directory index: {}".format(index.memory_usage()))
+    return index
+
+
+if __name__ == '__main__':
+    # Print the export URL for a snapshot, or load one and report its size.
+    #   $ python local_index.py
+    #   $ python local_index.py snapshot.csv
+    if len(sys.argv) < 2:
+        print('https://asudir-solr.asu.edu/asudir/directory/select?q=*:*&fl={}&wt=csv&rows=50000'.format(PERSON_FL))
+    else:
+        started = time.time()
+        idx = DirectoryIndex.load(sys.argv[1])
+        print('loaded {} records in {:.2f}s'.format(len(idx), time.time() - started))
+        print(json.dumps(idx.memory_usage(), indent=2))
+        print('fields: {}'.format(', '.join(PERSON_FIELDS)))
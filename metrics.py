@@ -0,0 +1,239 @@
+import os
+import time
+import bisect
+import threading
+
+# Per-turn latency metrics.
+#
+# Each request to the skill is a turn. Code on the request path wraps its phases in span() (Solr network time, JSON
+# decode, record mapping, rendering, response serialization). Span times are summed per phase for the turn, and when
+# the turn ends each phase total, plus the whole turn's time, goes into a histogram labelled with the intent name and
+# device type (display or voice). install() hooks this into the Flask app, and, if METRICS_EXPOSE is set, serves the
+# histograms in Prometheus text format at METRICS_ROUTE. The route has no auth of its own, so it's off by default;
+# turn it on only where the skill's endpoint isn't public, or where something in front of it guards the route.
+#
+# Work handed to other threads joins the turn's spans if it's wrapped with bind(). Spans outside any turn (background
+# prefetches and revalidations) are recorded under intent="background".
+#
+# Set ISEARCH_METRICS=0 to turn metrics off.
+
+METRICS_ENABLED = os.environ.get('ISEARCH_METRICS', '1') != '0'
+METRICS_EXPOSE = os.environ.get('ISEARCH_METRICS_EXPOSE', '0') == '1'
+METRICS_ROUTE = os.environ.get('ISEARCH_METRICS_ROUTE', '/metrics')
+
+# Histogram bucket upper bounds, seconds.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_local = threading.local()
+
+
+class Histogram(object):
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, buckets=BUCKETS):
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds, buckets=BUCKETS):
+        self.counts[bisect.bisect_left(buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class Registry(object):
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}  # (phase, intent, device) -> Histogram
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def observe(self, phase, intent, device, seconds):
+        key = (phase, intent, device)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds, self.buckets)
+
+    def add_collector(self, fn):
+        """
+        Adds a callable returning {metric_name: value} gauges to include in the exposition, e.g. cache counters.
+        """
+        self._collectors.append(fn)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def exposition(self):
+        """
+        Returns all metrics in Prometheus text format.
+        """
+        lines = [
+            '# HELP isearch_phase_seconds Time per turn spent in each phase, by intent and device.',
+            '# TYPE isearch_phase_seconds histogram',
+        ]
+        with self._lock:
+            histograms = sorted((key, list(h.counts), h.sum, h.count) for key, h in self._histograms.items())
+        for (phase, intent, device), counts, total, count in histograms:
+            labels = 'phase="{}",intent="{}",device="{}"'.format(phase, intent, device)
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append('isearch_phase_seconds_bucket{{{},le="{}"}} {}'.format(labels, bound, cumulative))
+            lines.append('isearch_phase_seconds_bucket{{{},le="+Inf"}} {}'.format(labels, count))
+            lines.append('isearch_phase_seconds_sum{{{}}} {}'.format(labels, total))
+            lines.append('isearch_phase_seconds_count{{{}}} {}'.format(labels, count))
+        for collector in self._collectors:
+            for name, value in sorted(collector().items()):
+                lines.append('# TYPE {} gauge'.format(name))
+                lines.append('{} {}'.format(name, value))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class Turn(object):
+    """
+    Phase totals for one request.
+    """
+    __slots__ = ('started', 'phases', '_lock')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+class span(object):
+    """
+    Times a block into a phase of the current turn:
+
+        with span('solr'):
+            ...
+    """
+    __slots__ = ('phase', 'started')
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if METRICS_ENABLED:
+            elapsed = time.perf_counter() - self.started
+            turn = getattr(_local, 'turn', None)
+            if turn is not None:
+                turn.add(self.phase, elapsed)
+            else:
+                registry.observe(self.phase, 'background', 'none', elapsed)
+        return False
+
+
+def timed(phase, fn):
+    """
+    Wraps fn so each call is timed into phase.
+    """
+    def wrapper(*args, **kwargs):
+        with span(phase):
+            return fn(*args, **kwargs)
+    wrapper.__name__ = fn.__name__
+    wrapper.__doc__ = fn.__doc__
+    wrapper.__wrapped__ = fn
+    return wrapper
+
+
+def bind(fn):
+    """
+    Wraps fn to run in the current turn, for handing to another thread.
+    """
+    turn = getattr(_local, 'turn', None)
+    if turn is None:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        previous = getattr(_local, 'turn', None)
+        _local.turn = turn
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.turn = previous
+    return wrapper
+
+
+def start_turn():
+    _local.turn = Turn()
+
+
+def current_phase(phase):
+    """
+    Seconds spent in phase so far this turn, or None outside a turn.
+    """
+    turn = getattr(_local, 'turn', None)
+    if turn is None:
+        return None
+    with turn._lock:
+        return turn.phases.get(phase, 0.0)
+
+
+def end_turn(intent, device):
+    turn = getattr(_local, 'turn', None)
+    if turn is None:
+        return
+    _local.turn = None
+    elapsed = time.perf_counter() - turn.started
+    with turn._lock:
+        phases = list(turn.phases.items())
+    for phase, seconds in phases:
+        registry.observe(phase, intent, device, seconds)
+    registry.observe('total', intent, device, elapsed)
+
+
+def install(app, describe, expose=METRICS_EXPOSE):
+    """
+    Hooks turn timing into a Flask app and, if expose is set, adds the metrics route. describe() is called at the end
+    of each request and returns its (intent, device) labels.
+    """
+    if not METRICS_ENABLED:
+        return
+
+    from flask import request, Response
+
+    @app.before_request
+    def start_metrics_turn():
+        if request.path != METRICS_ROUTE:
+            start_turn()
+
+    @app.after_request
+    def end_metrics_turn(response):
+        if getattr(_local, 'turn', None) is not None:
+            try:
+                intent, device = describe()
+            except Exception:
+                intent, device = 'unknown', 'none'
+            end_turn(intent, device)
+        return response
+
+    if expose:
+        @app.route(METRICS_ROUTE)
+        def metrics():
+            return Response(registry.exposition(), mimetype='text/plain; version=0.0.4')
+
+    # Flask-Ask serializes responses with flask.json, which uses the app's JSON encoder. Time its encode() as the
+    # serialize phase.
+    base = getattr(app, 'json_encoder', None)
+    if base is not None:
+        class TimedJSONEncoder(base):
+            def encode(self, o):
+                with span('serialize'):
+                    return base.encode(self, o)
+        app.json_encoder = TimedJSONEncoder
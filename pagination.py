@@ -0,0 +1,86 @@
+import os
+import logging
+
+from records import people_from_session
+
+# Lazy, windowed pagination over search results.
+#
+# A search only fetches a small first window from Solr (start/rows). As the user steps through results, the cursor
+# asks for the next window, and once they get within PREFETCH_MARGIN results of the end of what's loaded, that next
+# window is fetched in the background so it's ready (or in flight, and joined through the result cache's
+# single-flight) by the time they say "next". Result sets are no longer capped at RESPONSE_SIZE.
+#
+# Note that on Lambda, background work is frozen once the response is returned and resumes on the container's next
+# invocation, which for a "next" chain is typically the following turn.
+
+FIRST_WINDOW_SIZE = int(os.environ.get('ISEARCH_FIRST_WINDOW_SIZE', 5))
+WINDOW_SIZE = int(os.environ.get('ISEARCH_WINDOW_SIZE', 10))
+PREFETCH_MARGIN = int(os.environ.get('ISEARCH_PREFETCH_MARGIN', 2))
+PREFETCH_WORKERS = int(os.environ.get('ISEARCH_PREFETCH_WORKERS', 2))
+
+log = logging.getLogger(__name__)
+
+_executor = None
+
+
+class ResultCursor(object):
+    """
+    The loaded part of a search's results, plus what's needed to load more. Converts to and from plain JSON state so
+    it can be kept in result_store.
+    """
+    __slots__ = ('kind', 'params', 'records', 'total')
+
+    def __init__(self, kind, params, records=None, total=0):
+        self.kind = kind
+        self.params = list(params)
+        self.records = list(records or [])
+        self.total = total
+
+    @classmethod
+    def from_page(cls, kind, params, page):
+        return cls(kind, params, page.records, page.total)
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state['kind'], state['params'], people_from_session(state['records']), state['total'])
+
+    def to_state(self):
+        return {'kind': self.kind, 'params': self.params, 'records': self.records, 'total': self.total}
+
+    def __len__(self):
+        return len(self.records)
+
+    def has_more(self):
+        return len(self.records) < self.total
+
+    def next_window(self):
+        """
+        Returns (start, rows) for the next window to fetch.
+        """
+        return len(self.records), WINDOW_SIZE
+
+    def extend(self, page):
+        # Ignore stale or duplicate windows, e.g. a prefetch that landed after a foreground fetch.
+        if page.start == len(self.records):
+            self.records.extend(page.records)
+            self.total = page.total
+
+    def needs_prefetch(self, index):
+        return self.has_more() and index >= len(self.records) - PREFETCH_MARGIN
+
+
+def prefetch(fn, *args):
+    """
+    Runs fn(*args) on the shared background pool. Failures are logged and otherwise ignored.
+    """
+    global _executor
+    if _executor is None:
+        # Imported here to keep it off the cold start path.
+        from concurrent.futures import ThreadPoolExecutor
+        _executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS)
+    _executor.submit(fn, *args).add_done_callback(_log_failure)
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        log.warning("Prefetch failed: {}".format(future.exception()))
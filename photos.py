@@ -0,0 +1,449 @@
+import io
+import os
+import re
+import json
+import time
+import zlib
+import glob
+import struct
+import hashlib
+import logging
+import threading
+from collections import namedtuple, OrderedDict
+from functools import lru_cache
+from contextlib import contextmanager
+
+# Photo proxy and thumbnail cache.
+#
+# Directory photos come from the iSearch photo service (PHOTO_SOURCE_URL). Rather than have every Show pull full size
+# photos straight from it, up to a list's worth per screen, the skill can serve them itself: photo_url() points list
+# items, detail views and app cards at PHOTO_ROUTE on the skill, which answers from a local disk cache of the
+# originals, resized to each template's dimensions (PHOTO_SIZES). Cached originals are revalidated with the service's
+# ETag/Last-Modified once PHOTO_TTL has passed. Missing photos, and records without one, get a placeholder image.
+# Responses carry an ETag and Cache-Control, and allow cross-origin use so app cards can show them.
+#
+# When a list is shown, its photos are prefetched concurrently on PHOTO_WORKERS threads, so they're cached by the time
+# the device asks for them. (On Lambda, background work is frozen once the response is returned; see pagination.py.)
+#
+# The proxy is off unless ISEARCH_PHOTO_BASE_URL is set to the skill's public base URL (without the route), e.g.
+# https://abc123.execute-api.us-west-2.amazonaws.com/dev. Off, photo_url() returns the service URLs as before.
+#
+# The disk cache is capped at PHOTO_CACHE_MAX_BYTES and PHOTO_CACHE_MAX_PHOTOS photos (an original and its resized
+# copies count as one), evicting the least recently used photos first, so it can't fill Lambda's small /tmp. Photo
+# metadata kept in memory is capped at the same number of photos.
+#
+# Resizing needs Pillow (pip install Pillow). Without it, originals are served at their own size.
+
+PHOTO_BASE_URL = os.environ.get('ISEARCH_PHOTO_BASE_URL', '').rstrip('/')
+PHOTO_ROUTE = os.environ.get('ISEARCH_PHOTO_ROUTE', '/photos')
+PHOTO_SOURCE_URL = os.environ.get('ISEARCH_PHOTO_SOURCE_URL', 'https://webapp4.asu.edu/photo-ws/directory_photo/')
+PHOTO_CACHE_DIR = os.environ.get('ISEARCH_PHOTO_CACHE_DIR', '/tmp/isearch_photos')
+PHOTO_CACHE_MAX_BYTES = int(os.environ.get('ISEARCH_PHOTO_CACHE_MAX_BYTES', 100 * 1024 * 1024))
+PHOTO_CACHE_MAX_PHOTOS = int(os.environ.get('ISEARCH_PHOTO_CACHE_MAX_PHOTOS', 5000))
+
+# Seconds. How long a cached original is used before it's revalidated, how long a missing photo stays missing, and the
+# max-age devices are told to cache responses for.
+PHOTO_TTL = float(os.environ.get('ISEARCH_PHOTO_TTL', 24 * 60 * 60))
+PHOTO_MISSING_TTL = float(os.environ.get('ISEARCH_PHOTO_MISSING_TTL', 60 * 60))
+PHOTO_MAX_AGE = int(os.environ.get('ISEARCH_PHOTO_MAX_AGE', 24 * 60 * 60))
+
+PHOTO_WORKERS = int(os.environ.get('ISEARCH_PHOTO_WORKERS', 4))
+PHOTO_TIMEOUT = float(os.environ.get('ISEARCH_PHOTO_TIMEOUT', 2.0))
+PHOTO_QUALITY = int(os.environ.get('ISEARCH_PHOTO_QUALITY', 85))
+
+# Bounding box (width, height) per use. ListTemplate1 item images, BodyTemplate2 images, and standard card images.
+PHOTO_SIZES = {
+    'list': (88, 88),
+    'detail': (340, 340),
+    'card_small': (720, 480),
+    'card_large': (1200, 800),
+}
+
+# What the service URLs get without the proxy, as the skill has always asked for large photos in detail views.
+SOURCE_SUFFIXES = {
+    'detail': '?size=large',
+}
+
+PLACEHOLDER_ID = '.placeholder'
+PLACEHOLDER_COLOR = (200, 200, 200)
+
+# Photo IDs are the path under PHOTO_SOURCE_URL. Anything else isn't proxied, so the route can't be used to fetch
+# arbitrary URLs.
+PHOTO_ID_RE = re.compile(r'^[A-Za-z0-9_-][A-Za-z0-9._-]*$')
+
+log = logging.getLogger(__name__)
+
+Photo = namedtuple('Photo', ('body', 'content_type', 'etag'))
+
+_pil = None  # PIL.Image, imported on first resize; False if Pillow isn't installed
+
+
+def photo_id(url):
+    """
+    Returns the photo ID for a photo service URL, or None if it isn't one the proxy serves.
+    """
+    if url and url.startswith(PHOTO_SOURCE_URL):
+        rest = url[len(PHOTO_SOURCE_URL):]
+        if PHOTO_ID_RE.match(rest):
+            return rest
+    return None
+
+
+def photo_url(url, size):
+    """
+    URL for a record's photo at one of PHOTO_SIZES: through the proxy if it's enabled, otherwise the photo service's
+    own URL. URLs the proxy doesn't serve are also left on the photo service.
+    """
+    if not url:
+        return '{}{}/{}/{}'.format(PHOTO_BASE_URL, PHOTO_ROUTE, size, PLACEHOLDER_ID) if PHOTO_BASE_URL else url
+    pid = photo_id(url) if PHOTO_BASE_URL else None
+    if pid is None:
+        return url + SOURCE_SUFFIXES.get(size, '')
+    return '{}{}/{}/{}'.format(PHOTO_BASE_URL, PHOTO_ROUTE, size, pid)
+
+
+def is_valid_id(pid):
+    return pid == PLACEHOLDER_ID or bool(PHOTO_ID_RE.match(pid))
+
+
+def _png(width, height, rgb):
+    # A solid color PNG, built with the standard library.
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    row = b'\x00' + bytes(rgb) * width
+    return b''.join((
+        b'\x89PNG\r\n\x1a\n',
+        chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)),
+        chunk(b'IDAT', zlib.compress(row * height, 9)),
+        chunk(b'IEND', b''),
+    ))
+
+
+@lru_cache(maxsize=None)
+def placeholder(size):
+    width, height = PHOTO_SIZES[size]
+    return Photo(_png(width, height, PLACEHOLDER_COLOR), 'image/png', 'placeholder-{}'.format(size))
+
+
+def _image_module():
+    global _pil
+    if _pil is None:
+        try:
+            from PIL import Image
+            _pil = Image
+        except ImportError:
+            log.warning("Pillow isn't installed, photos are served at their original size")
+            _pil = False
+    return _pil
+
+
+def resize(body, size):
+    """
+    Scales an image down to fit the size's bounding box, as JPEG. Returns None if it can't be resized.
+    """
+    Image = _image_module()
+    if not Image:
+        return None
+    try:
+        image = Image.open(io.BytesIO(body))
+        image.draft('RGB', PHOTO_SIZES[size])  # lets JPEG decoding skip straight to a smaller scale
+        image = image.convert('RGB')
+        image.thumbnail(PHOTO_SIZES[size], Image.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, 'JPEG', quality=PHOTO_QUALITY, optimize=True)
+        return out.getvalue()
+    except Exception as e:
+        log.warning("Couldn't resize photo: {}".format(e))
+        return None
+
+
+class PhotoCache(object):
+    """
+    Disk cache of photo service originals and their resized variants.
+
+    For photo ID "abc", CACHE_DIR holds "abc.json" (upstream ETag, Last-Modified, content type, when it was last
+    checked, and whether it was missing), "abc.orig" (the original) and "abc@list.jpg" and so on (the resized copies).
+    """
+
+    def __init__(self, cache_dir=PHOTO_CACHE_DIR, source_url=PHOTO_SOURCE_URL, ttl=PHOTO_TTL,
+                 missing_ttl=PHOTO_MISSING_TTL, timeout=PHOTO_TIMEOUT, workers=PHOTO_WORKERS,
+                 max_bytes=PHOTO_CACHE_MAX_BYTES, max_photos=PHOTO_CACHE_MAX_PHOTOS, clock=time.time):
+        self.cache_dir = cache_dir
+        self.source_url = source_url
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self.timeout = timeout
+        self.workers = workers
+        self.max_bytes = max_bytes
+        self.max_photos = max_photos
+        self._clock = clock
+        self._meta = OrderedDict()   # photo ID -> metadata dict, mirrors the .json files; least recently used first
+        self._files = OrderedDict()  # photo ID -> bytes on disk; least recently used first
+        self._bytes = 0
+        self._locks = {}  # photo ID -> [Lock, users], so concurrent requests for a photo share one fetch
+        self._lock = threading.Lock()
+        self._session = None
+        self._executor = None
+        self.hits = 0
+        self.fetches = 0
+        self.revalidations = 0
+        self.missing = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._scan()
+
+    def get(self, pid, size):
+        """
+        Returns the Photo for a photo ID at one of PHOTO_SIZES. Always returns something: the placeholder if there's
+        no photo.
+        """
+        if pid == PLACEHOLDER_ID:
+            return placeholder(size)
+        meta = self._original(pid)
+        if meta is None or meta.get('missing'):
+            return placeholder(size)
+
+        self._touch(pid)
+        etag = '{}-{}'.format(meta['digest'], size)
+        variant = self._path(pid, '@{}.jpg'.format(size))
+        body = self._read(variant)
+        if body is not None:
+            return Photo(body, 'image/jpeg', etag)
+
+        original = self._read(self._path(pid, '.orig'))
+        if original is None:
+            # Evicted, possibly by another process sharing the directory. Fetch it again.
+            with self._key_lock(pid):
+                meta = self._fetch(pid, None)
+            original = self._read(self._path(pid, '.orig'))
+            if meta is None or meta.get('missing') or original is None:
+                return placeholder(size)
+            etag = '{}-{}'.format(meta['digest'], size)
+        body = resize(original, size)
+        if body is None:
+            return Photo(original, meta['content_type'], meta['digest'])
+        self._write(variant, body)
+        self._account(pid)
+        return Photo(body, 'image/jpeg', etag)
+
+    def prefetch(self, urls, size=None):
+        """
+        Fetches photos for the given photo service URLs in the background, and, with a size, prepares that variant.
+        URLs the proxy doesn't serve are skipped.
+        """
+        pids = set(pid for pid in (photo_id(url) for url in urls) if pid is not None)
+        if not pids:
+            return
+        if self._executor is None:
+            # Imported here to keep it off the cold start path.
+            from concurrent.futures import ThreadPoolExecutor
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        for pid in pids:
+            if size is None:
+                self._executor.submit(self._original, pid).add_done_callback(_log_failure)
+            else:
+                self._executor.submit(self.get, pid, size).add_done_callback(_log_failure)
+
+    def _original(self, pid):
+        # Returns the metadata for a photo ID, fetching or revalidating the original if it's due.
+        meta = self._load_meta(pid)
+        if meta is not None and not self._due(meta):
+            self.hits += 1
+            return meta
+        with self._key_lock(pid):
+            # Someone else may have fetched it while we waited.
+            meta = self._load_meta(pid)
+            if meta is not None and not self._due(meta):
+                self.hits += 1
+                return meta
+            return self._fetch(pid, meta)
+
+    def _due(self, meta):
+        ttl = self.missing_ttl if meta.get('missing') else self.ttl
+        return self._clock() - meta['checked'] >= ttl
+
+    def _fetch(self, pid, meta):
+        # Conditional GET against the photo service. Returns the new metadata, or the old one if the service can't be
+        # reached (a cached original is better than a placeholder).
+        headers = {}
+        if meta is not None and not meta.get('missing'):
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+            self.revalidations += 1
+        else:
+            self.fetches += 1
+
+        import requests
+        try:
+            resp = self._get_session().get(self.source_url + pid, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            log.warning("Photo request failed for {}: {}".format(pid, e))
+            return meta
+
+        now = self._clock()
+        if resp.status_code == 304 and meta is not None:
+            meta = dict(meta, checked=now)
+        elif resp.status_code == 200 and resp.headers.get('Content-Type', '').startswith('image/') and resp.content:
+            self._write(self._path(pid, '.orig'), resp.content)
+            for variant in glob.glob(glob.escape(self._path(pid, '@')) + '*'):
+                os.remove(variant)
+            meta = {
+                'checked': now,
+                'missing': False,
+                'etag': resp.headers.get('ETag', ''),
+                'last_modified': resp.headers.get('Last-Modified', ''),
+                'content_type': resp.headers['Content-Type'],
+                'digest': hashlib.sha1(resp.content).hexdigest()[:16],
+            }
+        elif resp.status_code == 404 or resp.status_code == 200:
+            # Gone, or not an image.
+            self.missing += 1
+            meta = {'checked': now, 'missing': True}
+        else:
+            log.warning("Photo service returned {} for {}".format(resp.status_code, pid))
+            return meta
+
+        self._write(self._path(pid, '.json'), json.dumps(meta).encode('utf-8'))
+        self._remember(pid, meta)
+        self._account(pid)
+        return meta
+
+    def _load_meta(self, pid):
+        with self._lock:
+            meta = self._meta.get(pid)
+            if meta is not None:
+                self._meta.move_to_end(pid)
+                return meta
+        body = self._read(self._path(pid, '.json'))
+        if body is None:
+            return None
+        meta = json.loads(body.decode('utf-8'))
+        self._remember(pid, meta)
+        return meta
+
+    def _remember(self, pid, meta):
+        with self._lock:
+            self._meta[pid] = meta
+            self._meta.move_to_end(pid)
+            while len(self._meta) > self.max_photos:
+                self._meta.popitem(last=False)
+
+    @contextmanager
+    def _key_lock(self, pid):
+        # The lock is dropped once nobody is using it, so there isn't one left behind for every photo ever asked for.
+        with self._lock:
+            entry = self._locks.setdefault(pid, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[pid]
+
+    def _files_of(self, pid):
+        base = glob.escape(self._path(pid, ''))
+        return [p for p in (base + '.json', base + '.orig') if os.path.exists(p)] + glob.glob(base + '@*.jpg')
+
+    def _scan(self):
+        # Rebuild the disk index from what earlier processes left, oldest first.
+        sizes = {}
+        mtimes = {}
+        for entry in os.scandir(self.cache_dir):
+            name = entry.name
+            if name.endswith('.tmp') or not entry.is_file():
+                continue
+            if name.endswith('.json') or name.endswith('.orig'):
+                pid = name[:-5]
+            elif '@' in name and name.endswith('.jpg'):
+                pid = name.rsplit('@', 1)[0]
+            else:
+                continue
+            stat = entry.stat()
+            sizes[pid] = sizes.get(pid, 0) + stat.st_size
+            mtimes[pid] = max(mtimes.get(pid, 0), stat.st_mtime)
+        for pid in sorted(sizes, key=mtimes.get):
+            self._files[pid] = sizes[pid]
+        self._bytes = sum(sizes.values())
+        self._evict()
+
+    def _touch(self, pid):
+        with self._lock:
+            if pid in self._files:
+                self._files.move_to_end(pid)
+
+    def _account(self, pid):
+        # Records what a photo's files take up now, then evicts if the cache is over its limits.
+        size = 0
+        for path in self._files_of(pid):
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._bytes += size - self._files.pop(pid, 0)
+            self._files[pid] = size
+        self._evict()
+
+    def _evict(self):
+        victims = []
+        with self._lock:
+            while len(self._files) > 1 and (self._bytes > self.max_bytes or len(self._files) > self.max_photos):
+                pid, size = self._files.popitem(last=False)
+                self._bytes -= size
+                self._meta.pop(pid, None)
+                victims.append(pid)
+        for pid in victims:
+            for path in self._files_of(pid):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.evictions += 1
+
+    def _get_session(self):
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    def _path(self, pid, suffix):
+        return os.path.join(self.cache_dir, pid + suffix)
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except IOError:
+            return None
+
+    @staticmethod
+    def _write(path, body):
+        # Write to a temporary file and rename, so readers never see a partial file.
+        tmp = '{}.{}.tmp'.format(path, threading.get_ident())
+        with open(tmp, 'wb') as f:
+            f.write(body)
+        os.replace(tmp, path)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'fetches': self.fetches,
+            'revalidations': self.revalidations,
+            'missing': self.missing,
+            'evictions': self.evictions,
+            'photos': len(self._files),
+            'bytes': self._bytes,
+        }
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        log.warning("Photo prefetch failed: {}".format(future.exception()))
@@ -0,0 +1,216 @@
+import os
+import sys
+import time
+import random
+import logging
+import threading
+
+# Sampled request profiling.
+#
+# Profiles a sample of requests to the skill's endpoint with a statistical sampler: while a profiled request runs, a
+# background thread looks at the request thread's stack every PROFILE_INTERVAL seconds and counts each distinct stack.
+# Unlike cProfile, the request itself runs at full speed; the cost is the sampler thread waking up, and only while a
+# profiled request is in flight. When the request ends, its stacks are written to PROFILE_DIR in collapsed ("folded")
+# format, one "frame;frame;frame count" line per stack, in a file named for the intent, e.g.
+#   iSearchIntentTitle.1508962051123.4242.17.folded
+#
+# Requests are profiled at random at PROFILE_RATE (0 to 1; 0, the default, turns random sampling off), or on demand
+# with a PROFILE_HEADER header set to PROFILE_TOKEN, e.g. from benchmarks/bench_e2e.py against a test deployment.
+#
+# Merge files into one flamegraph input with:
+#   $ python profiler.py merge /tmp/isearch_profiles > isearch.folded
+#   $ flamegraph.pl isearch.folded > isearch.svg
+# (flamegraph.pl: https://github.com/brendangregg/FlameGraph; speedscope.app also reads folded stacks.)
+#
+# Only the request thread is sampled. Time it spends waiting on pool threads (hedged Solr queries, unified search)
+# shows up as the wait.
+
+PROFILE_RATE = float(os.environ.get('ISEARCH_PROFILE_RATE', 0))
+PROFILE_TOKEN = os.environ.get('ISEARCH_PROFILE_TOKEN', '')
+PROFILE_HEADER = os.environ.get('ISEARCH_PROFILE_HEADER', 'X-Isearch-Profile')
+PROFILE_DIR = os.environ.get('ISEARCH_PROFILE_DIR', '/tmp/isearch_profiles')
+PROFILE_INTERVAL = float(os.environ.get('ISEARCH_PROFILE_INTERVAL', 0.005))
+
+log = logging.getLogger(__name__)
+
+
+def frame_label(code):
+    return '{}:{}'.format(os.path.basename(code.co_filename), code.co_name)
+
+
+class Profile(object):
+    """
+    Stack counts for one thread.
+    """
+    __slots__ = ('thread_id', 'started', 'stacks', 'samples')
+
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.started = time.time()
+        self.stacks = {}  # collapsed stack -> samples
+        self.samples = 0
+
+    def add(self, frame):
+        labels = []
+        while frame is not None:
+            labels.append(frame_label(frame.f_code))
+            frame = frame.f_back
+        labels.reverse()
+        stack = ';'.join(labels)
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+        self.samples += 1
+
+    def folded(self, root=None):
+        """
+        The stacks in collapsed format, optionally under an extra root frame.
+        """
+        prefix = root + ';' if root else ''
+        return ''.join('{}{} {}\n'.format(prefix, stack, count) for stack, count in sorted(self.stacks.items()))
+
+
+class Sampler(object):
+    """
+    One background thread sampling the stacks of every thread with an active Profile. Sleeps while there are none.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self._active = {}  # thread ID -> Profile
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self, thread_id=None):
+        profile = Profile(thread_id or threading.get_ident())
+        with self._lock:
+            self._active[profile.thread_id] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='profile-sampler')
+                self._thread.daemon = True
+                self._thread.start()
+        self._wake.set()
+        return profile
+
+    def stop(self, profile):
+        with self._lock:
+            self._active.pop(profile.thread_id, None)
+        return profile
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                active = list(self._active.values())
+                if not active:
+                    self._wake.clear()
+            if not active:
+                self._wake.wait()
+                continue
+            frames = sys._current_frames()
+            for profile in active:
+                frame = frames.get(profile.thread_id)
+                if frame is not None and profile.thread_id != me:
+                    profile.add(frame)
+            del frames
+            time.sleep(self.interval)
+
+
+sampler = Sampler()
+
+
+def write_profile(profile, tag, directory=PROFILE_DIR):
+    """
+    Writes a profile's folded stacks to a file named for tag (the intent) in directory. Returns the path.
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = '{}.{}.{}.{}.folded'.format(tag.replace(os.sep, '_'), int(profile.started * 1000), os.getpid(),
+                                       profile.thread_id % 100000)
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        f.write(profile.folded())
+    return path
+
+
+def install(app, describe, path='/directory'):
+    """
+    Profiles sampled requests to path. describe() is called at the end of each request and returns its (intent, device)
+    labels, as for metrics.install().
+    """
+    if PROFILE_RATE <= 0 and not PROFILE_TOKEN:
+        return
+
+    from flask import request, g
+
+    @app.before_request
+    def start_profile():
+        if request.path != path:
+            return
+        if (PROFILE_TOKEN and request.headers.get(PROFILE_HEADER) == PROFILE_TOKEN) or \
+                (PROFILE_RATE > 0 and random.random() < PROFILE_RATE):
+            g.profile = sampler.start()
+
+    @app.after_request
+    def end_profile(response):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            sampler.stop(profile)
+            try:
+                intent, _ = describe()
+            except Exception:
+                intent = 'unknown'
+            try:
+                write_profile(profile, intent)
+            except (IOError, OSError) as e:
+                log.warning("Couldn't write profile: {}".format(e))
+        return response
+
+
+def merge(paths, intent=None, by_intent=False):
+    """
+    Sums the folded stacks in paths (files, or directories of .folded files). Returns {stack: count}. With intent, only
+    that intent's files are read; with by_intent, stacks go under a root frame naming their intent.
+    """
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            files.extend(os.path.join(p, name) for name in sorted(os.listdir(p)) if name.endswith('.folded'))
+        else:
+            files.append(p)
+
+    totals = {}
+    for name in files:
+        tag = os.path.basename(name).split('.', 1)[0]
+        if intent and tag != intent:
+            continue
+        with open(name) as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if not stack or not count.isdigit():
+                    continue
+                if by_intent:
+                    stack = tag + ';' + stack
+                totals[stack] = totals.get(stack, 0) + int(count)
+    return totals
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Merge sampled request profiles into one flamegraph input.')
+    sub = parser.add_subparsers(dest='command')
+    merge_parser = sub.add_parser('merge', help='merge folded stack files')
+    merge_parser.add_argument('paths', nargs='*', default=[PROFILE_DIR], help='files or directories')
+    merge_parser.add_argument('--intent', help='only this intent')
+    merge_parser.add_argument('--by-intent', action='store_true', help='put each intent under its own root frame')
+    args = parser.parse_args(argv)
+
+    if args.command != 'merge':
+        parser.print_help()
+        return
+    totals = merge(args.paths, args.intent, args.by_intent)
+    for stack, count in sorted(totals.items()):
+        sys.stdout.write('{} {}\n'.format(stack, count))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
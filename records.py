@@ -0,0 +1,68 @@
+from collections import namedtuple
+
+# Result record shared by the people and title searches.
+#
+# A namedtuple keeps each record compact (no per-instance dict) and serializes to a plain JSON list, so records can
+# be stashed in session attributes or result_store as-is and rebuilt with person_from_session().
+
+PERSON_FIELDS = (
+    'firstName',
+    'lastName',
+    'displayName',
+    'primaryTitle',
+    'primaryiSearchDepartmentAffiliation',
+    'emailAddress',
+    'phone',
+    'primaryMailcode',
+    'photoUrl',
+)
+
+# Solr field list (fl). Only the fields we render are requested, which keeps heavy fields such as bio, titles,
+# departments and researchInterests off the wire.
+PERSON_FL = ','.join(PERSON_FIELDS)
+
+
+class Person(namedtuple('Person', PERSON_FIELDS)):
+    __slots__ = ()
+
+
+Person.__new__.__defaults__ = ('',) * len(PERSON_FIELDS)
+
+
+def person_from_doc(doc):
+    """
+    Maps a Solr directory document to a Person. Missing fields default to ''.
+    """
+    return Person(*[doc.get(f, '') for f in PERSON_FIELDS])
+
+
+def people_from_response(response):
+    """
+    Maps a decoded Solr select response to a list of Person records.
+    """
+    return [person_from_doc(doc) for doc in response['response']['docs']]
+
+
+# One window of a search's results: where it starts, its records, and Solr's numFound for the whole search.
+Page = namedtuple('Page', ('start', 'records', 'total'))
+
+
+def page_from_response(response):
+    """
+    Maps a decoded Solr select response to a Page of Person records.
+    """
+    body = response['response']
+    return Page(body.get('start', 0), people_from_response(response), body.get('numFound', 0))
+
+
+def person_from_session(value):
+    """
+    Rebuilds a Person from its session attribute form (a JSON list, or a dict from older sessions).
+    """
+    if isinstance(value, dict):
+        return person_from_doc(value)
+    return Person(*value)
+
+
+def people_from_session(values):
+    return [person_from_session(v) for v in values]
@@ -0,0 +1,144 @@
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+# Result rendering.
+#
+# Every output form of a record (SSML speech, app card text, Show rich text, photo URL, and the title search list
+# pieces) is built in a single pass that escapes each field once. Records are immutable tuples, so the rendered
+# output is memoized per record, and Repeat/ItemDetail turns on a record we've already rendered cost a dict lookup.
+#
+# Note, values going into SSML and rich text need escaping, as & and other special characters will force output to be
+# interpreted as text instead of SSML.
+
+RENDER_CACHE_SIZE = int(os.environ.get('ISEARCH_RENDER_CACHE_SIZE', 2048))
+
+
+def escape(data):
+    """
+    Escapes &, < and > the same way xml.sax.saxutils.escape does. Defined here because importing xml.sax.saxutils
+    pulls in urllib.request, http.client and email, which is a noticeable share of cold start time.
+    """
+    return data.replace('&', '&amp;').replace('>', '&gt;').replace('<', '&lt;')
+
+
+RenderedPerson = namedtuple('RenderedPerson', (
+    'speech',          # SSML fragment for people_results
+    'card',            # Alexa app card text
+    'rich',            # Show RichText
+    'photo',           # photo URL, '' if none
+    'list_speech',     # title search spoken list entry, without the item number
+    'list_card',       # title search card list entry, without the item number
+    'list_primary',    # ListTemplate1 primaryText
+    'list_secondary',  # ListTemplate1 secondaryText
+))
+
+RenderedDepartment = namedtuple('RenderedDepartment', ('speech', 'card', 'rich'))
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def render_person(record):
+
+    name = escape(record.displayName)
+    title = escape(record.primaryTitle)
+    dept = escape(record.primaryiSearchDepartmentAffiliation)
+    email = escape(record.emailAddress)
+    phone = escape(record.phone)
+    mailcode = escape(record.primaryMailcode)
+
+    speech = [name]
+    card = []
+    rich = []
+    if name:
+        card.append('\n' + name)
+        rich.append('<br/><b>' + name + '</b>')
+    if title:
+        speech.append(' is ' + title)
+        card.append('\n' + title)
+        rich.append('<br/>' + title)
+    if dept:
+        speech.append(' in  ' + dept)
+        card.append('\n' + dept)
+        rich.append('<br/>' + dept)
+    if email or phone or mailcode:
+        speech.append('<break/> You can reach ' + name + ' at ')
+    if email:
+        speech.append('<break/> the email <break/><prosody rate="slow"><say-as interpret-as="spell-out">' + email +
+                      '</say-as></prosody>')
+        card.append('\n' + email)
+        rich.append('<br/>' + email)
+    if phone:
+        speech.append('<break/> the phone number <break/> <say-as interpret-as="telephone">' + phone + '</say-as>')
+        card.append('\n' + phone)
+        rich.append('<br/>' + phone)
+    if mailcode:
+        speech.append('<break/> the mail code <break/> ' + mailcode)
+        card.append('\n' + mailcode)
+        rich.append('<br/>' + mailcode)
+
+    # The title search list is plain text, so it uses the raw values.
+    raw_title = record.primaryTitle
+    raw_dept = record.primaryiSearchDepartmentAffiliation
+    list_speech = record.displayName
+    list_card = record.displayName
+    if raw_title:
+        list_speech += ' is ' + raw_title
+        list_card += ', ' + raw_title
+    if raw_dept:
+        list_speech += ' of ' + raw_dept + ','
+        list_card += ', ' + raw_dept + '\r\n'
+
+    return RenderedPerson(
+        ''.join(speech),
+        ''.join(card),
+        ''.join(rich),
+        record.photoUrl,
+        list_speech,
+        list_card,
+        '<font size = "4">' + record.displayName + '</font>',
+        raw_title + (', ' if raw_title and raw_dept else '') + raw_dept,
+    )
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def render_department(dept):
+
+    name = escape(dept.name)
+    phone = escape(dept.phone)
+    fax = escape(dept.fax)
+    email = escape(dept.email)
+    url = escape(dept.url)
+    mailcode = escape(dept.mailcode)
+
+    speech = [name]
+    card = []
+    rich = []
+    if name:
+        card.append('\n' + name)
+        rich.append('<br/><b>' + name + '</b>')
+    if phone:
+        speech.append('<break/> The phone number is <break/> <say-as interpret-as="telephone">' + phone + '</say-as>')
+        card.append('\nPhone: ' + phone)
+        rich.append('<br/>Phone: ' + phone)
+    if fax:
+        speech.append('<break/> the fax number is <break/> <say-as interpret-as="telephone">' + fax + '</say-as>')
+        card.append('\nFax: ' + fax)
+        rich.append('<br/>Fax: ' + fax)
+    if email:
+        speech.append('<break/> the email is <break/><prosody rate="slow"><say-as interpret-as="spell-out">' + email +
+                      '</say-as></prosody>')
+        card.append('\n' + email)
+        rich.append('<br/>' + email)
+    if url:
+        card.append('\n' + url)
+        rich.append('<br/>' + url)
+    if mailcode:
+        speech.append('<break/> the mail code is <break/> ' + mailcode)
+        card.append('\nMail code: ' + mailcode)
+        rich.append('<br/>Mail code: ' + mailcode)
+
+    return RenderedDepartment(''.join(speech), ''.join(card), ''.join(rich))
+
+
+def render_stats():
+    return {'person': render_person.cache_info()._asdict(), 'department': render_department.cache_info()._asdict()}
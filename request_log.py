@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import hashlib
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+import metrics
+
+# Structured per-turn request log.
+#
+# Each request to the skill's endpoint writes one compact JSON line, e.g.
+#   {"ts":1508962051.123,"intent":"iSearchIntentPeople","device":"display","ms":212.4,"solr_ms":187.9,
+#    "session":"3f2a9c0e41d7","results":12,"index":2,"status":200}
+# with the intent, device type, whole turn time, time spent waiting on Solr (from the metrics' solr phase, so missing
+# with ISEARCH_METRICS=0), a hash of the session ID, result count and pagination index.
+#
+# The request thread only builds the record and puts it on a queue; it never formats, hashes or writes. A background
+# listener thread does that and writes to REQUEST_LOG. If the writer falls behind and REQUEST_LOG_QUEUE records are
+# waiting, new ones are dropped rather than holding up the request. Drops aren't silent: the first is logged as a
+# warning, the total is in the metrics as isearch_request_log_dropped, and it's logged again at shutdown. On Lambda, a
+# record still queued when the container is frozen is written when it thaws.
+#
+# The log is off unless REQUEST_LOG is set: "stderr" (which ends up in CloudWatch on Lambda), "stdout" or a file path.
+# Turn records go to their own logger, REQUEST_LOG_NAME, which doesn't propagate to the root logger.
+
+REQUEST_LOG = os.environ.get('ISEARCH_REQUEST_LOG', '')
+REQUEST_LOG_QUEUE = int(os.environ.get('ISEARCH_REQUEST_LOG_QUEUE', 10000))
+REQUEST_LOG_NAME = 'isearch.turns'
+
+# Hex digits of the session ID hash kept in records. Enough to follow a session, not to recover its ID.
+SESSION_HASH_LENGTH = 12
+
+log = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def session_hash(session_id):
+    return hashlib.sha1(session_id.encode('utf-8')).hexdigest()[:SESSION_HASH_LENGTH]
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Puts records on the queue as they are, leaving formatting to the listener, and drops them instead of waiting when
+    the queue is full.
+    """
+
+    def __init__(self, q):
+        QueueHandler.__init__(self, q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The queue stays in this process, so the record needn't be made picklable.
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1:
+                log.warning("Request log writer can't keep up, dropping turn records")
+
+
+class TurnFormatter(logging.Formatter):
+    """
+    Formats a turn record (a dict message) as one line of JSON. The session ID is hashed here, on the writer thread.
+    """
+
+    def format(self, record):
+        fields = {'ts': round(record.created, 3)}
+        if isinstance(record.msg, dict):
+            fields.update(record.msg)
+        else:
+            fields['message'] = record.getMessage()
+        if fields.get('session'):
+            fields['session'] = session_hash(fields['session'])
+        return json.dumps(fields, separators=(',', ':'))
+
+
+def open_target(target):
+    if target == 'stderr':
+        handler = logging.StreamHandler(sys.stderr)
+    elif target == 'stdout':
+        handler = logging.StreamHandler(sys.stdout)
+    else:
+        handler = logging.FileHandler(target, delay=True)
+    handler.setFormatter(TurnFormatter())
+    return handler
+
+
+class TurnLog(object):
+    """
+    A logger whose records go through a bounded queue to a listener thread writing to handler.
+    """
+
+    def __init__(self, handler, maxsize=REQUEST_LOG_QUEUE, name=REQUEST_LOG_NAME):
+        self.queue = queue.Queue(maxsize)
+        self.handler = DroppingQueueHandler(self.queue)
+        self.logger = logging.getLogger(name)
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self.handler)
+        self.listener = QueueListener(self.queue, handler)
+        self._started = False
+
+    def start(self):
+        if not self._started:
+            self.listener.start()
+            self._started = True
+
+    def stop(self):
+        """
+        Writes out what's queued and stops the listener.
+        """
+        if self._started:
+            try:
+                self.listener.stop()
+            except queue.Full:
+                pass
+            self._started = False
+        if self.dropped:
+            log.warning("Request log dropped {} turn records".format(self.dropped))
+
+    def log(self, fields):
+        # makeRecord() rather than logger.info(), which would walk the stack to find the caller on every turn.
+        record = self.logger.makeRecord(self.logger.name, logging.INFO, '(turn)', 0, fields, None, None)
+        self.logger.handle(record)
+
+    @property
+    def dropped(self):
+        return self.handler.dropped
+
+
+turn_log = None
+
+
+def annotate(**fields):
+    """
+    Adds fields to the current turn's record. Does nothing outside a logged turn.
+    """
+    current = getattr(_local, 'fields', None)
+    if current is not None:
+        current.update(fields)
+
+
+def install(app, describe, details, path='/directory', target=REQUEST_LOG):
+    """
+    Logs a record for each request to path. describe() returns the (intent, device) labels, as for
+    metrics.install(), and details() a dict of further fields, such as the session ID and pagination index. Returns
+    the TurnLog, or None if the log is off.
+    """
+    global turn_log
+    if not target:
+        return None
+
+    from flask import request
+
+    turn_log = TurnLog(open_target(target))
+    turn_log.start()
+    atexit.register(turn_log.stop)
+
+    @app.before_request
+    def start_turn_log():
+        if request.path == path:
+            _local.fields = {}
+            _local.started = time.perf_counter()
+
+    # Installed after metrics, so this runs before the metrics turn ends and its solr phase can still be read.
+    @app.after_request
+    def write_turn_log(response):
+        fields = getattr(_local, 'fields', None)
+        if fields is None:
+            return response
+        _local.fields = None
+        try:
+            intent, device = describe()
+        except Exception:
+            intent, device = 'unknown', 'none'
+        record = {
+            'intent': intent,
+            'device': device,
+            'ms': round((time.perf_counter() - _local.started) * 1000, 1),
+        }
+        solr_seconds = metrics.current_phase('solr')
+        if solr_seconds is not None:
+            record['solr_ms'] = round(solr_seconds * 1000, 1)
+        try:
+            record.update(details())
+        except Exception:
+            pass
+        record.update(fields)
+        record['status'] = response.status_code
+        turn_log.log(record)
+        return response
+
+    return turn_log
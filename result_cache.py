@@ -0,0 +1,246 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# In-process result cache for Solr queries.
+#
+# Bounded LRU with a per-entry TTL. Lookups for the same key that arrive while a load is already in flight wait for
+# that load instead of issuing their own Solr request (single-flight). Errors are never cached; they're handed to
+# every waiter of the failed load.
+#
+# Expired entries are kept for a further CACHE_STALE_TTL seconds (space permitting), so that when Solr fails, the
+# circuit breaker is open or a request's deadline runs out, get_stale() can still answer with the last known results.
+# Given a background runner, the cache is also stale-while-revalidate: get_or_load() answers an expired entry at once
+# with the stale value, and reloads it in the background.
+#
+# Given a shared tier (see disk_cache.py), loads check it before calling the loader, and write what they load to it,
+# so other processes don't each go to Solr for the same query. get() and get_stale() fall back to it too.
+#
+# Size and TTL can be overridden with environment variables.
+
+CACHE_MAXSIZE = int(os.environ.get('ISEARCH_CACHE_MAXSIZE', 512))
+CACHE_TTL = float(os.environ.get('ISEARCH_CACHE_TTL', 300))
+CACHE_STALE_TTL = float(os.environ.get('ISEARCH_CACHE_STALE_TTL', 3600))
+
+
+class _Call(object):
+    """
+    An in-flight load. Waiters block on the event and then read result or error.
+    """
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResultCache(object):
+
+    def __init__(self, maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL, stale_ttl=CACHE_STALE_TTL, background=None,
+                 shared=None, clock=time.monotonic):
+        """
+        background, if given, is called as background(fn, *args) to run a revalidation off the request thread.
+        shared, if given, is a second tier with lookup(key) -> (value, fresh) and set(key, value), e.g. a DiskCache.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.background = background
+        self.shared = shared
+        self._clock = clock
+        self._data = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_hits = 0
+        self.revalidations = 0
+        self.shared_hits = 0
+
+    def get(self, key):
+        """
+        Returns the cached value for key, or None if it's missing or expired.
+        """
+        with self._lock:
+            value = self._get(key)
+        if value is None and self.shared is not None:
+            value, fresh = self.shared.lookup(key)
+            if not fresh:
+                return None
+            self.set(key, value, share=False)
+        return value
+
+    def _get(self, key):
+        value, fresh = self._lookup(key)
+        return value if fresh else None
+
+    def _lookup(self, key):
+        # Returns (value, fresh). value is None for a missing entry or one past its stale window, which is dropped.
+        entry = self._data.get(key)
+        if entry is None:
+            return None, False
+        now = self._clock()
+        if entry[0] <= now:
+            if entry[0] + self.stale_ttl <= now:
+                del self._data[key]
+                self.expirations += 1
+                return None, False
+            return entry[1], False
+        self._data.move_to_end(key)
+        return entry[1], True
+
+    def get_stale(self, key):
+        """
+        Returns the value for key even if it has expired, as long as it's within stale_ttl of expiring. For answering
+        when a fresh load isn't possible. Returns None otherwise.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] + self.stale_ttl > self._clock():
+                self.stale_hits += 1
+                return entry[1]
+        if self.shared is not None:
+            value, _ = self.shared.lookup(key)
+            if value is not None:
+                self.stale_hits += 1
+                return value
+        return None
+
+    def set(self, key, value, share=True):
+        with self._lock:
+            self._set(key, value)
+        if share and self.shared is not None:
+            self.shared.set(key, value)
+
+    def _set(self, key, value):
+        self._data[key] = (self._clock() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_load(self, key, loader, background_loader=None):
+        """
+        Returns the cached value for key. On a miss, calls loader() once and caches what it returns; concurrent
+        callers for the same key share that one call. Exceptions raised by loader() propagate to every caller and
+        nothing is cached.
+
+        With a background runner, an expired (but not yet dropped) entry is returned as is, and reloaded in the
+        background with background_loader() (or loader() if not given), once per key at a time.
+        """
+        revalidate = None
+        with self._lock:
+            value, fresh = self._lookup(key)
+            if value is not None and fresh:
+                self.hits += 1
+                return value
+            call = self._inflight.get(key)
+            if value is not None and self.background is not None:
+                # Stale: answer now, and reload unless a load is already in flight.
+                self.stale_hits += 1
+                if call is None:
+                    self.revalidations += 1
+                    revalidate = self._inflight[key] = _Call()
+                owner = None
+            elif call is not None:
+                self.coalesced += 1
+                owner = False
+            else:
+                self.misses += 1
+                call = self._inflight[key] = _Call()
+                owner = True
+
+        if owner is None:
+            if revalidate is not None:
+                self.background(self._load, key, background_loader or loader, revalidate)
+            return value
+
+        if not owner:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        return self._load(key, loader, call)
+
+    def _load(self, key, loader, call):
+        try:
+            shared = None
+            if self.shared is not None:
+                # Another process may already have loaded it.
+                shared, fresh = self.shared.lookup(key)
+                if not fresh:
+                    shared = None
+            if shared is not None:
+                self.shared_hits += 1
+                call.result = shared
+            else:
+                call.result = loader()
+        except Exception as e:
+            call.error = e
+            raise
+        else:
+            with self._lock:
+                self._set(key, call.result)
+            if shared is None and self.shared is not None:
+                self.shared.set(key, call.result)
+            return call.result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.event.set()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        Counters for sizing the cache.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'stale_hits': self.stale_hits,
+                'revalidations': self.revalidations,
+                'shared_hits': self.shared_hits,
+                'hit_ratio': float(self.hits + self.coalesced) / lookups if lookups else 0.0
+            }
+
+
+def people_key(firstName='', lastName='', start=0, rows=0):
+    """
+    Cache key for a window of a name query. Names are case-folded and whitespace-collapsed.
+    """
+    return ('people', _normalize(firstName), _normalize(lastName), start, rows)
+
+
+def title_key(titleSearchPhrase='', start=0, rows=0):
+    """
+    Cache key for a window of a title query. The phrase is case-folded and whitespace-collapsed.
+    """
+    return ('title', _normalize(titleSearchPhrase), start, rows)
+
+
+def batch_key(firstName='', lastName='', rows=0):
+    """
+    Cache key for a name's exact matches from batch resolution (see batch.py).
+    """
+    return ('batch', _normalize(firstName), _normalize(lastName), rows)
+
+
+def _normalize(value):
+    return ' '.join((value or '').split()).casefold()
@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+# Server-side store for search results.
+#
+# Rather than writing every result record into session attributes (which Alexa then echoes back and forth on every
+# turn), a search stashes its results here and the session only carries a short handle. Entries are keyed by the
+# Alexa session ID plus a per-search ID, expire after a TTL, and are dropped early when the session ends.
+#
+# Backends:
+#   memory                  In-process LRU. Default. Fine for a single instance/warm container.
+#   sqlite:///path/to/db    SQLite file. Can be shared by several processes/instances on the same host or volume.
+#
+# Select the backend with the ISEARCH_RESULT_STORE environment variable.
+
+RESULT_STORE_URL = os.environ.get('ISEARCH_RESULT_STORE', 'memory')
+RESULT_STORE_TTL = float(os.environ.get('ISEARCH_RESULT_STORE_TTL', 900))
+RESULT_STORE_MAXSIZE = int(os.environ.get('ISEARCH_RESULT_STORE_MAXSIZE', 2048))
+
+
+def new_search_id():
+    return uuid.uuid4().hex[:12]
+
+
+class MemoryResultStore(object):
+
+    def __init__(self, maxsize=RESULT_STORE_MAXSIZE, ttl=RESULT_STORE_TTL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()  # (session_id, search_id) -> (expires_at, results), least recently used first
+        self._sessions = {}  # session_id -> set of search_ids
+        self._lock = threading.Lock()
+
+    def put(self, session_id, results, search_id=None):
+        """
+        Stores results for a session and returns the search ID to keep in the session as a handle.
+        """
+        search_id = search_id or new_search_id()
+        key = (session_id, search_id)
+        with self._lock:
+            self._data[key] = (self._clock() + self.ttl, results)
+            self._data.move_to_end(key)
+            self._sessions.setdefault(session_id, set()).add(search_id)
+            while len(self._data) > self.maxsize:
+                self._forget(self._data.popitem(last=False)[0])
+        return search_id
+
+    def get(self, session_id, search_id):
+        """
+        Returns the stored results, or None if they're unknown or expired.
+        """
+        key = (session_id, search_id)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self._clock():
+                del self._data[key]
+                self._forget(key)
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def drop_session(self, session_id):
+        with self._lock:
+            for search_id in self._sessions.pop(session_id, ()):
+                self._data.pop((session_id, search_id), None)
+
+    def _forget(self, key):
+        searches = self._sessions.get(key[0])
+        if searches is not None:
+            searches.discard(key[1])
+            if not searches:
+                del self._sessions[key[0]]
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SqliteResultStore(object):
+    """
+    SQLite backed store. Results are kept as JSON, so whatever is stored comes back as plain lists/dicts.
+    """
+
+    def __init__(self, path, ttl=RESULT_STORE_TTL, maxsize=RESULT_STORE_MAXSIZE, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                ' session_id TEXT NOT NULL,'
+                ' search_id TEXT NOT NULL,'
+                ' expires REAL NOT NULL,'
+                ' payload TEXT NOT NULL,'
+                ' PRIMARY KEY (session_id, search_id))'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS results_expires ON results (expires)')
+
+    def _conn(self):
+        # One connection per thread. WAL lets readers in other processes carry on while one writes.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            import sqlite3
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def put(self, session_id, results, search_id=None):
+        search_id = search_id or new_search_id()
+        now = self._clock()
+        with self._conn() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO results (session_id, search_id, expires, payload) VALUES (?, ?, ?, ?)',
+                (session_id, search_id, now + self.ttl, json.dumps(results, separators=(',', ':')))
+            )
+            conn.execute('DELETE FROM results WHERE expires <= ?', (now,))
+            conn.execute(
+                'DELETE FROM results WHERE rowid IN '
+                '(SELECT rowid FROM results ORDER BY expires DESC LIMIT -1 OFFSET ?)',
+                (self.maxsize,)
+            )
+        return search_id
+
+    def get(self, session_id, search_id):
+        row = self._conn().execute(
+            'SELECT payload FROM results WHERE session_id = ? AND search_id = ? AND expires > ?',
+            (session_id, search_id, self._clock())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def drop_session(self, session_id):
+        with self._conn() as conn:
+            conn.execute('DELETE FROM results WHERE session_id = ?', (session_id,))
+
+    def __len__(self):
+        return self._conn().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+
+def store_from_url(url=RESULT_STORE_URL):
+    """
+    Builds a result store from a backend URL. See the module notes for supported values.
+    """
+    if url == 'memory':
+        return MemoryResultStore()
+    if url.startswith('sqlite:///'):
+        return SqliteResultStore(url[len('sqlite:///'):])
+    raise ValueError("Unsupported result store: {}".format(url))
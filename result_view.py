@@ -0,0 +1,90 @@
+import os
+from collections import namedtuple
+
+from render import render_person, escape
+from photos import photo_url
+from metrics import span
+
+# Result list views.
+#
+# Title and unified search results are shown as a numbered list: the first LIST_SPOKEN entries are spoken and put on
+# the card, and all of them go in a ListTemplate1 list on Show devices. Views are built from the records the search
+# stashed in result_store, so redrawing the list (iSearchIntentBackToResults, repeat) doesn't query Solr again, and
+# in a single pass over the records shown.
+#
+# Lists longer than LIST_WINDOW_SIZE are shown a window at a time; "next" moves on to the following window. Item
+# numbers and list tokens count from the first result, not from the start of the window, so "open number 23" on the
+# second window opens the 23rd result.
+
+LIST_WINDOW_SIZE = int(os.environ.get('ISEARCH_LIST_WINDOW_SIZE', 20))
+LIST_SPOKEN = int(os.environ.get('ISEARCH_LIST_SPOKEN', 5))
+
+TOKEN_PREFIX = 'result_'
+
+ListView = namedtuple('ListView', (
+    'speech',  # numbered entries for voice
+    'card',    # numbered entries for the Alexa app card
+    'items',   # ListTemplate1 listItems
+    'start',   # index of the first result in the window
+    'end',     # index after the last result in the window
+))
+
+
+def item_token(index):
+    return TOKEN_PREFIX + str(index)
+
+
+def token_index(token):
+    """
+    Returns the result index for a list item token, or None if it isn't one.
+    """
+    if token and token.startswith(TOKEN_PREFIX) and token[len(TOKEN_PREFIX):].isdigit():
+        return int(token[len(TOKEN_PREFIX):])
+    return None
+
+
+def list_item(index, record, rendered):
+    return {
+        'token': item_token(index),  # Tokenize by results index.
+        'image': {
+            'sources': [
+                {
+                    'url': photo_url(rendered.photo, 'list')
+                }
+            ],
+            'contentDescription': 'photo of {}'.format(record.displayName)
+        },
+        'textContent': {
+            'primaryText': {
+                'text': rendered.list_primary,
+                'type': 'RichText'
+            },
+            'secondaryText': {
+                'text': rendered.list_secondary,
+                'type': 'PlainText'
+            },
+        }
+    }
+
+
+def list_view(records, start=0, size=LIST_WINDOW_SIZE, spoken=LIST_SPOKEN, ssml=False):
+    """
+    Builds the ListView for records[start:start + size]. Set ssml if the speech goes into an SSML template, so the
+    entries are escaped.
+    """
+    speech = []
+    card = []
+    items = []
+    end = min(start + size, len(records))
+    with span('render'):
+        for index in range(start, end):
+            record = records[index]
+            rendered = render_person(record)
+            items.append(list_item(index, record, rendered))
+            # Only the first few results for voice and card situations.
+            if index - start < spoken:
+                # Item number, displayName, then primaryTitle and dept affiliation if we have them.
+                entry = escape(rendered.list_speech) if ssml else rendered.list_speech
+                speech.append('{}. {}'.format(index + 1, entry))
+                card.append('{}. {}'.format(index + 1, rendered.list_card))
+    return ListView(''.join(speech), ''.join(card), items, start, end)
@@ -0,0 +1,207 @@
+import os
+import sys
+import csv
+import json
+import logging
+
+from local_index import name_key
+
+# LAST_NAME custom slot value generator.
+#
+# The directory has over 20k unique last names, but about 2k slot values is the practical limit (see the README). This
+# picks the SLOT_SIZE most common last names from a Solr export of the directory, always keeping the VIP names in
+# SLOT_VIP_PATH, and writes them to both SpeechAssets/customSlotTypes/LAST_NAME and the LAST_NAME type in
+# SpeechAssets/IntentSchema.json.
+#
+# The export is streamed in one pass, and names are counted in a Misra-Gries heavy hitters sketch of SLOT_SKETCH_SIZE
+# counters, so memory use is fixed no matter how big the export is. Any name making up more than 1/SLOT_SKETCH_SIZE of
+# the rows is guaranteed a counter, and each count is short by at most rows/(SLOT_SKETCH_SIZE + 1).
+#
+#   $ python slot_values.py lastnames.csv
+#   $ python slot_values.py --solr
+# The first reads a CSV export with a lastName column (a local index snapshot works too, see local_index.py), or
+# stdin with "-". The second streams the export from Solr.
+
+SPEECH_ASSETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SpeechAssets')
+
+SLOT_SIZE = int(os.environ.get('ISEARCH_SLOT_SIZE', 2000))
+SLOT_SKETCH_SIZE = int(os.environ.get('ISEARCH_SLOT_SKETCH_SIZE', 10000))
+SLOT_VIP_PATH = os.environ.get('ISEARCH_SLOT_VIP_PATH', os.path.join(SPEECH_ASSETS, 'VIP_LAST_NAMES'))
+SLOT_VALUES_PATH = os.path.join(SPEECH_ASSETS, 'customSlotTypes', 'LAST_NAME')
+INTENT_SCHEMA_PATH = os.path.join(SPEECH_ASSETS, 'IntentSchema.json')
+SLOT_TYPE = 'LAST_NAME'
+
+EXPORT_PATH = 'directory/select?q=*:*&fl=lastName&wt=csv&rows=50000'
+
+log = logging.getLogger(__name__)
+
+
+class HeavyHitters(object):
+    """
+    Misra-Gries frequent items sketch with at most size counters. Items are keyed by name_key(), and the first spelling
+    seen is kept for output.
+    """
+
+    def __init__(self, size=SLOT_SKETCH_SIZE):
+        self.size = size
+        self.rows = 0
+        self._counters = {}  # key -> [count, first spelling seen]
+
+    def add(self, name):
+        key = name_key(name)
+        if not key:
+            return
+        self.rows += 1
+        counter = self._counters.get(key)
+        if counter is not None:
+            counter[0] += 1
+        elif len(self._counters) < self.size:
+            self._counters[key] = [1, name]
+        else:
+            # Full: decrement every counter, and drop those that reach zero. Each decrement is paid for by an earlier
+            # increment, so this is constant time per row on average.
+            for k in list(self._counters):
+                counter = self._counters[k]
+                counter[0] -= 1
+                if counter[0] == 0:
+                    del self._counters[k]
+
+    def error(self):
+        """
+        The most any count can be short by.
+        """
+        return self.rows // (self.size + 1)
+
+    def top(self, n):
+        """
+        Returns up to n (name, count) pairs, most common first. Ties go alphabetically.
+        """
+        ranked = sorted(self._counters.values(), key=lambda c: (-c[0], c[1]))
+        return [(name, count) for count, name in ranked[:n]]
+
+
+def read_names(lines):
+    """
+    Yields last names from CSV lines with a lastName column (or a single unlabelled one).
+    """
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    if 'lastName' in header:
+        column = header.index('lastName')
+    else:
+        column = 0
+        if header:
+            yield header[0]
+    for row in reader:
+        if len(row) > column:
+            yield row[column]
+
+
+def stream_export(url):
+    """
+    Yields the lines of a Solr CSV export as it downloads.
+    """
+    import solr
+    resp = solr.get_session().get(url, headers={'Accept': 'text/csv'}, stream=True,
+                                  timeout=(solr.SOLR_CONNECT_TIMEOUT, 60))
+    resp.raise_for_status()
+    for line in resp.iter_lines(decode_unicode=True):
+        yield line
+
+
+def read_list(path):
+    try:
+        with open(path) as f:
+            return [line.strip() for line in f if line.strip()]
+    except (IOError, OSError):
+        return []
+
+
+def pick_values(names, vips, size=SLOT_SIZE, sketch_size=SLOT_SKETCH_SIZE):
+    """
+    Returns (values, sketch): the VIP names, then the most common names in names up to size values in all.
+    """
+    sketch = HeavyHitters(sketch_size)
+    for name in names:
+        sketch.add(name.strip())
+
+    values = []
+    seen = set()
+    for name in vips:
+        if name_key(name) not in seen:
+            seen.add(name_key(name))
+            values.append(name)
+    for name, _ in sketch.top(size + len(seen)):
+        if len(values) >= size:
+            break
+        if name_key(name) not in seen:
+            seen.add(name_key(name))
+            values.append(name)
+    return values, sketch
+
+
+def write_atomic(path, text):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def write_values(values, values_path=SLOT_VALUES_PATH, schema_path=INTENT_SCHEMA_PATH, slot_type=SLOT_TYPE):
+    """
+    Writes the slot values file and replaces the slot type's values in the intent schema. Synonyms and IDs already set
+    on a value are kept.
+    """
+    with open(schema_path) as f:
+        schema = json.load(f)
+    for slot in schema['languageModel']['types']:
+        if slot['name'] == slot_type:
+            existing = dict((name_key(v['name']['value']), v) for v in slot['values'])
+            slot['values'] = [existing.get(name_key(name)) or {'id': None, 'name': {'value': name, 'synonyms': []}}
+                              for name in values]
+            break
+    else:
+        raise ValueError("No {} slot type in {}".format(slot_type, schema_path))
+
+    write_atomic(values_path, '\n'.join(values))
+    write_atomic(schema_path, json.dumps(schema, indent=2))
+
+
+def main(argv):
+    import argparse
+    import solr
+
+    parser = argparse.ArgumentParser(description='Generate LAST_NAME slot values from a directory export.')
+    parser.add_argument('export', nargs='?', help='CSV export with a lastName column, or - for stdin')
+    parser.add_argument('--solr', action='store_true', help='stream the export from Solr')
+    parser.add_argument('--url', default=solr.SOLR_URL + EXPORT_PATH, help='Solr export URL, with --solr')
+    parser.add_argument('--size', type=int, default=SLOT_SIZE, help='number of slot values')
+    parser.add_argument('--sketch-size', type=int, default=SLOT_SKETCH_SIZE, help='heavy hitters counters')
+    parser.add_argument('--vip', default=SLOT_VIP_PATH, help='file of names always included, one per line')
+    parser.add_argument('--dry-run', action='store_true', help='print the values instead of writing them')
+    args = parser.parse_args(argv)
+
+    if args.solr:
+        lines = stream_export(args.url)
+    elif args.export == '-':
+        lines = sys.stdin
+    elif args.export:
+        lines = open(args.export, newline='')
+    else:
+        parser.error('give an export file, - for stdin, or --solr')
+
+    vips = read_list(args.vip)
+    values, sketch = pick_values(read_names(lines), vips, args.size, args.sketch_size)
+    sys.stderr.write('{} rows, {} VIP names, {} values, counts within {} of exact\n'.format(
+        sketch.rows, len(vips), len(values), sketch.error()))
+
+    if args.dry_run:
+        sys.stdout.write('\n'.join(values) + '\n')
+    else:
+        write_values(values)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
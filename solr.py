@@ -0,0 +1,305 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+from breaker import CircuitBreaker, CLOSED
+from metrics import span, bind
+
+# Shared Solr HTTP client.
+#
+# Every query helper in isearch.py goes through the pooled session below rather than calling requests.get() directly,
+# so TCP/TLS connections to asudir-solr are kept alive and reused between utterances. The session is created lazily
+# and held at module level, which means it also survives across warm Lambda/Zappa invocations of the same container.
+#
+# All settings can be overridden with environment variables (for example in zappa_settings.json
+# "environment_variables").
+#
+# requests is imported on first use rather than at import time, to keep it off the cold start path.
+#
+# Queries go through a circuit breaker (see breaker.py). While it's open they fail fast with CircuitOpen.
+
+# Solr base URL. Override with ISEARCH_SOLR_URL, e.g. to point at the stand-in server in benchmarks/fake_solr.py.
+SOLR_URL = os.environ.get('ISEARCH_SOLR_URL', 'https://asudir-solr.asu.edu/asudir/')
+
+# Number of per-host connection pools to cache, and max connections kept alive per host.
+SOLR_POOL_CONNECTIONS = int(os.environ.get('ISEARCH_SOLR_POOL_CONNECTIONS', 4))
+SOLR_POOL_MAXSIZE = int(os.environ.get('ISEARCH_SOLR_POOL_MAXSIZE', 10))
+
+# Seconds. Alexa gives us about 8 seconds to respond, so keep these well under that.
+SOLR_CONNECT_TIMEOUT = float(os.environ.get('ISEARCH_SOLR_CONNECT_TIMEOUT', 1.5))
+SOLR_READ_TIMEOUT = float(os.environ.get('ISEARCH_SOLR_READ_TIMEOUT', 3.0))
+
+# Bounded retries with exponential backoff (backoff_factor * 2 ** (retry - 1) seconds between attempts).
+SOLR_RETRIES = int(os.environ.get('ISEARCH_SOLR_RETRIES', 2))
+SOLR_BACKOFF_FACTOR = float(os.environ.get('ISEARCH_SOLR_BACKOFF_FACTOR', 0.1))
+SOLR_RETRY_STATUSES = (502, 503, 504)
+
+# Hedged requests, for queries made with a deadline. If the first attempt hasn't answered after the
+# SOLR_HEDGE_PERCENTILE latency of recent queries, a duplicate is sent and whichever answers first is used. Until
+# SOLR_HEDGE_MIN_SAMPLES latencies are recorded, SOLR_HEDGE_DELAY seconds is used instead. Set
+# ISEARCH_SOLR_HEDGE_PERCENTILE=0 to turn hedging off.
+SOLR_HEDGE_PERCENTILE = float(os.environ.get('ISEARCH_SOLR_HEDGE_PERCENTILE', 95))
+SOLR_HEDGE_DELAY = float(os.environ.get('ISEARCH_SOLR_HEDGE_DELAY', 0.5))
+SOLR_HEDGE_MIN_DELAY = float(os.environ.get('ISEARCH_SOLR_HEDGE_MIN_DELAY', 0.05))
+SOLR_HEDGE_MIN_SAMPLES = int(os.environ.get('ISEARCH_SOLR_HEDGE_MIN_SAMPLES', 20))
+SOLR_HEDGE_WINDOW = int(os.environ.get('ISEARCH_SOLR_HEDGE_WINDOW', 256))
+
+# JSON parser for response bodies: "orjson" or "ujson" for those libraries, "json" for the standard library, or "auto"
+# for orjson if it's installed and the standard library if not. A parser that isn't installed falls back to json.
+SOLR_JSON = os.environ.get('ISEARCH_SOLR_JSON', 'auto')
+
+log = logging.getLogger(__name__)
+
+_session = None
+_executor = None
+_decoder = None
+
+
+class SolrError(Exception):
+    """
+    Raised when Solr can't be reached or returns a non-200 response.
+    """
+    pass
+
+
+class DeadlineExceeded(SolrError):
+    """
+    Raised when a query's deadline runs out before Solr answers.
+    """
+    pass
+
+
+class CircuitOpen(SolrError):
+    """
+    Raised instead of querying Solr while the circuit breaker is open.
+    """
+    pass
+
+
+class LatencyTracker(object):
+    """
+    Latencies of the most recent successful queries, for picking the hedge delay.
+    """
+
+    def __init__(self, window=SOLR_HEDGE_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct):
+        """
+        Returns the pct percentile of recorded latencies, or None if there are fewer than SOLR_HEDGE_MIN_SAMPLES.
+        """
+        with self._lock:
+            if len(self._samples) < SOLR_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+    def hedge_delay(self):
+        delay = self.percentile(SOLR_HEDGE_PERCENTILE)
+        if delay is None:
+            return SOLR_HEDGE_DELAY
+        return max(SOLR_HEDGE_MIN_DELAY, delay)
+
+    def stats(self):
+        with self._lock:
+            samples = len(self._samples)
+        return {
+            'samples': samples,
+            'hedge_delay': self.hedge_delay(),
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins
+        }
+
+
+latency = LatencyTracker()
+breaker = CircuitBreaker()
+
+
+def get_session():
+    """
+    Returns the module-level pooled session, creating it on first use.
+    """
+    global _session
+    if _session is None:
+        _session = _build_session()
+    return _session
+
+
+def _build_session():
+
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=SOLR_RETRIES,
+        connect=SOLR_RETRIES,
+        read=SOLR_RETRIES,
+        status=SOLR_RETRIES,
+        backoff_factor=SOLR_BACKOFF_FACTOR,
+        status_forcelist=SOLR_RETRY_STATUSES,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=SOLR_POOL_CONNECTIONS,
+        pool_maxsize=SOLR_POOL_MAXSIZE,
+        max_retries=retry
+    )
+
+    s = requests.Session()
+    s.mount('https://', adapter)
+    s.mount('http://', adapter)
+    s.headers.update({'Accept': 'application/json'})
+    return s
+
+
+def reset_session():
+    """
+    Closes and drops the pooled session. The next query builds a fresh one.
+    """
+    global _session
+    if _session is not None:
+        _session.close()
+    _session = None
+
+
+def json_decoder(name=SOLR_JSON):
+    """
+    Returns a function decoding a JSON response body (bytes) with the named parser.
+    """
+    if name in ('auto', 'orjson'):
+        try:
+            import orjson
+            return orjson.loads
+        except ImportError:
+            pass
+    elif name == 'ujson':
+        try:
+            import ujson
+            return ujson.loads
+        except ImportError:
+            pass
+    if name not in ('auto', 'json'):
+        log.warning("JSON parser {} isn't available, using json".format(name))
+    import json
+    return json.loads
+
+
+def default_decoder():
+    """
+    Returns the SOLR_JSON decoder, picking it on first use.
+    """
+    global _decoder
+    if _decoder is None:
+        _decoder = json_decoder()
+    return _decoder
+
+
+def get(url, params=None, timeout=None, deadline=None, decode=None):
+    """
+    Issues a GET against Solr through the pooled session and returns the decoded JSON response.
+    Raises SolrError on connection problems, timeouts, non-200 responses and bodies that aren't JSON.
+
+    decode turns the response body into data, and defaults to the SOLR_JSON parser.
+
+    With a deadline (see deadline.py), timeouts are capped to the time left, a hedged duplicate is sent if the first
+    attempt is slow, and DeadlineExceeded is raised if neither answers in time.
+    """
+    if timeout is None:
+        timeout = (SOLR_CONNECT_TIMEOUT, SOLR_READ_TIMEOUT)
+
+    if deadline is not None and deadline.expired():
+        raise DeadlineExceeded("No time left to query Solr")
+    if not breaker.allow():
+        raise CircuitOpen("Solr circuit breaker is open")
+
+    if decode is None:
+        decode = default_decoder()
+
+    if deadline is None:
+        return _get(url, params, timeout, decode)
+
+    timeout = (deadline.cap(timeout[0]), deadline.cap(timeout[1]))
+    if SOLR_HEDGE_PERCENTILE <= 0:
+        return _get(url, params, timeout, decode)
+    return _hedged_get(url, params, timeout, deadline, decode)
+
+
+def _get(url, params, timeout, decode):
+
+    session = get_session()
+    import requests
+
+    started = time.monotonic()
+    failed = True
+    try:
+        try:
+            with span('solr'):
+                resp = session.get(url, params=params, timeout=timeout)
+        except requests.RequestException as e:
+            log.warning("Solr request failed: {}".format(e))
+            raise SolrError(str(e))
+
+        # Only server side errors count against the breaker. A 4xx is a problem with our query, not with Solr.
+        failed = resp.status_code >= 500
+        if resp.status_code != 200:
+            log.warning("Solr returned {} for {}".format(resp.status_code, resp.url))
+            raise SolrError("Solr returned {}".format(resp.status_code))
+
+        with span('decode'):
+            try:
+                data = decode(resp.content)
+            except ValueError as e:
+                log.warning("Solr returned invalid JSON for {}: {}".format(resp.url, e))
+                raise SolrError("Solr returned invalid JSON")
+    finally:
+        elapsed = time.monotonic() - started
+        breaker.record(not failed, elapsed)
+    latency.record(elapsed)
+    return data
+
+
+def _hedged_get(url, params, timeout, deadline, decode):
+
+    global _executor
+    # Imported here to keep it off the cold start path.
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=SOLR_POOL_MAXSIZE)
+
+    first = _executor.submit(bind(_get), url, params, timeout, decode)
+    pending = {first}
+    done, _ = wait(pending, timeout=deadline.cap(latency.hedge_delay()))
+    # No hedging unless the breaker is closed; when half-open the first attempt is its only probe.
+    if not done and not deadline.expired() and breaker.state == CLOSED:
+        latency.hedged += 1
+        pending.add(_executor.submit(bind(_get), url, params, (deadline.cap(timeout[0]), deadline.cap(timeout[1])),
+                                     decode))
+
+    # Whichever attempt succeeds first wins. The loser is left to finish on its own; its connection goes back to the
+    # pool.
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                if future is not first:
+                    latency.hedge_wins += 1
+                return future.result()
+            error = future.exception()
+
+    if pending:
+        log.warning("Solr deadline exceeded for {}".format(url))
+        raise DeadlineExceeded("Solr didn't answer before the deadline")
+    raise error
@@ -0,0 +1,92 @@
+import re
+from urllib.parse import quote
+
+import solr
+
+# Prepared Solr queries.
+#
+# A SolrQuery holds the parameters that stay the same from one search of a kind to the next (defType, qf, pf, bq, fl,
+# wt, ...), URL-encoded once when the query is defined. Each search only adds its own parameters: the user's terms,
+# start and rows. Terms are escaped for Solr's query parser, so characters like + - : " ( ) are searched for rather
+# than read as query syntax, then URL-encoded along with everything else, so & # + and spaces reach Solr intact.
+#
+# SolrClient runs prepared queries against a Solr base URL through the pooled client in solr.py, with its retries,
+# circuit breaker and hedging, and decodes responses with a pluggable JSON parser (see solr.json_decoder()).
+
+# Characters with a meaning in Lucene/edismax query syntax. && and || are covered by & and |.
+QUERY_SYNTAX = '+-&|!(){}[]^"~*?:\\/'
+_ESCAPES = str.maketrans(dict((ch, '\\' + ch) for ch in QUERY_SYNTAX))
+
+
+def escape_term(term):
+    """
+    Escapes query syntax in term so Solr treats it as text.
+    """
+    return term.translate(_ESCAPES)
+
+
+# Text needing no escaping and no URL encoding other than spaces, which is what speech input almost always is. Used
+# with fullmatch(): nothing in QUERY_SYNTAX (~ included) and no trailing newline gets past it.
+PLAIN_TEXT = re.compile(r'[A-Za-z0-9 ._]*')
+
+
+def encode(value):
+    if isinstance(value, int):
+        return str(value)
+    return quote(str(value), safe='')
+
+
+def encode_terms(terms):
+    """
+    Escapes and URL-encodes user text for q.
+    """
+    if PLAIN_TEXT.fullmatch(terms):
+        return terms.replace(' ', '%20')
+    return quote(escape_term(terms), safe='')
+
+
+class SolrQuery(object):
+    """
+    A request handler path and its static parameters, encoded once.
+    """
+    __slots__ = ('path', 'params', 'query_string')
+
+    def __init__(self, path, params):
+        self.path = path
+        self.params = dict(params)
+        self.query_string = '&'.join(encode(k) + '=' + encode(v) for k, v in self.params.items())
+
+    def url(self, base, terms=None, **params):
+        """
+        The full URL for a search of terms (user text, escaped into q) with further params, whose values are encoded
+        as they are. terms is a string or a list of words; empty words are left out.
+        """
+        url = base + self.path + '?' + self.query_string
+        if terms is not None:
+            if not isinstance(terms, str):
+                terms = ' '.join(term for term in terms if term)
+            url += '&q=' + encode_terms(terms)
+        for k, v in params.items():
+            # Keyword names are plain Solr parameter names, so only values need encoding.
+            url += '&' + k + '=' + encode(v)
+        return url
+
+
+class SolrClient(object):
+    """
+    Runs SolrQuery searches against the Solr at base_url. decode parses response bodies; it defaults to solr.py's
+    SOLR_JSON parser.
+    """
+
+    def __init__(self, base_url=solr.SOLR_URL, decode=None):
+        self.base_url = base_url
+        self.decode = decode
+
+    def url(self, query, terms=None, **params):
+        return query.url(self.base_url, terms, **params)
+
+    def select(self, query, terms=None, deadline=None, **params):
+        """
+        Returns the decoded response for query. Raises solr.SolrError like solr.get().
+        """
+        return solr.get(query.url(self.base_url, terms, **params), deadline=deadline, decode=self.decode)
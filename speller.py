@@ -0,0 +1,283 @@
+import os
+import logging
+import threading
+
+from local_index import name_key
+
+# Name spelling correction.
+#
+# Corrects spelled or misrecognized names against a vocabulary of known names before they're searched. Vocabulary
+# comes from the LAST_NAME custom slot values and, when the local directory index is loaded (see local_index.py), every
+# first and last name in the snapshot, weighted by how many people have it.
+#
+# Lookups use a SymSpell style index of deletes: each known name is stored under every string reachable from it by up
+# to SPELL_MAX_DISTANCE deletions (of its first SPELL_PREFIX_LENGTH characters). A query generates its own deletes,
+# and names sharing one are candidates, checked with a true edit distance (adjacent transpositions count as one
+# edit). The closest candidate wins, then the most common. Names that are a prefix of a known name ("Kazil") are
+# completed from a trie that keeps the most common completion at each node.
+#
+# With only the slot values, the vocabulary is a small share of the directory, so a name it doesn't know may still be
+# right. In that case isearch.py only uses a correction after the name itself found nothing.
+
+SPELL_SLOT_PATH = os.environ.get(
+    'ISEARCH_SPELL_SLOT_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SpeechAssets', 'customSlotTypes', 'LAST_NAME')
+)
+SPELL_MAX_DISTANCE = int(os.environ.get('ISEARCH_SPELL_MAX_DISTANCE', 2))
+SPELL_PREFIX_LENGTH = int(os.environ.get('ISEARCH_SPELL_PREFIX_LENGTH', 7))
+# Shortest input completed from the trie, and longest input allowed more than one edit.
+SPELL_MIN_PREFIX = int(os.environ.get('ISEARCH_SPELL_MIN_PREFIX', 4))
+SPELL_SHORT_NAME = int(os.environ.get('ISEARCH_SPELL_SHORT_NAME', 4))
+
+log = logging.getLogger(__name__)
+
+
+def edit_distance(a, b, limit):
+    """
+    Optimal string alignment distance between a and b, or limit + 1 if it's more than limit. Bit-parallel (Hyyrö's
+    extension of Myers' algorithm to transpositions): one pass over b, each step a handful of integer operations on a
+    bit vector of a's positions.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    # Candidates usually share a prefix with the query (that's how they were found), so drop the common ends first.
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a = a[start:len(a) - end]
+    b = b[start:len(b) - end]
+    if len(a) > len(b):
+        a, b = b, a
+    if not a:
+        return len(b) if len(b) <= limit else limit + 1
+    # Bit i of peq[ch] is set where a[i] == ch.
+    peq = {}
+    bit = 1
+    for ch in a:
+        peq[ch] = peq.get(ch, 0) | bit
+        bit <<= 1
+    mask = bit - 1
+    last = bit >> 1
+    vp = mask
+    vn = 0
+    d0 = 0
+    pm_prev = 0
+    score = len(a)
+    remaining = len(b)
+    for ch in b:
+        remaining -= 1
+        pm = peq.get(ch, 0)
+        tr = ((~d0 & pm) << 1) & pm_prev
+        d0 = ((((pm & vp) + vp) ^ vp) | pm | vn | tr) & mask
+        hp = vn | ~(d0 | vp) & mask
+        hn = d0 & vp
+        if hp & last:
+            score += 1
+        elif hn & last:
+            score -= 1
+        hp = (hp << 1) | 1
+        hn <<= 1
+        vp = (hn | ~(d0 | hp)) & mask
+        vn = d0 & hp
+        pm_prev = pm
+        # Each remaining character of b can lower the score by at most one.
+        if score - remaining > limit:
+            return limit + 1
+    return score if score <= limit else limit + 1
+
+
+def letter_mask(key):
+    """
+    Bit set of the letters in key. Each edit changes at most two bits, which makes for a cheap lower bound.
+    """
+    mask = 0
+    for ch in key:
+        mask |= 1 << (ord(ch) & 63)
+    return mask
+
+
+def deletes(key, max_distance):
+    """
+    Every string reachable from key by up to max_distance single character deletions, key included.
+    """
+    out = {key}
+    edge = {key}
+    for _ in range(max_distance):
+        edge = set(word[:i] + word[i + 1:] for word in edge if len(word) > 1 for i in range(len(word)))
+        out |= edge
+    return out
+
+
+class SpellingCorrector(object):
+    """
+    Corrects words against a weighted vocabulary.
+    """
+
+    def __init__(self, max_distance=SPELL_MAX_DISTANCE, prefix_length=SPELL_PREFIX_LENGTH,
+                 min_prefix=SPELL_MIN_PREFIX, short_name=SPELL_SHORT_NAME):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.min_prefix = min_prefix
+        self.short_name = short_name
+        self._terms = {}    # key -> [display form, count, rank]
+        self._masks = {}    # key -> letter_mask(key)
+        self._deletes = {}  # delete -> [key, ...]
+        self._trie = [{}, None]  # [children, most common key below this node]
+
+    def __len__(self):
+        return len(self._terms)
+
+    def __contains__(self, word):
+        return name_key(word) in self._terms
+
+    def add(self, word, count=1):
+        key = name_key(word)
+        if not key:
+            return
+        term = self._terms.get(key)
+        if term is not None:
+            term[1] += count
+        else:
+            term = self._terms[key] = [word, count, len(self._terms)]
+            self._masks[key] = letter_mask(key)
+            for d in deletes(key[:self.prefix_length], self.max_distance):
+                self._deletes.setdefault(d, []).append(key)
+        # Counts only go up, so each node on the path just needs comparing against this term.
+        node = self._trie
+        for ch in key:
+            node = node[0].setdefault(ch, [{}, None])
+            if node[1] is None or self._better(key, node[1]):
+                node[1] = key
+
+    def _better(self, key, other):
+        a = self._terms[key]
+        b = self._terms[other]
+        return (a[1], -a[2]) > (b[1], -b[2])
+
+    def suggestions(self, word, limit=5):
+        """
+        Returns up to limit (display form, distance, count) tuples for the known words closest to word, most common
+        first.
+        """
+        key = name_key(word)
+        if not key:
+            return []
+        if key in self._terms:
+            term = self._terms[key]
+            return [(term[0], 0, term[1])]
+        max_distance = 1 if len(key) <= self.short_name else self.max_distance
+        # Deletes of the query, fewest deletions first. Candidates only need checking against the best distance found
+        # so far, and levels with more deletions than that can be skipped.
+        best = max_distance
+        mask = letter_mask(key)
+        masks = self._masks
+        found = {}
+        seen = set()
+        level = {key[:self.prefix_length]}
+        for depth in range(max_distance + 1):
+            for d in level:
+                for candidate in self._deletes.get(d, ()):
+                    if candidate not in seen:
+                        seen.add(candidate)
+                        if abs(len(candidate) - len(key)) > best or bin(mask ^ masks[candidate]).count('1') > 2 * best:
+                            continue
+                        distance = edit_distance(key, candidate, best)
+                        if distance <= best:
+                            found[candidate] = distance
+                            best = distance
+            if depth == max_distance or depth + 1 > best:
+                break
+            level = set(word[:i] + word[i + 1:] for word in level if len(word) > 1 for i in range(len(word)))
+        ranked = sorted(
+            (distance, -self._terms[candidate][1], self._terms[candidate][2], candidate)
+            for candidate, distance in found.items() if distance <= best
+        )
+        return [(self._terms[k][0], distance, -negcount) for distance, negcount, _, k in ranked[:limit]]
+
+    def complete(self, word):
+        """
+        Returns the most common known word starting with word, or None.
+        """
+        key = name_key(word)
+        if len(key) < self.min_prefix:
+            return None
+        node = self._trie
+        for ch in key:
+            node = node[0].get(ch)
+            if node is None:
+                return None
+        return self._terms[node[1]][0]
+
+    def correct(self, word):
+        """
+        Returns the known word word most likely stands for (word itself, if it's known), or None.
+        """
+        found = self.suggestions(word, 1)
+        if found and found[0][1] < self.max_distance:
+            return found[0][0]
+        # A name cut short is more likely than one with several typos.
+        return self.complete(word) or (found[0][0] if found else None)
+
+
+class NameSpeller(object):
+    """
+    First and last name correctors. complete is True when the vocabulary covers the whole directory, so an unknown
+    name is almost certainly misspelled.
+    """
+
+    def __init__(self, first=None, last=None, complete=False):
+        self.first = first if first is not None else SpellingCorrector()
+        self.last = last if last is not None else SpellingCorrector()
+        self.complete = complete
+
+    def correct(self, firstName, lastName):
+        """
+        Returns corrected (firstName, lastName), or None if there's nothing to correct. Names with no likely
+        correction are kept as they are.
+        """
+        first = self.first.correct(firstName) if firstName and firstName not in self.first else None
+        last = self.last.correct(lastName) if lastName and lastName not in self.last else None
+        if first is None and last is None:
+            return None
+        return first or firstName, last or lastName
+
+
+def build_speller(slot_path=SPELL_SLOT_PATH, local_index=None):
+    """
+    Builds a NameSpeller from the LAST_NAME slot values in slot_path and, if given, a local directory index.
+    """
+    speller = NameSpeller(complete=local_index is not None)
+    if local_index is not None:
+        for record in local_index.records:
+            speller.first.add(record.firstName)
+            speller.last.add(record.lastName)
+    try:
+        with open(slot_path) as f:
+            for line in f:
+                if line.strip():
+                    speller.last.add(line.strip())
+    except (IOError, OSError) as e:
+        log.warning("Couldn't load slot values from {}: {}".format(slot_path, e))
+    return speller
+
+
+class LazySpeller(object):
+    """
+    Builds the speller on first use, to keep it off the cold start path.
+    """
+
+    def __init__(self, slot_path=SPELL_SLOT_PATH, local_index=None):
+        self.slot_path = slot_path
+        self.local_index = local_index
+        self._speller = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._speller is None:
+            with self._lock:
+                if self._speller is None:
+                    self._speller = build_speller(self.slot_path, self.local_index)
+        return self._speller
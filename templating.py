@@ -0,0 +1,60 @@
+import os
+
+import yaml
+
+from metrics import span
+
+# Precompiled response templates.
+#
+# Flask-Ask serves templates.yaml entries to Jinja through its YamlLoader, and render_template() looks each one up,
+# checks it's up to date and renders it on every call. Here every entry (including the fragments pulled in with
+# {% include %}) is compiled once at startup. Templates whose output never changes are rendered once too, and served
+# as plain strings from then on. Dynamic templates keep their compiled Template objects.
+
+TEMPLATE_PATH = 'templates.yaml'
+
+# Templates that take no variables. Rendered once at startup.
+STATIC_TEMPLATES = ('welcome', 'welcome_re', 'welcome_card', 'title_re', 'dept_re', 'search_re',
+                    'help_text', 'stop_bye', 'cancel_bye')
+
+
+class PrecompiledTemplates(object):
+
+    def __init__(self, app, path=TEMPLATE_PATH, static=STATIC_TEMPLATES):
+        self.app = app
+        self.path = path
+        self.static_names = static
+        self._compiled = {}
+        self._static = {}
+
+    def compile(self):
+        with open(os.path.join(self.app.root_path, self.path)) as f:
+            names = list(yaml.safe_load(f) or {})
+        with self.app.app_context():
+            env = self.app.jinja_env
+            for name in names:
+                self._compiled[name] = env.get_template(name)
+            for name in self.static_names:
+                self._static[name] = self._compiled[name].render()
+        return self
+
+    def static(self, name):
+        """
+        Returns the pre-rendered output of a static template.
+        """
+        return self._static[name]
+
+    def render(self, name, **context):
+        """
+        Renders a dynamic template from its compiled Template object.
+        """
+        with span('render'):
+            return self._compiled[name].render(**context)
+
+
+def configure_jinja(app):
+    """
+    Turns off per-lookup template reload checks (templates are compiled once anyway). Call before compiling
+    templates.
+    """
+    app.jinja_env.auto_reload = False
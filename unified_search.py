@@ -0,0 +1,74 @@
+import os
+import time
+import logging
+
+from metrics import bind
+
+# Unified search.
+#
+# Runs several searches (people, title, department) for the same phrase concurrently on a shared thread pool and
+# waits at most a time budget for them, so an ambiguous utterance is answered in one turn at roughly the latency of
+# the slowest single query rather than the sum. Searches still running when the budget runs out are left to finish in
+# the background (which warms the result cache) and reported as timed out.
+
+UNIFIED_BUDGET = float(os.environ.get('ISEARCH_UNIFIED_BUDGET', 2.5))
+UNIFIED_WORKERS = int(os.environ.get('ISEARCH_UNIFIED_WORKERS', 6))
+
+log = logging.getLogger(__name__)
+
+_executor = None
+
+
+def fan_out(tasks, budget=UNIFIED_BUDGET):
+    """
+    Runs each callable in tasks (a dict of name -> callable) concurrently. Returns (results, timed_out): results maps
+    each name that finished in time to its return value; timed_out lists the names that didn't. A task that raised is
+    logged and left out of both.
+    """
+    global _executor
+    if _executor is None:
+        # Imported here to keep it off the cold start path.
+        from concurrent.futures import ThreadPoolExecutor
+        _executor = ThreadPoolExecutor(max_workers=UNIFIED_WORKERS)
+    from concurrent.futures import wait
+
+    started = time.monotonic()
+    futures = dict((_executor.submit(bind(fn)), name) for name, fn in tasks.items())
+    done, not_done = wait(futures, timeout=budget)
+
+    results = {}
+    for future in done:
+        try:
+            results[futures[future]] = future.result()
+        except Exception as e:
+            log.warning("Unified search task {} failed: {}".format(futures[future], e))
+    timed_out = sorted(futures[f] for f in not_done)
+    if timed_out:
+        log.info("Unified search budget of {}s ran out after {:.3f}s waiting on {}".format(
+            budget, time.monotonic() - started, ', '.join(timed_out)))
+    return results, timed_out
+
+
+def record_key(record):
+    # The same person can come back from both the people and the title query.
+    return record.emailAddress or (record.displayName, record.primaryTitle)
+
+
+def merge_records(*record_lists, **kwargs):
+    """
+    Merges ranked record lists, keeping the first occurrence of each person. Earlier lists rank first. Pass limit to
+    cap the result.
+    """
+    limit = kwargs.get('limit')
+    seen = set()
+    merged = []
+    for records in record_lists:
+        for record in records:
+            key = record_key(record)
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(record)
+            if limit is not None and len(merged) >= limit:
+                return merged
+    return merged